@@ -10,6 +10,9 @@ from zoneinfo import ZoneInfo
 class IncidentAIAgent:
     """AI агент для анализа и обработки инцидентов"""
     
+    # Колонки таблицы, которые использует analyze_incidents_data (ID ... полное сообщение)
+    ANALYTICS_COLUMNS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+    
     def __init__(self):
         self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
         
@@ -178,7 +181,7 @@ class IncidentAIAgent:
         # По умолчанию для неопределенных проблем
         return "Стандартизация и сервис"
     
-    def create_incident_from_data(self, incident_data: Dict, original_message: str) -> Optional[Incident]:
+    async def create_incident_from_data(self, incident_data: Dict, original_message: str) -> Optional[Incident]:
         """Создает инцидент из данных AI"""
         try:
             # Дополнительная проверка отдела
@@ -191,7 +194,7 @@ class IncidentAIAgent:
                 full_description += f"\n\n— {incident_data['explanation']}"
             
             incident = Incident(
-                id=Incident.create_id(),
+                id=await Incident.create_id(),
                 date=Incident.get_current_date(),
                 time=Incident.get_current_time(),
                 branch=incident_data['branch'],
@@ -0,0 +1,143 @@
+"""
+Benchmark: incident pipeline against the local fake Sheets API
+
+Publishes incidents concurrently, applies status updates through the write
+buffer and runs the report reads, all through the real client stack (thread
+pool, quota scheduler, row index, mirror). Needs the Redis from settings,
+Google is not contacted.
+
+Run from the project root:
+    python -m benchmarks.bench_incident_pipeline --incidents 200 --latency-ms 120 --server-quota 300
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+from config.settings import settings
+from benchmarks.fake_sheets_server import create_server
+
+
+def percentile(samples, share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def report(label: str, samples, elapsed: float):
+    print(f"{label}: {len(samples)} calls in {elapsed:.2f} s ({len(samples) / elapsed:.1f}/s)")
+    print(f"  p50 {statistics.median(samples) * 1000:8.1f} ms   "
+          f"p95 {percentile(samples, 0.95) * 1000:8.1f} ms   "
+          f"max {max(samples) * 1000:8.1f} ms")
+
+
+def make_incident(index: int):
+    from models.incident import Incident
+
+    return Incident(
+        id=f"#{datetime.now():%Y%m%d}-{9000 + index:03d}",
+        date=Incident.get_current_date(),
+        time=Incident.get_current_time(),
+        branch="Бенчмарк",
+        department="IT",
+        short_description=f"Тестовый инцидент {index}",
+        priority="Средний",
+        full_message=f"Бенчмарк: касса не работает ({index})",
+        status="OPEN"
+    )
+
+
+async def run_pipeline(incidents: int, concurrency: int):
+    from services.async_sheets import AsyncSheetsService
+    from services.sheets_scheduler import get_sheets_scheduler
+
+    sheets = AsyncSheetsService()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with limit:
+            started = time.perf_counter()
+            result = await call()
+            return time.perf_counter() - started, result
+
+    batch = [make_incident(i) for i in range(incidents)]
+
+    started = time.perf_counter()
+    published = await asyncio.gather(*(
+        timed(lambda incident=incident: sheets.publish_incident_row(incident, f"photos/{incident.id[1:]}.jpg"))
+        for incident in batch
+    ))
+    report("Publish", [duration for duration, _ in published], time.perf_counter() - started)
+    failed = [result for _, result in published if not result[0]]
+    if failed:
+        print(f"  failed: {len(failed)} (first: {failed[0][1]})")
+
+    started = time.perf_counter()
+    updated = await asyncio.gather(*(
+        timed(lambda incident=incident: sheets.run(
+            sheets.sheets.queue_incident_update, incident.id, {'J': 'IN_PROGRESS'}
+        ))
+        for incident in batch
+    ))
+    await sheets.flush_pending_writes()
+    report("Status update (queued + flush)", [duration for duration, _ in updated], time.perf_counter() - started)
+
+    from ai.agent import IncidentAIAgent
+
+    reads = []
+    started = time.perf_counter()
+    for _ in range(5):
+        duration, rows = await timed(lambda: sheets.get_all_incidents(columns=IncidentAIAgent.ANALYTICS_COLUMNS))
+        reads.append(duration)
+    report(f"Report read ({len(rows or [])} rows)", reads, time.perf_counter() - started)
+
+    print("Client quota:", get_sheets_scheduler().stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--incidents', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20, help="Incidents in flight at once")
+    parser.add_argument('--latency-ms', type=float, default=100.0)
+    parser.add_argument('--jitter-ms', type=float, default=50.0)
+    parser.add_argument('--server-quota', type=int, default=0, help="Fake server requests per minute (0 = off)")
+    parser.add_argument('--client-quota', type=int, default=6000, help="SHEETS_QUOTA_PER_MINUTE for the client")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--data', default=None, help="Persist the fake spreadsheet to this JSON file")
+    args = parser.parse_args()
+
+    server = create_server(
+        data_path=args.data,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        quota_per_minute=args.server_quota, error_rate=args.error_rate
+    )
+    server.serve_in_thread()
+
+    # Settings are read lazily by the services, so they must be set before first use
+    workdir = tempfile.mkdtemp(prefix="roma_bench_")
+    settings.SHEETS_API_ENDPOINT = server.url
+    settings.GOOGLE_SHEETS_ID = f"bench-{os.getpid()}"
+    settings.SHEET_MIRROR_PATH = os.path.join(workdir, "mirror.sqlite3")
+    settings.SHEETS_QUOTA_PER_MINUTE = args.client_quota
+    settings.SHEETS_QUOTA_BURST = max(settings.SHEETS_QUOTA_BURST, args.concurrency)
+
+    print(f"Fake Sheets API on {server.url}, {args.incidents} incidents, concurrency {args.concurrency}")
+    try:
+        asyncio.run(run_pipeline(args.incidents, args.concurrency))
+    finally:
+        from bot.constants import RedisKeys
+        from services.redis_client import get_redis
+
+        redis = get_redis()
+        keys = list(redis.scan_iter(
+            RedisKeys.SHEET_ROWS.format(spreadsheet_id=settings.GOOGLE_SHEETS_ID, sheet_name="*")))
+        if keys:
+            redis.delete(*keys)
+        server.shutdown()
+        print("Server:", server.stats)
+
+
+if __name__ == '__main__':
+    main()
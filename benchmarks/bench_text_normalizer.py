@@ -0,0 +1,68 @@
+"""
+Benchmark: single-pass glossary normalizer vs. the legacy per-rule replacement loop
+
+Run from the project root:
+    python -m benchmarks.bench_text_normalizer
+"""
+import re
+import timeit
+
+from config.settings import settings
+from utils.text_normalizer import TextNormalizer
+
+# Typical 1-2 minute voice report: a few glossary hits in ordinary speech
+VOICE_NOTE = (
+    "Салом, это кухня новза. Сегодня с утра касса ишламаяпти, кассир не может пробить заказы, "
+    "клиенты ждут у стойки уже двадцать минут. Ещё тесто почти тугади, на вечер не хватит, "
+    "поставщик не отвечает на звонки. Холодильник в заготовочной тоже шумит и плохо морозит, "
+    "температура поднялась до восьми градусов, продукты могут испортиться. Мастер керак срочно, "
+    "пожалуйста передайте в IT и в закуп, мы пока работаем только на наличных."
+)
+
+# Worst case for the engine: almost every other word is a glossary hit
+DENSE_TEXT = (
+    "Салом, в новза сегодня касса ишламаяпти, тесто тугади и соус йук. "
+    "Максим горький тоже пишет что холодильник бузилди, мастер керак срочно. "
+) * 20
+
+
+def legacy_postprocess(text: str, replacements: dict) -> str:
+    """Previous VoiceHandler._postprocess_text implementation"""
+    text_lower = text.lower()
+    for old, new in replacements.items():
+        if old in text_lower:
+            pattern = re.compile(re.escape(old), re.IGNORECASE)
+            text = pattern.sub(new, text)
+    return text
+
+
+def large_glossary(size: int = 300) -> dict:
+    """Project glossary padded with synthetic misrecognitions"""
+    glossary = dict(settings.TEXT_GLOSSARY)
+    for i in range(size):
+        glossary[f"филиалзор{i}"] = f"Branch{i}"
+        glossary[f"ишла{i} маяпти"] = "не работает"
+    return glossary
+
+
+def run(label: str, text: str, glossary: dict, number: int):
+    normalizer = TextNormalizer(glossary)
+    assert normalizer.normalize(text)
+
+    legacy = timeit.timeit(lambda: legacy_postprocess(text, glossary), number=number)
+    single_pass = timeit.timeit(lambda: normalizer.normalize(text), number=number)
+
+    print(f"{label}: {len(text)} chars, {len(glossary)} rules, {number} runs")
+    print(f"  Legacy loop:   {legacy / number * 1e6:8.1f} us/call")
+    print(f"  Single pass:   {single_pass / number * 1e6:8.1f} us/call")
+    print(f"  Speedup:       {legacy / single_pass:8.2f}x")
+
+
+def main():
+    run("Voice note, project glossary", VOICE_NOTE, settings.TEXT_GLOSSARY, 5000)
+    run("Voice note, large glossary", VOICE_NOTE, large_glossary(), 500)
+    run("Dense text, project glossary", DENSE_TEXT, settings.TEXT_GLOSSARY, 1000)
+
+
+if __name__ == '__main__':
+    main()
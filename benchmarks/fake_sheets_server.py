@@ -0,0 +1,352 @@
+"""
+Local stand-in for the Google Sheets v4 API used by GoogleSheetsService
+
+Implements values.get, values.batchGet, values.append, values.update,
+values.batchUpdate and spreadsheets.batchUpdate (addSheet) with configurable
+latency, per-minute quota (429 responses), random failures and JSON persistence.
+
+Run from the project root and point the bot at it:
+    python -m benchmarks.fake_sheets_server --port 8085 --latency-ms 120 --quota-per-minute 60
+    SHEETS_API_ENDPOINT=http://127.0.0.1:8085 GOOGLE_SHEETS_ID=fake python main.py
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class SheetsApiError(Exception):
+    def __init__(self, code: int, status: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.message = message
+
+
+def column_index(letters: str) -> int:
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+class FakeSpreadsheet:
+    """In-memory spreadsheet: sheet title -> list of rows"""
+
+    def __init__(self, data_path: Optional[str] = None):
+        self.data_path = data_path
+        self.sheets: Dict[str, List[List[str]]] = {}
+        self._lock = threading.RLock()
+        if data_path and os.path.exists(data_path):
+            with open(data_path, encoding='utf-8') as f:
+                self.sheets = json.load(f)
+
+    def save(self):
+        if not self.data_path:
+            return
+        directory = os.path.dirname(self.data_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.data_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.sheets, f, ensure_ascii=False)
+        os.replace(tmp_path, self.data_path)
+
+    def parse_range(self, a1: str) -> Tuple[str, int, int, Optional[int], Optional[int]]:
+        """'Sheet!A2:L' -> (sheet, first_col, first_row, last_col, last_row), 0-based, None = open"""
+        title, _, cells = a1.rpartition('!')
+        if not title:
+            title, cells = cells, ''
+        title = title.strip("'").replace("''", "'")
+        if title not in self.sheets:
+            raise SheetsApiError(400, 'INVALID_ARGUMENT', f"Unable to parse range: {a1}")
+        if not cells:
+            return title, 0, 0, None, None
+
+        match = re.fullmatch(r'([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?', cells.upper())
+        if not match:
+            raise SheetsApiError(400, 'INVALID_ARGUMENT', f"Unable to parse range: {a1}")
+        start_col, start_row, end_col, end_row = match.groups()
+        first_col = column_index(start_col) if start_col else 0
+        first_row = int(start_row) - 1 if start_row else 0
+        if end_col is None and end_row is None:
+            # Single cell or whole column/row
+            last_col = first_col if start_col else None
+            last_row = first_row if start_row else None
+        else:
+            last_col = column_index(end_col) if end_col else None
+            last_row = int(end_row) - 1 if end_row else None
+        return title, first_col, first_row, last_col, last_row
+
+    def get(self, a1: str, major_dimension: str = 'ROWS') -> Dict:
+        with self._lock:
+            title, first_col, first_row, last_col, last_row = self.parse_range(a1)
+            rows = self.sheets[title]
+            end = len(rows) if last_row is None else min(len(rows), last_row + 1)
+            values = [
+                [str(v) for v in row[first_col:None if last_col is None else last_col + 1]]
+                for row in rows[first_row:end]
+            ]
+
+        # The API trims trailing empty cells and rows
+        for row in values:
+            while row and row[-1] == '':
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+
+        if major_dimension == 'COLUMNS' and values:
+            width = max(len(row) for row in values)
+            values = [[row[i] if i < len(row) else '' for row in values] for i in range(width)]
+            for column in values:
+                while column and column[-1] == '':
+                    column.pop()
+
+        result = {'range': a1, 'majorDimension': major_dimension}
+        if values:
+            result['values'] = values
+        return result
+
+    def write(self, a1: str, values: List[List], first_row: Optional[int] = None) -> Dict:
+        with self._lock:
+            title, first_col, range_row, _, _ = self.parse_range(a1)
+            rows = self.sheets[title]
+            start = range_row if first_row is None else first_row
+            for offset, row_values in enumerate(values):
+                index = start + offset
+                while len(rows) <= index:
+                    rows.append([])
+                row = rows[index]
+                needed = first_col + len(row_values)
+                if len(row) < needed:
+                    row.extend([''] * (needed - len(row)))
+                row[first_col:needed] = ['' if v is None else str(v) for v in row_values]
+            self.save()
+
+        width = max((len(v) for v in values), default=0)
+        return {
+            'updatedRange': (f"{title}!{column_letters(first_col)}{start + 1}:"
+                             f"{column_letters(first_col + max(width, 1) - 1)}{start + len(values)}"),
+            'updatedRows': len(values),
+            'updatedColumns': width,
+            'updatedCells': sum(len(v) for v in values)
+        }
+
+    def append(self, a1: str, values: List[List]) -> Dict:
+        with self._lock:
+            title = self.parse_range(a1)[0]
+            rows = self.sheets[title]
+            last = len(rows)
+            while last and not any(rows[last - 1]):
+                last -= 1
+            updates = self.write(a1, values, first_row=last)
+        return {'tableRange': f"{title}!A1:{column_letters(11)}{last}", 'updates': updates}
+
+    def add_sheet(self, title: str) -> Dict:
+        with self._lock:
+            if title in self.sheets:
+                raise SheetsApiError(
+                    400, 'INVALID_ARGUMENT',
+                    f'Invalid requests[0].addSheet: A sheet with the name "{title}" already exists. '
+                    f'Please enter another name.'
+                )
+            self.sheets[title] = []
+            self.save()
+        return {'addSheet': {'properties': {'title': title, 'sheetId': abs(hash(title)) % 10 ** 9}}}
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+    """HTTP server emulating latency and quota of the Sheets API"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], spreadsheet: FakeSpreadsheet,
+                 latency_ms: float = 0, jitter_ms: float = 0,
+                 quota_per_minute: int = 0, error_rate: float = 0.0):
+        super().__init__(address, FakeSheetsHandler)
+        self.spreadsheet = spreadsheet
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.quota_per_minute = quota_per_minute
+        self.error_rate = error_rate
+        self._requests = deque()
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'failed': 0, 'by_method': {}}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self, method: str):
+        """Counts the request against the quota and injects failures"""
+        now = time.monotonic()
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            self.stats['by_method'][method] = self.stats['by_method'].get(method, 0) + 1
+
+            if self.quota_per_minute:
+                while self._requests and now - self._requests[0] > 60:
+                    self._requests.popleft()
+                if len(self._requests) >= self.quota_per_minute:
+                    self.stats['throttled'] += 1
+                    raise SheetsApiError(
+                        429, 'RESOURCE_EXHAUSTED',
+                        "Quota exceeded for quota metric 'Requests' and limit 'Requests per minute per user'"
+                    )
+                self._requests.append(now)
+
+            if self.error_rate and random.random() < self.error_rate:
+                self.stats['failed'] += 1
+                raise SheetsApiError(503, 'UNAVAILABLE', "The service is currently unavailable.")
+
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+    def serve_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="fake-sheets", daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: FakeSheetsServer
+
+    PATH = re.compile(r'^/v4/spreadsheets/(?P<id>[^/:]+)(?P<rest>.*)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _dispatch(self, http_method: str):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        match = self.PATH.match(parsed.path)
+        try:
+            body = self._body()
+            if not match:
+                raise SheetsApiError(404, 'NOT_FOUND', f"Unknown path {parsed.path}")
+            rest = match.group('rest')
+            sheet = self.server.spreadsheet
+            major = query.get('majorDimension', ['ROWS'])[0]
+
+            if http_method == 'GET' and rest == '/values:batchGet':
+                self.server.admit('values.batchGet')
+                ranges = query.get('ranges', [])
+                result = {'valueRanges': [sheet.get(r, major) for r in ranges]}
+            elif http_method == 'GET' and rest.startswith('/values/'):
+                self.server.admit('values.get')
+                result = sheet.get(unquote(rest[len('/values/'):]), major)
+            elif http_method == 'POST' and rest.startswith('/values/') and rest.endswith(':append'):
+                self.server.admit('values.append')
+                result = sheet.append(unquote(rest[len('/values/'):-len(':append')]), body.get('values', []))
+            elif http_method == 'PUT' and rest.startswith('/values/'):
+                self.server.admit('values.update')
+                result = sheet.write(unquote(rest[len('/values/'):]), body.get('values', []))
+            elif http_method == 'POST' and rest == '/values:batchUpdate':
+                self.server.admit('values.batchUpdate')
+                responses = [sheet.write(d['range'], d.get('values', [])) for d in body.get('data', [])]
+                result = {
+                    'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+                    'responses': responses
+                }
+            elif http_method == 'POST' and rest == ':batchUpdate':
+                self.server.admit('batchUpdate')
+                replies = []
+                for request in body.get('requests', []):
+                    if 'addSheet' not in request:
+                        raise SheetsApiError(400, 'INVALID_ARGUMENT', f"Unsupported request {list(request)}")
+                    replies.append(sheet.add_sheet(request['addSheet']['properties']['title']))
+                result = {'replies': replies}
+            elif http_method == 'GET' and rest == '':
+                self.server.admit('get')
+                result = {'sheets': [{'properties': {'title': title}} for title in sheet.sheets]}
+            else:
+                raise SheetsApiError(404, 'NOT_FOUND', f"Unsupported {http_method} {parsed.path}")
+
+            if match:
+                result.setdefault('spreadsheetId', match.group('id'))
+            self._send(200, result)
+
+        except SheetsApiError as error:
+            self._send(error.code, {'error': {
+                'code': error.code, 'message': error.message, 'status': error.status
+            }})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+
+def create_server(host: str = '127.0.0.1', port: int = 0, data_path: Optional[str] = None,
+                  sheets: Optional[List[str]] = None, **options) -> FakeSheetsServer:
+    """Creates a server; listed sheets are created with the incidents header if missing"""
+    from config.settings import settings
+
+    spreadsheet = FakeSpreadsheet(data_path)
+    for title in sheets or [settings.SHEET_NAME]:
+        spreadsheet.sheets.setdefault(title, [list(settings.SHEET_HEADERS)])
+    return FakeSheetsServer((host, port), spreadsheet, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--data', default=None, help="JSON file to persist sheets between runs")
+    parser.add_argument('--latency-ms', type=float, default=100.0, help="Base latency per request")
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help="Random extra latency per request")
+    parser.add_argument('--quota-per-minute', type=int, default=60, help="Requests per minute before 429 (0 = off)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failing with 503")
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, args.data,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        quota_per_minute=args.quota_per_minute, error_rate=args.error_rate
+    )
+    print(f"Fake Sheets API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,7 +13,7 @@ from telegram.constants import ChatAction
 from ai.agent import IncidentAIAgent
 from services.google_sheets import GoogleSheetsService
 from services.telegram import TelegramService
-from services.redis_memory import RedisMemory
+from services.redis_memory import get_redis_memory
 from services.incident_manager import IncidentManager
 from config.settings import settings
 
@@ -25,7 +25,7 @@ class BaseMessageHandler(ABC):
         self.ai_agent = IncidentAIAgent()
         self.sheets_service = GoogleSheetsService()
         self.telegram_service = TelegramService()
-        self.memory_service = RedisMemory()
+        self.memory_service = get_redis_memory()
         self.incident_manager = IncidentManager()
     
     async def show_typing(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
@@ -67,13 +67,13 @@ class BaseMessageHandler(ABC):
         Returns: (is_incident, response_text, incident_data)
         """
         # Save user message
-        self.memory_service.add_message(user_id, "user", message_text)
+        await self.memory_service.add_message(user_id, "user", message_text)
         
         # Get context and history
         if conversation_history is None:
-            conversation_history = self.memory_service.get_context(user_id)
+            conversation_history = await self.memory_service.get_context(user_id)
         if user_summary is None:
-            user_summary = self.memory_service.get_user_summary(user_id)
+            user_summary = await self.memory_service.get_user_summary(user_id)
         
         # Process through AI
         ai_response = self.ai_agent.process_message(
@@ -99,7 +99,7 @@ class BaseMessageHandler(ABC):
             
             full_message_with_author = f"{full_message}\n\nАвтор: {author_info}"
             
-            incident = self.ai_agent.create_incident_from_data(
+            incident = await self.ai_agent.create_incident_from_data(
                 incident_data, 
                 full_message_with_author
             )
@@ -116,7 +116,7 @@ class BaseMessageHandler(ABC):
                 # Save incident data
                 incident_dict = incident.dict()
                 incident_dict['user_id'] = str(user_id)
-                self.incident_manager.save_incident(incident_dict)
+                await self.incident_manager.save_incident(incident_dict, new_incident=True)
                 
                 return True, response_text, {
                     'incident': incident,
@@ -148,7 +148,7 @@ class BaseMessageHandler(ABC):
         await update.message.reply_text(base_response)
         
         # Save to memory
-        self.memory_service.add_message(user_id, "assistant", base_response, {
+        await self.memory_service.add_message(user_id, "assistant", base_response, {
             "type": "incident_created",
             "incident_id": incident.id,
             "status": "waiting_for_photo"
@@ -166,7 +166,7 @@ class BaseMessageHandler(ABC):
     ) -> None:
         """Handles clarification response"""
         await update.message.reply_text(response_text)
-        self.memory_service.add_message(user_id, "assistant", response_text, {"type": "clarification"})
+        await self.memory_service.add_message(user_id, "assistant", response_text, {"type": "clarification"})
     
     async def handle_non_incident_response(
         self, 
@@ -177,7 +177,7 @@ class BaseMessageHandler(ABC):
     ) -> None:
         """Handles non-incident response"""
         await update.message.reply_text(response_text)
-        self.memory_service.add_message(user_id, "assistant", response_text)
+        await self.memory_service.add_message(user_id, "assistant", response_text)
     
     @abstractmethod
     async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
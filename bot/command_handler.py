@@ -2,6 +2,7 @@
 Command handler
 Handles all bot commands following DRY principles
 """
+import re
 from typing import Dict, Optional, Any
 from datetime import datetime
 from telegram import Update
@@ -9,10 +10,12 @@ from telegram.ext import ContextTypes
 
 from bot.base_handler import BaseMessageHandler
 from services.google_sheets import GoogleSheetsService
-from services.redis_memory import RedisMemory
+from services.async_sheets import AsyncSheetsService
+from services.redis_memory import get_redis_memory
 from services.incident_manager import IncidentManager
 from config.settings import settings
 from bot.constants import Messages, Errors, Commands
+from utils.text_normalizer import text_normalizer
 
 
 class CommandHandler(BaseMessageHandler):
@@ -21,7 +24,8 @@ class CommandHandler(BaseMessageHandler):
     def __init__(self):
         super().__init__()
         self.sheets_service = GoogleSheetsService()
-        self.memory_service = RedisMemory()
+        self.sheets_async = AsyncSheetsService(self.sheets_service)
+        self.memory_service = get_redis_memory()
         self.incident_manager = IncidentManager()
     
     async def handle_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -31,14 +35,14 @@ class CommandHandler(BaseMessageHandler):
         username = update.effective_user.username or "Пользователь"
         
         # Save user info
-        self.memory_service.update_user_info(user_id, {
+        await self.memory_service.update_user_info(user_id, {
             "username": username,
             "first_name": update.effective_user.first_name,
             "chat_id": update.effective_chat.id
         })
         
         # Get user summary
-        user_summary = self.memory_service.get_user_summary(user_id)
+        user_summary = await self.memory_service.get_user_summary(user_id)
         
         if user_summary['incidents_count'] > 0:
             welcome = Messages.WELCOME_RETURNING_USER.format(
@@ -57,8 +61,27 @@ class CommandHandler(BaseMessageHandler):
         await update.message.reply_text(welcome)
         
         # Save to memory
-        self.memory_service.add_message(user_id, "user", "/start")
-        self.memory_service.add_message(user_id, "assistant", welcome)
+        await self.memory_service.add_exchange(user_id, "/start", welcome)
+    
+    @staticmethod
+    def _rep_filters(query: str) -> Dict[str, str]:
+        """
+        Branch/department filters for /rep, read from the mirror's indexes
+        
+        A dimension is filtered only when the query names exactly one of its
+        values (glossary spellings such as "новза" count); comparisons between
+        several branches or departments still get all rows.
+        """
+        text = text_normalizer.normalize(query).lower()
+        filters = {}
+        for dimension, values in (('branch', settings.BRANCHES), ('department', settings.DEPARTMENTS)):
+            mentioned = [
+                value for value in values
+                if re.search(rf"(?<!\w){re.escape(value.lower())}(?!\w)", text)
+            ]
+            if len(mentioned) == 1:
+                filters[dimension] = mentioned[0]
+        return filters
     
     async def handle_rep(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handles /rep command with global statistics"""
@@ -76,15 +99,17 @@ class CommandHandler(BaseMessageHandler):
         msg = await update.message.reply_text("🔍 Анализирую данные...")
         
         try:
-            # Get data
-            incidents = self.sheets_service.get_all_incidents()
+            # Get data (only the branch/department the question is about)
+            incidents = await self.sheets_async.get_all_incidents(
+                columns=self.ai_agent.ANALYTICS_COLUMNS, **self._rep_filters(query)
+            )
             
             if not incidents:
                 await msg.edit_text("📊 Нет данных для анализа.")
                 return
             
             # Get global statistics
-            global_stats = self.memory_service.get_global_stats()
+            global_stats = await self.memory_service.get_global_stats()
             
             # Analyze through AI
             analysis = self.ai_agent.analyze_incidents_data(incidents, query, global_stats)
@@ -98,9 +123,8 @@ class CommandHandler(BaseMessageHandler):
                 await msg.edit_text(analysis)
             
             # Save to memory
-            self.memory_service.add_message(update.effective_user.id, "user", f"/rep {query}")
-            self.memory_service.add_message(update.effective_user.id, "assistant", analysis[:500] + "...")
-                
+            await self.memory_service.add_exchange(update.effective_user.id, f"/rep {query}", analysis[:500] + "...")
+        
         except Exception as e:
             print(f"Analysis error: {e}")
             await msg.edit_text("❌ Ошибка при анализе. Попробуйте позже.")
@@ -112,7 +136,7 @@ class CommandHandler(BaseMessageHandler):
         
         await self.show_typing(context, update.effective_chat.id)
         user_id = update.effective_user.id
-        user_summary = self.memory_service.get_user_summary(user_id)
+        user_summary = await self.memory_service.get_user_summary(user_id)
         
         if user_summary['incidents_count'] == 0:
             await update.message.reply_text("📊 У вас пока нет зарегистрированных инцидентов.")
@@ -142,7 +166,7 @@ class CommandHandler(BaseMessageHandler):
                 stats_message += f"• {dept}: {count} инцидентов\n"
         
         # Get recent incidents from history
-        history = self.memory_service.get_context(user_id, 20)
+        history = await self.memory_service.get_context(user_id, 20)
         recent_incidents = []
         
         for msg in history:
@@ -162,11 +186,12 @@ class CommandHandler(BaseMessageHandler):
             return
         
         await self.show_typing(context, update.effective_chat.id)
-        global_stats = self.memory_service.get_global_stats()
+        global_stats = await self.memory_service.get_global_stats()
         
         stats_message = "🌍 **Глобальная статистика Roma Pizza Bot**\n\n"
         stats_message += f"📊 Всего инцидентов в системе: {global_stats['total_incidents']}\n"
         stats_message += f"👥 Активных пользователей (24ч): {global_stats['active_users_24h']}\n"
+        stats_message += f"👥 Уникальных пользователей (7 дней): {global_stats['active_users_7d']}\n"
         
         if global_stats['branch_stats']:
             stats_message += f"\n**Топ филиалов по инцидентам:**\n"
@@ -180,6 +205,11 @@ class CommandHandler(BaseMessageHandler):
                 percentage = (count / global_stats['total_incidents'] * 100) if global_stats['total_incidents'] > 0 else 0
                 stats_message += f"• {dept}: {count} ({percentage:.1f}%)\n"
         
+        if global_stats.get('priority_stats'):
+            stats_message += f"\n**По приоритетам:**\n"
+            for priority, count in global_stats['priority_stats'].items():
+                stats_message += f"• {priority}: {count}\n"
+        
         await update.message.reply_text(stats_message, parse_mode='Markdown')
     
     async def handle_resolve(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -196,7 +226,7 @@ class CommandHandler(BaseMessageHandler):
         username = update.effective_user.username or "Unknown"
         
         # Get incident
-        incident = self.incident_manager.get_incident(incident_id)
+        incident = await self.incident_manager.get_incident(incident_id)
         
         if not incident:
             await update.message.reply_text(Errors.INCIDENT_NOT_FOUND.format(incident_id=incident_id))
@@ -222,7 +252,7 @@ class CommandHandler(BaseMessageHandler):
         incident['resolution'] = resolution
         incident['resolved_by'] = username
         incident['status'] = 'PENDING_PHOTO'
-        self.incident_manager.save_incident(incident)
+        await self.incident_manager.save_incident(incident)
         
         # Set context for solution photo waiting
         if not hasattr(self, 'user_contexts'):
@@ -250,7 +280,7 @@ class CommandHandler(BaseMessageHandler):
         incident_id = context.args[0]
         
         # Get incident
-        incident = self.incident_manager.get_incident(incident_id)
+        incident = await self.incident_manager.get_incident(incident_id)
         
         if not incident:
             await update.message.reply_text(Errors.INCIDENT_NOT_FOUND.format(incident_id=incident_id))
@@ -304,15 +334,8 @@ class CommandHandler(BaseMessageHandler):
             await update.message.reply_text(Errors.NOT_DEPARTMENT_HEAD)
             return
         
-        # Get all active incidents
-        active_incidents_ids = self.incident_manager.redis.redis_client.smembers('roma_bot:active_incidents')
-        
-        # Filter only user's incidents
-        user_incidents = []
-        for incident_id in active_incidents_ids:
-            incident = self.incident_manager.get_incident(incident_id)
-            if incident and str(incident.get('responsible_id')) == user_id:
-                user_incidents.append(incident)
+        # Get user's active incidents from the responsible index
+        user_incidents = await self.incident_manager.find_incidents('responsible_id', user_id)
         
         if not user_incidents:
             await update.message.reply_text(
@@ -119,7 +119,29 @@ class RedisKeys:
     STATS_KEY = "roma_bot:stats:{user_id}"
     INCIDENT_KEY = "roma_bot:incident:{incident_id}"
     ACTIVE_INCIDENTS = "roma_bot:active_incidents"
+    PENDING_INCIDENT = "roma_bot:pending_incident:{user_id}"
+    PENDING_INCIDENT_MIGRATION = "roma_bot:migrations:pending_incident"
+    INCIDENT_INDEX = "roma_bot:idx:{field}:{value}"
+    INCIDENT_INDEX_MIGRATION = "roma_bot:migrations:incident_index"
     INCIDENT_COUNTER = "roma_bot:incident_counter:{date}"
+    GLOBAL_STATS = "roma_bot:global_stats"
+    GLOBAL_STATS_BY = "roma_bot:global_stats:{dimension}"
+    GLOBAL_STATS_MIGRATION_LOCK = "roma_bot:migrations:global_stats:lock"
+    ACTIVE_USERS = "roma_bot:active_users"
+    DAILY_USERS = "roma_bot:active_users:{date}"
+    SHEET_ROWS = "roma_bot:sheet_rows:{spreadsheet_id}:{sheet_name}"
+    OUTBOX_STREAM = "roma_bot:outbox"
+    OUTBOX_RETRY = "roma_bot:outbox:retry"
+    OUTBOX_DEAD = "roma_bot:outbox:dead"
+    OUTBOX_GROUP = "roma_bot_workers"
+
+# Outbox task kinds
+class OutboxTasks:
+    PUBLISH_INCIDENT = "publish_incident"
+    PUBLISH_SOLUTION = "publish_solution"
+    SEND_NOTIFICATION = "send_notification"
+    FAN_OUT_NOTIFICATION = "fan_out_notification"
+    GENERATE_PHOTO_DERIVATIVES = "generate_photo_derivatives"
 
 # Logging
 class LogMessages:
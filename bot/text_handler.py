@@ -9,6 +9,7 @@ from telegram.ext import ContextTypes
 from bot.base_handler import BaseMessageHandler
 from services.incident_processor import IncidentProcessor
 from bot.constants import Messages, DebugMessages
+from utils.text_normalizer import text_normalizer
 
 
 class TextMessageHandler(BaseMessageHandler):
@@ -21,7 +22,7 @@ class TextMessageHandler(BaseMessageHandler):
     async def handle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handles text message incidents"""
         user_id = update.effective_user.id
-        message_text = update.message.text.strip()
+        message_text = text_normalizer.normalize(update.message.text.strip())
         chat_id = update.effective_chat.id
         
         await self.show_typing(context, chat_id)
@@ -34,7 +35,7 @@ class TextMessageHandler(BaseMessageHandler):
         author_info = self.get_author_info(update)
         
         # Check for pending incidents
-        pending_incident = self.incident_manager.get_pending_incident_for_user_simple(str(user_id))
+        pending_incident = await self.incident_manager.get_pending_incident_for_user(str(user_id))
         print(DebugMessages.USER_ID_CHECK.format(user_id=user_id, pending_incident=pending_incident is not None))
         
         if pending_incident:
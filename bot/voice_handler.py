@@ -57,12 +57,12 @@ class VoiceMessageHandler(BaseMessageHandler):
             author_info = self.get_author_info(update)
             
             # Save voice message to memory
-            self.memory_service.add_message(user_id, "user", f"[Голосовое]: {text}")
+            await self.memory_service.add_message(user_id, "user", f"[Голосовое]: {text}")
             
             # Get context and history
             user_context = getattr(self, 'user_contexts', {}).get(str(user_id))
-            conversation_history = self.memory_service.get_context(user_id)
-            user_summary = self.memory_service.get_user_summary(user_id)
+            conversation_history = await self.memory_service.get_context(user_id)
+            user_summary = await self.memory_service.get_user_summary(user_id)
             
             # Process through incident processor (same as text)
             response_text, incident_data, response_type = await self.incident_processor.process_text_message(
@@ -17,20 +17,66 @@ class Settings:
     # Google Sheets настройки
     GOOGLE_SHEETS_ID = os.getenv('GOOGLE_SHEETS_ID')
     GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
+    # Адрес локального fake-сервера Sheets API (benchmarks/fake_sheets_server.py), без авторизации
+    SHEETS_API_ENDPOINT = os.getenv('SHEETS_API_ENDPOINT')
     SHEET_NAME = 'incidents'
+    SHEETS_HTTP_TIMEOUT = 30  # Таймаут HTTP-запроса к Sheets API (секунды)
+    SHEET_ROW_INDEX_TTL = 24 * 60 * 60  # Индекс строк перестраивается не реже раза в сутки
+    SHEET_ROW_INDEX_REBUILD_INTERVAL = 60  # Полная перестройка индекса строк листа не чаще (секунды)
+    SHEETS_BATCH_MAX_UPDATES = 50  # Отправить буфер записи, как только накопится столько ячеек
+    SHEETS_BATCH_FLUSH_INTERVAL = 2.0  # Максимальная задержка отложенной записи (секунды)
+    SHEETS_REJECTED_MAXLEN = 100  # Сколько отклоненных (400) обновлений хранить для разбора
+    SHEETS_THREAD_POOL_SIZE = 4  # Потоков для блокирующих вызовов Sheets API
+    SHEETS_CALL_TIMEOUT = 45  # Таймаут ожидания вызова Sheets из async-кода (секунды)
+    SHEETS_QUOTA_PER_MINUTE = 60  # Квота Sheets API на пользователя в минуту
+    SHEETS_QUOTA_BURST = 10  # Сколько запросов можно отправить подряд без ожидания
+    SHEETS_THROTTLE_RETRIES = 5  # Повторы запроса после ответа 429
+    SHEETS_BACKOFF_BASE = 1.0  # Первая пауза после 429 без Retry-After (секунды)
+    SHEETS_BACKOFF_MAX = 64  # Максимальная пауза после 429 (секунды)
+    SHEETS_ANALYTICS_MAX_THREADS = 1  # Сколько потоков пула могут занять отчеты
+    SHEET_MIRROR_PATH = os.getenv('SHEET_MIRROR_PATH', 'data/sheet_mirror.sqlite3')
+    SHEET_MIRROR_SYNC_INTERVAL = 60  # Не чаще раза в минуту проверять новые строки
+    SHEET_MIRROR_FULL_SYNC_INTERVAL = 6 * 60 * 60  # Полное перечитывание листа раз в 6 часов
+    SHEET_PARTITION_BY_MONTH = os.getenv('SHEET_PARTITION_BY_MONTH', 'true').lower() == 'true'
+    SHEET_INDEX_NAME = 'incidents_index'  # Лист-индекс: префикс ID -> лист месяца
+    SHEET_PARTITION_INDEX_REFRESH = 60  # Как часто перечитывать индекс листов (секунды)
+    SHEET_HEADERS = [
+        'ID', 'Дата', 'Время', 'Филиал', 'Отдел', 'Краткое описание', 'Приоритет',
+        'Полное сообщение', 'Отчет менеджера', 'Статус', 'Фото', 'Фото решения'
+    ]
+    
     
+    # Outbox: фоновая запись в Sheets и отправка уведомлений
+    OUTBOX_WORKERS = 2  # Параллельных обработчиков очереди в процессе
+    OUTBOX_BLOCK_MS = 5000  # Ожидание новых задач в XREADGROUP (мс)
+    OUTBOX_TASK_TIMEOUT = 120  # Таймаут выполнения одной задачи (секунды)
+    OUTBOX_MAX_ATTEMPTS = 8  # После стольких неудач задача уходит в dead-letter
+    OUTBOX_RETRY_BASE_DELAY = 5  # Задержка первого повтора, далее удваивается (секунды)
+    OUTBOX_RETRY_MAX_DELAY = 10 * 60  # Максимальная задержка повтора (секунды)
+    OUTBOX_CLAIM_IDLE_MS = 5 * 60 * 1000  # Задачи упавшего обработчика забираются после (мс)
+    OUTBOX_DEAD_LETTER_MAXLEN = 10000  # Сколько проваленных задач хранить для разбора
+    OUTBOX_STATS_INTERVAL = 10 * 60  # Период записи размеров очереди в лог (секунды)
     
     # Redis настройки
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
     REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 32))  # Размер общих пулов соединений
+    REDIS_POOL_TIMEOUT = 10  # Сколько ждать свободного соединения из пула (секунды)
+    INCIDENT_ID_BLOCK_SIZE = int(os.getenv('INCIDENT_ID_BLOCK_SIZE', 10))  # Номеров ID, резервируемых за одно обращение к Redis
     
     # Настройки памяти
     MEMORY_TTL_DAYS = 30
     MAX_MESSAGES_PER_USER = 50
     CONTEXT_MESSAGES = 10
     
+    # Учет активных пользователей
+    ACTIVITY_WINDOW_DAYS = 30  # Сколько хранить время последней активности в sorted set
+    ACTIVITY_DAILY_RETENTION_DAYS = 400  # Сколько хранить дневные HyperLogLog уникальных пользователей
+    ACTIVITY_TRIM_INTERVAL = 60 * 60  # Период очистки старых записей активности (секунды)
+    GLOBAL_STATS_MIGRATION_LOCK_TTL = 10 * 60  # Время жизни блокировки переноса глобальной статистики (секунды)
+    
     # Бизнес-логика
     BRANCHES = ['Sergeli', 'Novza', 'Buyul Ipak Yoli', 'Chilonzor', 'Bodomzor']
     DEPARTMENTS = [
@@ -45,13 +91,60 @@ class Settings:
         'Низкий': ['предложения', 'улучшение', 'мелкие неполадки']
     }
     
+    # Глоссарий нормализации текста (голосовые и текстовые отчеты)
+    TEXT_GLOSSARY = {
+        # Названия филиалов
+        'новза': 'Novza',
+        'сергели': 'Sergeli',
+        'чилонзор': 'Chilonzor',
+        'бодомзор': 'Bodomzor',
+        'буюк ипак йули': 'Buyul Ipak Yoli',
+        'максимка': 'Buyul Ipak Yoli',
+        'максим горький': 'Buyul Ipak Yoli',
+        
+        # Узбекские слова
+        'тугади': 'закончилось',
+        'бузилди': 'сломалось',
+        'ишламаяпти': 'не работает',
+        'йук': 'нет',
+        'керак': 'нужно',
+        
+        # Частые ошибки распознавания речи
+        'чиланзар': 'Chilonzor',
+        'бадамзар': 'Bodomzor',
+        'максим горки': 'Buyul Ipak Yoli',
+        'буюк ипак йўли': 'Buyul Ipak Yoli',
+    }
+    
     # Интервалы напоминаний (в минутах до дедлайна)
     REMINDER_INTERVALS = [60, 30, 10]  # За час, полчаса и 10 минут
+    DEADLINE_CHECK_CONCURRENCY = 8  # Одновременных проверок дедлайнов (меньше REDIS_MAX_CONNECTIONS)
     
     # Настройки фото
     ALLOWED_PHOTO_FORMATS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
     MAX_PHOTO_SIZE_MB = 10
     PHOTO_REQUEST_TIMEOUT = 300  # 5 минут на отправку фото
+    PHOTO_STORE_DIR = os.getenv('PHOTO_STORE_DIR', 'photos/store')  # Хранилище фото по SHA-256
+    PHOTO_DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Размер блока при потоковом скачивании фото (байты)
+    PHOTO_DERIVATIVE_FORMAT = os.getenv('PHOTO_DERIVATIVE_FORMAT', 'JPEG')  # JPEG или WEBP
+    PHOTO_DERIVATIVE_QUALITY = 82  # Качество сжатия производных фото
+    PHOTO_EVIDENCE_MAX_SIDE = 1600  # Длинная сторона копии-доказательства (пиксели)
+    PHOTO_THUMBNAIL_MAX_SIDE = 320  # Длинная сторона миниатюры (пиксели)
+    PHOTO_DERIVATIVE_WORKERS = 2  # Процессов для обработки изображений
+    PHOTO_ORIGINAL_RETENTION_DAYS = int(os.getenv('PHOTO_ORIGINAL_RETENTION_DAYS', '30'))  # 0 - хранить оригиналы всегда
+    PHOTO_RETENTION_INTERVAL = 6 * 60 * 60  # Как часто удалять старые оригиналы (секунды)
+    PHOTO_ARCHIVE_DIR = os.getenv('PHOTO_ARCHIVE_DIR', 'photos/archive')  # Архивы закрытых дней
+    PHOTO_ARCHIVE_AFTER_DAYS = int(os.getenv('PHOTO_ARCHIVE_AFTER_DAYS', '60'))  # 0 - не архивировать
+    PHOTO_ARCHIVE_INTERVAL = 24 * 60 * 60  # Как часто упаковывать закрытые дни (секунды)
+    
+    # Настройки обработки голосовых (pydub + ffmpeg)
+    VOICE_SAMPLE_RATE = 16000  # Whisper внутри работает на 16 кГц моно
+    VOICE_SILENCE_THRESH_DB = -40  # Порог тишины относительно полной шкалы
+    VOICE_MIN_SILENCE_MS = 500  # Минимальная пауза для разреза
+    VOICE_KEEP_SILENCE_MS = 200  # Сколько тишины оставлять по краям фрагмента
+    VOICE_SPLIT_THRESHOLD_S = 45  # Голосовые не длиннее этого отправляются одним файлом
+    VOICE_CHUNK_TARGET_S = 30  # Целевая длина фрагмента при нарезке (не больше VOICE_SPLIT_THRESHOLD_S)
+    VOICE_MAX_PARALLEL_CHUNKS = 4  # Одновременных запросов в Whisper
     
     # Ответственные по отделам
     DEPARTMENT_HEADS = {
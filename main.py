@@ -13,17 +13,55 @@ from bot.handlers import (
     myincidents_command,
     error_handler,
     handle_voice,
-    handle_photo
+    handle_photo,
+    handlers_manager
 )
 from services.incident_manager import IncidentManager
+from services.outbox import get_outbox
+from services.redis_memory import get_redis_memory
+from services.redis_client import close_async_redis
+from services.photo_archive import get_photo_archive
+from services.photo_derivatives import get_photo_derivatives
 from utils.logger import logger
 
 async def post_init(application):
     """Запускает фоновые задачи после инициализации"""
-    # Запускаем проверку дедлайнов
+    # Однократно переносим старую статистику и активность пользователей
+    memory = get_redis_memory()
+    await memory.ensure_global_stats()
+    await memory.ensure_activity_index()
+    
+    # Запускаем очистку старых записей активности пользователей
+    asyncio.create_task(memory.run_activity_trimmer())
+    logger.info("Запущена очистка активности пользователей")
+    
+    # Однократно ставим указатели и индексы для инцидентов, созданных до их появления
     incident_manager = IncidentManager()
+    await incident_manager.backfill_pending_pointers()
+    await incident_manager.backfill_incident_indexes()
+    
+    # Запускаем проверку дедлайнов
     asyncio.create_task(incident_manager.check_deadlines())
     logger.info("Запущена проверка дедлайнов")
+    
+    # Запускаем обработчиков outbox (запись в Sheets и уведомления)
+    outbox = get_outbox()
+    handlers_manager.photo_handler.incident_processor.register_outbox_tasks(outbox)
+    outbox.start_workers(application.bot)
+    logger.info("Запущены обработчики outbox")
+    
+    # Запускаем удаление старых оригиналов фото (копии остаются)
+    asyncio.create_task(get_photo_derivatives().run_retention())
+    logger.info("Запущена очистка оригиналов фото")
+    
+    # Запускаем упаковку фото закрытых дней в архив
+    asyncio.create_task(get_photo_archive().run_archiver())
+    logger.info("Запущена архивация фото")
+
+async def post_shutdown(application):
+    """Освобождает общие соединения при остановке бота"""
+    await close_async_redis()
+    logger.info("Соединения Redis закрыты")
 
 def main():
     """Запуск бота с системой управления инцидентами"""
@@ -41,6 +79,7 @@ def main():
     
     # Добавляем инициализацию после запуска
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
     
     # Команды
     app.add_handler(CommandHandler("start", start_command))
@@ -53,13 +92,13 @@ def main():
     
     # Все текстовые сообщения
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
+    
     # Обработчик голосовых сообщений
     app.add_handler(MessageHandler(filters.VOICE & filters.ChatType.PRIVATE, handle_voice))
-
+    
     # Обработчик фото сообщений
     app.add_handler(MessageHandler(filters.PHOTO & filters.ChatType.PRIVATE, handle_photo))
-
+    
     # Обработчик ошибок
     app.add_error_handler(error_handler)
     
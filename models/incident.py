@@ -27,26 +27,11 @@ class Incident(BaseModel):
     has_solution_image: bool = Field(default=False, description="Есть ли фото решения")
     
     @classmethod
-    def create_id(cls) -> str:
-        """Генерация более удобного ID"""
-        # Используем счетчик в Redis для последовательных номеров
-        from services.redis_memory import RedisMemory
-        redis = RedisMemory()
-        
-        # Получаем текущий день
-        today = datetime.now().strftime('%Y%m%d')
-        
-        # Ключ счетчика на день
-        counter_key = f"roma_bot:incident_counter:{today}"
-        
-        # Инкрементируем счетчик
-        count = redis.redis_client.incr(counter_key)
-        
-        # Устанавливаем TTL на 2 дня
-        redis.redis_client.expire(counter_key, 2 * 24 * 60 * 60)
-        
-        # Формат: #YYYYMMDD-NNN (например: #20250829-001)
-        return f"#{today}-{count:03d}"
+    async def create_id(cls) -> str:
+        """Генерация более удобного ID: #YYYYMMDD-NNN (например: #20250829-001)"""
+        # Номера выдаются из блока, зарезервированного в дневном счетчике Redis
+        from services.incident_ids import get_incident_id_allocator
+        return await get_incident_id_allocator().allocate()
 
     @classmethod
     def get_current_date(cls) -> str:
@@ -65,7 +50,7 @@ class Incident(BaseModel):
         """Получает ID ответственного по отделу"""
         return settings.DEPARTMENT_HEADS.get(self.department)
     
-    def to_sheet_row(self) -> list:
+    def to_sheet_row(self, photo_path: str = "", solution_photo_path: str = "") -> list:
         """Преобразование в строку для Google Sheets"""
         return [
             self.id,                           # A
@@ -78,8 +63,8 @@ class Incident(BaseModel):
             self.full_message,                 # H
             self.manager_report,               # I
             settings.INCIDENT_STATUSES[self.status],  # J - Статус
-            "",                                # K - Путь к фото инцидента (заполняется отдельно)
-            ""                                 # L - Путь к фото решения (заполняется отдельно)
+            photo_path,                        # K - Путь к фото инцидента
+            solution_photo_path                # L - Путь к фото решения
         ]
     
     def to_telegram_message(self, include_deadline: bool = False) -> str:
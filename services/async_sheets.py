@@ -0,0 +1,184 @@
+"""
+Асинхронный фасад над GoogleSheetsService
+Блокирующие вызовы googleapiclient выполняются в выделенном ограниченном пуле потоков
+"""
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config.settings import settings
+from models.incident import Incident
+from services.google_sheets import GoogleSheetsService
+from services.sheets_scheduler import Lane, sheets_lane
+
+
+class SheetsExecutor:
+    """Пул потоков для Sheets API с метриками загрузки"""
+    
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._max_queued = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self._analytics_slots: Optional[asyncio.Semaphore] = None
+    
+    def _queued(self) -> int:
+        """Задачи, ожидающие свободного потока (вызывается под self._lock)"""
+        return self._submitted - self._completed - self._failed - self._running
+    
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None,
+                  lane: Optional[int] = None, **kwargs) -> Any:
+        """
+        Выполняет блокирующую функцию в пуле
+        
+        Args:
+            func: Блокирующая функция
+            timeout: Таймаут ожидания результата (по умолчанию SHEETS_CALL_TIMEOUT)
+            lane: Полоса квоты Sheets для запросов функции (Lane.*)
+        
+        Returns:
+            Результат функции
+        
+        Raises:
+            asyncio.TimeoutError: если результат не получен за timeout
+        """
+        submitted_at = time.monotonic()
+        
+        def task():
+            started_at = time.monotonic()
+            with self._lock:
+                self._running += 1
+                self._total_wait += started_at - submitted_at
+            try:
+                if lane is None:
+                    result = func(*args, **kwargs)
+                else:
+                    with sheets_lane(lane):
+                        result = func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            else:
+                with self._lock:
+                    self._completed += 1
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_run += time.monotonic() - started_at
+        
+        with self._lock:
+            self._submitted += 1
+            # Запросы сверх свободных потоков будут ждать в очереди пула
+            backlog = max(0, self._running + self._queued() - self.max_workers)
+            self._max_queued = max(self._max_queued, backlog)
+        
+        if backlog > 0:
+            print(f"⚠️ Пул Google Sheets занят: {backlog} запросов ждут свободного потока")
+        
+        try:
+            return await asyncio.wait_for(self._submit(task, lane), timeout or settings.SHEETS_CALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Поток не прерывается, его ограничивает SHEETS_HTTP_TIMEOUT
+            with self._lock:
+                self._timed_out += 1
+            raise
+    
+    async def _submit(self, task: Callable, lane: Optional[int]) -> Any:
+        """Отправляет задачу в пул; отчеты занимают не больше SHEETS_ANALYTICS_MAX_THREADS потоков"""
+        loop = asyncio.get_running_loop()
+        if lane != Lane.ANALYTICS:
+            return await loop.run_in_executor(self._pool, task)
+        
+        if self._analytics_slots is None:
+            self._analytics_slots = asyncio.Semaphore(settings.SHEETS_ANALYTICS_MAX_THREADS)
+        # Ожидающие квоту отчеты не должны занять все потоки и задержать публикацию
+        async with self._analytics_slots:
+            return await loop.run_in_executor(self._pool, task)
+    
+    def stats(self) -> Dict:
+        """Возвращает метрики пула"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self._submitted,
+                "running": self._running,
+                "queued": self._queued(),
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 1) if finished else 0.0,
+                "avg_run_ms": round(self._total_run / finished * 1000, 1) if finished else 0.0
+            }
+
+
+_executor: Optional[SheetsExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_sheets_executor() -> SheetsExecutor:
+    """Возвращает общий для процесса пул Sheets API"""
+    global _executor
+    
+    with _executor_lock:
+        if _executor is None:
+            _executor = SheetsExecutor(settings.SHEETS_THREAD_POOL_SIZE)
+        return _executor
+
+
+class AsyncSheetsService:
+    """Асинхронный фасад над GoogleSheetsService"""
+    
+    def __init__(self, sheets: Optional[GoogleSheetsService] = None):
+        self.sheets = sheets or GoogleSheetsService()
+        self.executor = get_sheets_executor()
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет произвольный блокирующий вызов в пуле Sheets"""
+        return await self.executor.run(func, *args, **kwargs)
+    
+    async def _call(self, func: Callable, *args, fallback: Any = None, lane: Optional[int] = None) -> Any:
+        """Выполняет метод сервиса, при таймауте возвращает то же, что и при ошибке"""
+        try:
+            return await self.executor.run(func, *args, lane=lane)
+        except asyncio.TimeoutError:
+            print(f"⏱ Таймаут вызова Google Sheets: {func.__name__}")
+            return fallback
+    
+    async def publish_incident_row(self, incident: Incident, file_path: str,
+                                   check_existing: bool = False) -> Tuple[bool, str, Optional[int]]:
+        # Таймаут пробрасывается: добавление строки может еще выполняться в потоке,
+        # повтор не должен считать его неудачным
+        return await self.run(
+            self.sheets.publish_incident_row, incident, file_path, check_existing, lane=Lane.PUBLISH
+        )
+    
+    async def attach_solution_photo(self, incident_id: str, file_path: str) -> Tuple[bool, str]:
+        return await self._call(
+            self.sheets.attach_solution_photo, incident_id, file_path,
+            fallback=(False, "Таймаут Google Sheets")
+        )
+    
+    async def get_all_incidents(self, columns: Optional[List[str]] = None, date_from: Optional[str] = None,
+                                date_to: Optional[str] = None, branch: Optional[str] = None,
+                                department: Optional[str] = None) -> Optional[List[List[str]]]:
+        return await self._call(
+            self.sheets.get_all_incidents, columns, date_from, date_to, branch, department, lane=Lane.ANALYTICS
+        )
+    
+    async def update_incident_with_image(self, incident: dict) -> bool:
+        return await self._call(self.sheets.update_incident_with_image, incident, fallback=False)
+    
+    async def flush_pending_writes(self) -> bool:
+        return await self._call(self.sheets.flush_pending_writes, fallback=False)
@@ -1,13 +1,168 @@
-import os
 import io
+import re
+import atexit
 import base64
-from datetime import datetime
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import threading
+from collections import OrderedDict, deque
 from googleapiclient.errors import HttpError
-from typing import List, Optional, Tuple
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
 from config.settings import settings
 from models.incident import Incident
+from services.sheets_client import get_sheets_service
+from services.redis_client import get_redis
+from services.sheet_mirror import get_sheet_mirror
+from services.sheet_partitions import get_sheet_partitions
+from services.sheets_scheduler import Lane, sheets_lane
+from bot.constants import RedisKeys
+
+
+class SheetsWriteBuffer:
+    """
+    Буфер отложенной записи в Google Sheets
+    
+    Копит обновления ячеек и отправляет их одним values.batchUpdate
+    по достижении SHEETS_BATCH_MAX_UPDATES или раз в SHEETS_BATCH_FLUSH_INTERVAL.
+    Повторная запись в ту же ячейку заменяет ожидающее значение, отправки
+    идут строго по одной, поэтому обновления инцидента применяются в порядке вызовов.
+    """
+    
+    def __init__(self, spreadsheet_id: str):
+        self.spreadsheet_id = spreadsheet_id
+        self.max_updates = settings.SHEETS_BATCH_MAX_UPDATES
+        self.flush_interval = settings.SHEETS_BATCH_FLUSH_INTERVAL
+        self._pending: "OrderedDict[str, List[List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        # Отброшенные после ответа 400 обновления: (диапазон, значения, ошибка)
+        self.rejected: Deque[Tuple[str, List[List[str]], str]] = deque(maxlen=settings.SHEETS_REJECTED_MAXLEN)
+    
+    def queue(self, cell_range: str, values: List[List[str]]):
+        """
+        Ставит обновление диапазона в очередь
+        
+        Args:
+            cell_range: Диапазон в A1-нотации, например 'incidents!J5'
+            values: Значения для диапазона
+        """
+        with self._lock:
+            # Новое значение уходит в конец, чтобы не обогнать более ранние записи
+            self._pending.pop(cell_range, None)
+            self._pending[cell_range] = values
+            is_full = len(self._pending) >= self.max_updates
+            self._ensure_worker()
+        
+        if is_full:
+            self._wakeup.set()
+    
+    def pending_count(self) -> int:
+        """Количество ожидающих отправки диапазонов"""
+        with self._lock:
+            return len(self._pending)
+    
+    def _ensure_worker(self):
+        """Запускает фоновый поток отправки (вызывается под self._lock)"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="sheets-write-buffer", daemon=True)
+            self._worker.start()
+    
+    def _run(self):
+        """Цикл фоновой отправки по таймеру или по заполнению буфера"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+    
+    def flush(self) -> bool:
+        """
+        Отправляет все накопленные обновления одним batchUpdate
+        
+        Ответ 400 (например, диапазон на удаленном листе) не блокирует очередь:
+        пачка делится пополам, пока не найдется битый диапазон, он уходит в
+        rejected, остальные записываются. При остальных ошибках (429, 5xx,
+        сеть) неотправленное возвращается в очередь.
+        
+        Returns:
+            True если буфер пуст или отправка успешна, False в случае ошибки
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                batch = list(self._pending.items())
+                self._pending.clear()
+            
+            done = set()
+            try:
+                self._send(batch, done)
+                print(f"📤 Отправлено {len(batch)} обновлений в Google Sheets")
+                return True
+            
+            except Exception as e:
+                print(f"Ошибка пакетной записи в Google Sheets: {e}")
+                
+                # Возвращаем неотправленное в начало очереди, не затирая более новые значения
+                with self._lock:
+                    requeued = OrderedDict(
+                        (cell_range, values) for cell_range, values in batch
+                        if cell_range not in done and cell_range not in self._pending
+                    )
+                    requeued.update(self._pending)
+                    self._pending = requeued
+                return False
+    
+    def _send(self, batch: List[Tuple[str, List[List[str]]]], done: set):
+        """
+        Записывает пачку, при ответе 400 - половинами (поиск битого диапазона)
+        
+        Args:
+            batch: (диапазон, значения)
+            done: Сюда добавляются записанные и отброшенные диапазоны
+        """
+        try:
+            get_sheets_service().spreadsheets().values().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={
+                    'valueInputOption': 'USER_ENTERED',
+                    'data': [{'range': cell_range, 'values': values} for cell_range, values in batch]
+                }
+            ).execute()
+        except HttpError as error:
+            if error.resp.status != 400:
+                raise
+            if len(batch) == 1:
+                cell_range, values = batch[0]
+                print(f"❌ Обновление {cell_range} отклонено Google Sheets и отброшено: {error}")
+                self.rejected.append((cell_range, values, str(error)))
+                done.add(cell_range)
+                return
+            
+            middle = len(batch) // 2
+            self._send(batch[:middle], done)
+            self._send(batch[middle:], done)
+            return
+        
+        done.update(cell_range for cell_range, _ in batch)
+
+
+_write_buffer: Optional[SheetsWriteBuffer] = None
+_write_buffer_lock = threading.Lock()
+
+# Полосы блокировок публикации по ID инцидента (проверка строки и добавление атомарны)
+_publish_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_write_buffer() -> SheetsWriteBuffer:
+    """Возвращает общий для процесса буфер отложенной записи"""
+    global _write_buffer
+    
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = SheetsWriteBuffer(settings.GOOGLE_SHEETS_ID)
+            atexit.register(_write_buffer.flush)
+        return _write_buffer
+
 
 class GoogleSheetsService:
     """Сервис для работы с Google Sheets"""
@@ -16,224 +171,416 @@ class GoogleSheetsService:
         self.spreadsheet_id = settings.GOOGLE_SHEETS_ID
         self.sheet_name = settings.SHEET_NAME
         self.service = self._authenticate()
-        
+        self.redis = get_redis()
+        self.write_buffer = get_write_buffer()
+        self.mirror = get_sheet_mirror()
+        self.partitions = get_sheet_partitions(self.spreadsheet_id)
+    
     def _authenticate(self):
-        """Аутентификация в Google Sheets API"""
+        """Возвращает общий для процесса авторизованный клиент Google Sheets API"""
         try:
-            # Загружаем credentials из файла
-            if os.path.exists(settings.GOOGLE_CREDENTIALS_FILE):
-                credentials = service_account.Credentials.from_service_account_file(
-                    settings.GOOGLE_CREDENTIALS_FILE,
-                    scopes=['https://www.googleapis.com/auth/spreadsheets']
-                )
-            else:
-                # Альтернативный способ через переменные окружения
-                # Вам нужно будет добавить логику для загрузки credentials из env
-                raise FileNotFoundError(f"Файл {settings.GOOGLE_CREDENTIALS_FILE} не найден")
-                
-            service = build('sheets', 'v4', credentials=credentials)
-            return service
-            
+            return get_sheets_service()
+        
         except Exception as e:
             print(f"Ошибка аутентификации Google Sheets: {e}")
             raise
-            
-    def append_incident(self, incident: Incident) -> bool:
+    
+    def publish_incident_row(self, incident: Incident, file_path: str,
+                             check_existing: bool = False) -> Tuple[bool, str, Optional[int]]:
         """
-        Добавляет инцидент в таблицу
+        Добавляет строку инцидента с уже сохраненным фото одним вызовом API
+        
+        Публикации одного инцидента в процессе выполняются по очереди: повтор
+        задачи дождется предыдущей попытки, которая еще ждет квоту.
         
         Args:
             incident: Объект инцидента
-            
+            file_path: Путь к сохраненному фото
+            check_existing: Перед добавлением прочитать колонку ID листа и не
+                добавлять строку, если инцидент уже есть (повтор публикации)
+        
         Returns:
-            True если успешно, False в случае ошибки
+            Tuple[успех, сообщение, номер строки]
         """
         try:
-            # Подготавливаем данные для вставки
-            values = [incident.to_sheet_row()]
+            with _publish_locks[hash(incident.id) % len(_publish_locks)]:
+                if check_existing:
+                    sheet_name = self.partitions.sheet_for_new_incident(self.service, incident.id)
+                    row_number = self._find_row_in_sheet(sheet_name, incident.id, force_read=True)
+                    if row_number:
+                        print(f"✅ Инцидент {incident.id} уже есть в таблице (строка {row_number})")
+                        return True, f"Фото сохранено: {file_path}", row_number
+                
+                row_number = self._append_row(
+                    incident.id,
+                    incident.to_sheet_row(photo_path=f"📸 Фото: {file_path}")
+                )
+            print(f"✅ Инцидент {incident.id} опубликован в строке {row_number}")
+            return True, f"Фото сохранено: {file_path}", row_number
+        
+        except Exception as e:
+            error_msg = f"Ошибка при добавлении в Google Sheets: {e}"
+            print(f"❌ {error_msg}")
+            return False, error_msg, None
+    
+    def _append_row(self, incident_id: str, row: List[str]) -> Optional[int]:
+        """
+        Добавляет строку в конец листа и запоминает ее номер
+        
+        Returns:
+            Номер добавленной строки (None если API его не вернул)
+        """
+        # Публикация нового инцидента - самая приоритетная полоса квоты
+        with sheets_lane(Lane.PUBLISH):
+            # Новый инцидент пишется в лист месяца из его ID
+            sheet_name = self.partitions.sheet_for_new_incident(self.service, incident_id)
             
             # Определяем диапазон (A:L - все колонки включая фото решения)
-            range_name = f"{self.sheet_name}!A:L"
-            
-            # Вставляем данные
-            body = {
-                'values': values
-            }
+            range_name = f"{sheet_name}!A:L"
             
             result = self.service.spreadsheets().values().append(
                 spreadsheetId=self.spreadsheet_id,
                 range=range_name,
                 valueInputOption='USER_ENTERED',  # Позволяет Google Sheets интерпретировать данные
                 insertDataOption='INSERT_ROWS',   # Вставляет новую строку
-                body=body
+                body={'values': [row]}
             ).execute()
             
-            print(f"Инцидент добавлен: {result.get('updates', {}).get('updatedCells')} ячеек обновлено")
-            return True
+            updates = result.get('updates', {})
+            print(f"Инцидент добавлен: {updates.get('updatedCells')} ячеек обновлено")
             
-        except HttpError as error:
-            print(f"Ошибка при добавлении в Google Sheets: {error}")
-            return False
+            # Запоминаем строку инцидента, чтобы не искать ее сканированием
+            row_number = self._parse_row_number(updates.get('updatedRange', ''))
+            if row_number:
+                self._remember_row(sheet_name, incident_id, row_number)
+                self.mirror.upsert_row(sheet_name, row_number, row)
+            return row_number
+    
+    def _get_row_index_key(self, sheet_name: str) -> str:
+        """Ключ индекса ID инцидента -> номер строки для листа"""
+        return RedisKeys.SHEET_ROWS.format(spreadsheet_id=self.spreadsheet_id, sheet_name=sheet_name)
+    
+    @staticmethod
+    def _parse_row_number(updated_range: str) -> Optional[int]:
+        """Извлекает номер строки из диапазона вида 'incidents!A57:L57'"""
+        match = re.search(r'![A-Z]+(\d+)', updated_range or '')
+        return int(match.group(1)) if match else None
+    
+    def _remember_row(self, sheet_name: str, incident_id: str, row_number: int):
+        """Сохраняет номер строки инцидента в индексе"""
+        try:
+            index_key = self._get_row_index_key(sheet_name)
+            pipe = self.redis.pipeline()
+            pipe.hset(index_key, incident_id, row_number)
+            pipe.expire(index_key, settings.SHEET_ROW_INDEX_TTL)
+            pipe.execute()
         except Exception as e:
-            print(f"Неожиданная ошибка: {e}")
-            return False
-            
-    def get_all_incidents(self) -> Optional[List[List[str]]]:
+            print(f"Ошибка обновления индекса строк: {e}")
+    
+    def rebuild_row_index(self, sheet_name: str) -> Dict[str, int]:
         """
-        Получает все инциденты из таблицы
+        Перестраивает индекс строк листа по колонке ID таблицы
+        
+        Args:
+            sheet_name: Имя листа
         
         Returns:
-            Список инцидентов или None в случае ошибки
+            Словарь ID инцидента -> номер строки
+        """
+        # Для индекса нужна только колонка ID
+        ids = self.read_columns(sheet_name, ['A'])
+        rows = {row[0]: row_number for row_number, row in enumerate(ids, start=2) if row[0]}
+        
+        index_key = self._get_row_index_key(sheet_name)
+        pipe = self.redis.pipeline()
+        pipe.delete(index_key)
+        if rows:
+            pipe.hset(index_key, mapping=rows)
+            pipe.expire(index_key, settings.SHEET_ROW_INDEX_TTL)
+        pipe.execute()
+        
+        print(f"🗂 Индекс строк {sheet_name} перестроен: {len(rows)} инцидентов")
+        return rows
+    
+    def sheet_for_incident(self, incident_id: str) -> str:
+        """Лист месяца, в который маршрутизируется инцидент по дате из ID"""
+        return self.partitions.sheet_for_incident(self.service, incident_id)
+    
+    def _row_has_id(self, sheet_name: str, row_number: int, incident_id: str) -> bool:
+        """Проверяет по таблице, что в строке лежит этот инцидент (читается одна ячейка)"""
+        cells = self.read_columns(sheet_name, ['A'], first_row=row_number, last_row=row_number)
+        return bool(cells) and cells[0][0] == incident_id
+    
+    def _find_row_in_sheet(self, sheet_name: str, incident_id: str, force_read: bool = False) -> Optional[int]:
+        """
+        Ищет строку инцидента в листе
+        
+        Кандидаты - номер из индекса в Redis и из зеркала; каждый проверяется
+        чтением ячейки ID, устаревшая запись индекса удаляется. Если ни один
+        не подошел, индекс листа перестраивается целиком: сразу, если запись
+        индекса оказалась устаревшей (строки сдвинулись), иначе не чаще раза
+        в SHEET_ROW_INDEX_REBUILD_INTERVAL.
+        
+        Без force_read None означает "не найдено или таблицу сейчас не
+        читали". С force_read ответ дается только по прочитанной таблице:
+        ограничение частоты не действует, ошибки чтения пробрасываются,
+        и None означает, что инцидента в листе точно нет.
         """
+        index_key = self._get_row_index_key(sheet_name)
         try:
-            range_name = f"{self.sheet_name}!A:L"
-            
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            
-            if not values:
-                print('Данные не найдены.')
-                return []
-            
-            return values[1:]  # Пропускаем заголовок
-            
-        except HttpError as error:
-            print(f"Ошибка при чтении из Google Sheets: {error}")
+            cached = self.redis.hget(index_key, incident_id)
+        except Exception as e:
+            print(f"Ошибка чтения индекса строк: {e}")
+            cached = None
+        
+        cached_row = int(cached) if cached else None
+        candidates = [cached_row] if cached_row else []
+        mirror_row = self.mirror.get_row_number(sheet_name, incident_id)
+        if mirror_row and mirror_row != cached_row:
+            candidates.append(mirror_row)
+        
+        stale = False
+        for row_number in candidates:
+            try:
+                found = self._row_has_id(sheet_name, row_number, incident_id)
+            except Exception as e:
+                if force_read:
+                    raise
+                # Таблица недоступна - отдаем кандидата без проверки
+                print(f"Ошибка проверки строки инцидента: {e}")
+                return row_number
+            if found:
+                if row_number != cached_row:
+                    self._remember_row(sheet_name, incident_id, row_number)
+                return row_number
+            if row_number == cached_row:
+                stale = True
+                print(f"🗂 Индекс строк {sheet_name}: {incident_id} больше не в строке {row_number}")
+                try:
+                    self.redis.hdel(index_key, incident_id)
+                except Exception as e:
+                    print(f"Ошибка обновления индекса строк: {e}")
+        
+        try:
+            allowed = self.redis.set(f"{index_key}:rebuild", 1, nx=True,
+                                     ex=settings.SHEET_ROW_INDEX_REBUILD_INTERVAL)
+            if not (allowed or stale or force_read):
+                return None
+            return self.rebuild_row_index(sheet_name).get(incident_id)
+        except Exception as e:
+            if force_read:
+                raise
+            print(f"Ошибка перестроения индекса строк: {e}")
             return None
     
-    def update_incident_photo(self, incident_id: str, photo_url: str) -> bool:
+    def locate_incident(self, incident_id: str) -> Optional[Tuple[str, int]]:
         """
-        Обновляет фото URL для инцидента
+        Возвращает лист и номер строки инцидента
+        
+        Лист выбирается по дате из ID, в нем строка ищется через индекс
+        в Redis и зеркало с проверкой ячейки ID; при промахе (индекс
+        отсутствует, истек, устарел или инцидент добавлен другим процессом)
+        индекс перестраивается по колонке ID. Инциденты, записанные до
+        разбиения по месяцам, ищутся на исходном листе.
         
         Args:
             incident_id: ID инцидента
-            photo_url: URL фото в Google Drive
-            
+        
         Returns:
-            True если успешно, False в случае ошибки
+            (лист, номер строки) или None если инцидент не найден
         """
-        try:
-            # Получаем все инциденты
-            incidents = self.get_all_incidents()
-            
-            if not incidents:
-                print("Не удалось получить список инцидентов")
-                return False
-            
-            # Находим нужный по ID
-            for i, incident_row in enumerate(incidents):
-                if len(incident_row) > 0 and incident_row[0] == incident_id:
-                    row_number = i + 2  # +2 так как индексация с 1 и есть заголовок
-                    
-                    # Обновляем фото URL (колонка K)
-                    range_photo = f"{self.sheet_name}!K{row_number}"
-                    self.service.spreadsheets().values().update(
-                        spreadsheetId=self.spreadsheet_id,
-                        range=range_photo,
-                        valueInputOption='USER_ENTERED',
-                        body={'values': [[photo_url]]}
-                    ).execute()
-                    
-                    print(f"Фото обновлено для инцидента {incident_id}")
-                    return True
-            
-            print(f"Инцидент {incident_id} не найден в таблице")
-            return False
-            
-        except Exception as e:
-            print(f"Ошибка обновления фото: {e}")
-            return False
+        sheet_name = self.sheet_for_incident(incident_id)
+        row_number = self._find_row_in_sheet(sheet_name, incident_id)
+        if row_number:
+            return sheet_name, row_number
+        
+        if sheet_name != self.sheet_name:
+            row_number = self._find_row_in_sheet(self.sheet_name, incident_id)
+            if row_number:
+                return self.sheet_name, row_number
+        return None
     
-    def insert_image(self, file_data: bytes, incident_id: str, problem_description: str = "", file_extension: str = 'jpg') -> Tuple[bool, str]:
+    def find_incident_row(self, incident_id: str) -> Optional[int]:
         """
-        Сохраняет изображение локально и добавляет ссылку в Google Sheets
+        Возвращает номер строки инцидента в его листе
         
         Args:
-            file_data: Данные изображения в байтах
             incident_id: ID инцидента
-            problem_description: Описание проблемы для имени файла
-            file_extension: Расширение файла
-            
+        
         Returns:
-            Tuple[успех, сообщение]
+            Номер строки или None если инцидент не найден
         """
-        try:
-            print(f"📸 Сохраняю изображение для инцидента {incident_id}...")
-            
-            # Создаем структуру папок: photos/incidents/YYYY/MM/DD/
-            now = datetime.now()
-            year = now.strftime('%Y')
-            month = now.strftime('%m')
-            day = now.strftime('%d')
-            
-            photos_dir = os.path.join('photos', 'incidents', year, month, day)
-            os.makedirs(photos_dir, exist_ok=True)
-            print(f"📁 Создана папка: {photos_dir}")
-            
-            # Создаем имя файла
-            if problem_description:
-                clean_description = "".join(c for c in problem_description if c.isalnum() or c in ('-', '_', ' ')).strip()
-                clean_description = clean_description.replace(' ', '_')
-                if len(clean_description) > 30:
-                    clean_description = clean_description[:30]
+        location = self.locate_incident(incident_id)
+        return location[1] if location else None
+    
+    def sync_mirror(self, force: bool = False, sheets: Optional[List[str]] = None):
+        """
+        Досинхронизирует локальное зеркало с таблицей
+        
+        Args:
+            force: Не учитывать интервал SHEET_MIRROR_SYNC_INTERVAL
+            sheets: Листы для синхронизации (по умолчанию все листы)
+        """
+        for sheet_name in sheets or self.partitions.all_sheets(self.service):
+            full_resync = self.mirror.sync(
+                self.service,
+                self.spreadsheet_id,
+                sheet_name,
+                force=force,
+                before_full_sync=self.flush_pending_writes
+            )
+            
+            if full_resync:
+                # Строки могли сдвинуться - индекс строк перестроится при следующем поиске
+                try:
+                    self.redis.delete(self._get_row_index_key(sheet_name))
+                except Exception as e:
+                    print(f"Ошибка сброса индекса строк: {e}")
+    
+    def queue_cell_update(self, sheet_name: str, row_number: int, column: str, value: str):
+        """
+        Ставит обновление ячейки в буфер отложенной записи
+        
+        Args:
+            sheet_name: Имя листа
+            row_number: Номер строки
+            column: Буква колонки
+            value: Новое значение
+        """
+        self.write_buffer.queue(f"{sheet_name}!{column}{row_number}", [[value]])
+        self.mirror.update_cell(sheet_name, row_number, column, value)
+    
+    def queue_incident_update(self, incident_id: str, values: Dict[str, str]) -> Optional[int]:
+        """
+        Ставит обновления ячеек строки инцидента в буфер отложенной записи
+        
+        Args:
+            incident_id: ID инцидента
+            values: Буква колонки -> новое значение
+        
+        Returns:
+            Номер строки или None если инцидент не найден
+        """
+        location = self.locate_incident(incident_id)
+        if not location:
+            print(f"❌ Инцидент {incident_id} не найден в таблице")
+            return None
+        
+        sheet_name, row_number = location
+        for column, value in values.items():
+            self.queue_cell_update(sheet_name, row_number, column, value)
+        return row_number
+    
+    def flush_pending_writes(self) -> bool:
+        """Немедленно отправляет накопленные обновления"""
+        return self.write_buffer.flush()
+    
+    def batch_get(self, ranges: List[str], major_dimension: str = 'ROWS') -> List[List[List[str]]]:
+        """
+        Читает несколько диапазонов одним запросом values.batchGet
+        
+        Args:
+            ranges: Диапазоны в A1-нотации
+            major_dimension: 'ROWS' или 'COLUMNS' - как сгруппированы значения
+        
+        Returns:
+            Значения каждого диапазона в порядке запроса
+        """
+        if not ranges:
+            return []
+        
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=ranges,
+            majorDimension=major_dimension
+        ).execute()
+        
+        value_ranges = result.get('valueRanges', [])
+        return [value_range.get('values', []) for value_range in value_ranges]
+    
+    def read_columns(self, sheet_name: str, columns: Sequence[str], first_row: int = 2,
+                     last_row: Optional[int] = None) -> List[List[str]]:
+        """
+        Читает из таблицы только нужные колонки и строки
+        
+        Соседние колонки объединяются в один диапазон, все диапазоны
+        запрашиваются одним batchGet.
+        
+        Args:
+            sheet_name: Имя листа
+            columns: Буквы колонок в нужном порядке, например ['A', 'J']
+            first_row: Первая строка (по умолчанию сразу после заголовка)
+            last_row: Последняя строка (по умолчанию до конца листа)
+        
+        Returns:
+            Строки со значениями колонок в порядке columns, i-я строка - first_row + i
+        """
+        letters = sorted({c.upper() for c in columns})
+        groups: List[List[str]] = []
+        for letter in letters:
+            if groups and ord(letter) == ord(groups[-1][-1]) + 1:
+                groups[-1].append(letter)
             else:
-                clean_description = incident_id.replace('#', '').replace('-', '_')
-            
-            # Добавляем timestamp для уникальности
-            timestamp = now.strftime('%H%M%S')
-            filename = f"{incident_id}_{clean_description}_{timestamp}.{file_extension}"
-            
-            # Полный путь к файлу
-            file_path = os.path.join(photos_dir, filename)
-            
-            # Сохраняем файл
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            
-            print(f"💾 Фото сохранено: {file_path}")
-            
-            # Находим строку с нашим инцидентом
-            incidents = self.get_all_incidents()
-            if not incidents:
-                print("❌ Не удалось получить список инцидентов")
-                return False, "Не удалось получить список инцидентов"
-            
-            target_row = None
-            for i, incident_row in enumerate(incidents):
-                if len(incident_row) > 0 and incident_row[0] == incident_id:
-                    target_row = i + 2  # +2 так как индексация с 1 и есть заголовок
-                    break
-            
-            if not target_row:
-                print(f"❌ Инцидент {incident_id} не найден в таблице")
-                return False, f"Инцидент {incident_id} не найден в таблице"
-            
-            # Определяем колонку для изображения (K)
-            image_column = 'K'
-            cell_range = f"{self.sheet_name}!{image_column}{target_row}"
-            
-            # Вставляем ссылку на файл
-            image_text = f"📸 Фото: {file_path}"
-            
-            # Обновляем ячейку с ссылкой на фото
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.spreadsheet_id,
-                range=cell_range,
-                valueInputOption='USER_ENTERED',
-                body={'values': [[image_text]]}
-            ).execute()
-            
-            print(f"✅ Ссылка на фото добавлена в ячейку {cell_range}")
-            return True, f"Фото сохранено: {file_path}"
-            
-        except Exception as e:
-            error_msg = f"Ошибка сохранения изображения: {e}"
-            print(f"❌ {error_msg}")
-            return False, error_msg
+                groups.append([letter])
+        
+        ranges = [
+            f"{sheet_name}!{group[0]}{first_row}:{group[-1]}{last_row or ''}"
+            for group in groups
+        ]
+        
+        # Значения по колонкам: пустой хвост колонки API не возвращает
+        values: Dict[str, List[str]] = {}
+        for group, group_values in zip(groups, self.batch_get(ranges, major_dimension='COLUMNS')):
+            for letter, column_values in zip(group, group_values):
+                values[letter] = column_values
+        
+        height = max((len(v) for v in values.values()), default=0)
+        return [
+            [values[c.upper()][i] if i < len(values.get(c.upper(), [])) else '' for c in columns]
+            for i in range(height)
+        ]
+    
+    def get_all_incidents(self, columns: Optional[Sequence[str]] = None,
+                          date_from: Optional[str] = None,
+                          date_to: Optional[str] = None,
+                          branch: Optional[str] = None,
+                          department: Optional[str] = None) -> Optional[List[List[str]]]:
+        """
+        Получает инциденты (со всех листов) из локального зеркала таблицы
+        
+        Колонки отбираются в запросе к SQLite: зеркало хранит строки A:L
+        целиком, поэтому синхронизация читает из таблицы все колонки новых
+        строк. Трафик к Sheets API ограничивают период (только листы месяцев
+        из него) и инкрементальная синхронизация, а не список колонок.
+        
+        Args:
+            columns: Буквы нужных колонок в порядке вывода (по умолчанию A:L)
+            date_from: Дата с (YYYY-MM-DD, включительно)
+            date_to: Дата по (YYYY-MM-DD, включительно)
+            branch: Только инциденты филиала (фильтр по индексу зеркала)
+            department: Только инциденты отдела (фильтр по индексу зеркала)
+        
+        Returns:
+            Список инцидентов или None в случае ошибки
+        """
+        filters = (columns, date_from, date_to, branch, department)
+        # Отчеты уступают квоту публикации и обновлениям статусов
+        with sheets_lane(Lane.ANALYTICS):
+            try:
+                sheets = self.partitions.sheets_for_dates(self.service, date_from, date_to)
+                self.sync_mirror(sheets=sheets)
+            except HttpError as error:
+                print(f"Ошибка при чтении из Google Sheets: {error}")
+                rows = [row for sheet_name in self.partitions.known_sheets()
+                        for row in self.mirror.get_rows(sheet_name, *filters)]
+                # Отдаем последние известные данные, если они есть
+                return rows or None
+            
+            rows = [row for sheet_name in sheets
+                    for row in self.mirror.get_rows(sheet_name, *filters)]
+            if not rows:
+                print('Данные не найдены.')
+            return rows
     
     def update_incident_with_image(self, incident: dict) -> bool:
         """
@@ -241,131 +588,50 @@ class GoogleSheetsService:
         
         Args:
             incident: Словарь с данными инцидента
-            
+        
         Returns:
             True если успешно, False в случае ошибки
         """
         try:
             print(f"🔄 Обновляю инцидент {incident['id']} с изображением...")
             
-            # Находим строку с инцидентом
-            incidents = self.get_all_incidents()
-            if not incidents:
-                print("❌ Не удалось получить список инцидентов")
-                return False
-            
-            target_row = None
-            for i, incident_row in enumerate(incidents):
-                if len(incident_row) > 0 and incident_row[0] == incident['id']:
-                    target_row = i + 2  # +2 так как индексация с 1 и есть заголовок
-                    break
-            
-            if not target_row:
-                print(f"❌ Инцидент {incident['id']} не найден в таблице")
-                return False
-            
             # Обновляем только статус (не перезаписываем пути к фото)
             incident_obj = Incident(**incident)
             
             # Обновляем только колонку J (статус)
-            status_range = f"{self.sheet_name}!J{target_row}"
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.spreadsheet_id,
-                range=status_range,
-                valueInputOption='USER_ENTERED',
-                body={'values': [[settings.INCIDENT_STATUSES[incident_obj.status]]]}
-            ).execute()
+            if not self.queue_incident_update(incident['id'], {'J': settings.INCIDENT_STATUSES[incident_obj.status]}):
+                return False
             
             print(f"✅ Инцидент {incident['id']} обновлен в Google Sheets")
             return True
-            
+        
         except Exception as e:
             print(f"❌ Ошибка обновления инцидента: {e}")
             return False
     
-    def insert_solution_image(self, file_data: bytes, incident_id: str, solution_description: str = "", file_extension: str = 'jpg') -> Tuple[bool, str]:
+    def attach_solution_photo(self, incident_id: str, file_path: str) -> Tuple[bool, str]:
         """
-        Сохраняет фото решения локально и добавляет ссылку в Google Sheets
+        Ставит ссылку на сохраненное фото решения в колонку L
         
         Args:
-            file_data: Данные изображения в байтах
             incident_id: ID инцидента
-            solution_description: Описание решения
-            file_extension: Расширение файла
-            
+            file_path: Путь к сохраненному фото решения
+        
         Returns:
             Tuple[успех, сообщение]
         """
         try:
-            print(f"📸 Сохраняю фото решения для инцидента {incident_id}...")
-            
-            # Создаем структуру папок: photos/solutions/YYYY/MM/DD/
-            now = datetime.now()
-            year = now.strftime('%Y')
-            month = now.strftime('%m')
-            day = now.strftime('%d')
-            
-            photos_dir = os.path.join('photos', 'solutions', year, month, day)
-            os.makedirs(photos_dir, exist_ok=True)
-            print(f"📁 Создана папка: {photos_dir}")
-            
-            # Создаем имя файла
-            if solution_description:
-                clean_description = "".join(c for c in solution_description if c.isalnum() or c in ('-', '_', ' ')).strip()
-                clean_description = clean_description.replace(' ', '_')
-                if len(clean_description) > 30:
-                    clean_description = clean_description[:30]
-            else:
-                clean_description = "solution"
-            
-            # Добавляем timestamp для уникальности
-            timestamp = now.strftime('%H%M%S')
-            filename = f"{incident_id}_SOLUTION_{clean_description}_{timestamp}.{file_extension}"
-            
-            # Полный путь к файлу
-            file_path = os.path.join(photos_dir, filename)
-            
-            # Сохраняем файл
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            
-            print(f"💾 Фото решения сохранено: {file_path}")
-            
-            # Находим строку с нашим инцидентом
-            incidents = self.get_all_incidents()
-            if not incidents:
-                print("❌ Не удалось получить список инцидентов")
-                return False, "Не удалось получить список инцидентов"
-            
-            target_row = None
-            for i, incident_row in enumerate(incidents):
-                if len(incident_row) > 0 and incident_row[0] == incident_id:
-                    target_row = i + 2  # +2 так как индексация с 1 и есть заголовок
-                    break
+            # Вставляем ссылку на файл решения в колонку фото решения (L)
+            solution_text = f"✅ Решение: {file_path}"
+            target_row = self.queue_incident_update(incident_id, {'L': solution_text})
             
             if not target_row:
-                print(f"❌ Инцидент {incident_id} не найден в таблице")
                 return False, f"Инцидент {incident_id} не найден в таблице"
             
-            # Определяем колонку для фото решения (L)
-            solution_column = 'L'
-            cell_range = f"{self.sheet_name}!{solution_column}{target_row}"
-            
-            # Вставляем ссылку на файл решения
-            solution_text = f"✅ Решение: {file_path}"
-            
-            # Обновляем ячейку с ссылкой на фото решения
-            self.service.spreadsheets().values().update(
-                spreadsheetId=self.spreadsheet_id,
-                range=cell_range,
-                valueInputOption='USER_ENTERED',
-                body={'values': [[solution_text]]}
-            ).execute()
-            
-            print(f"✅ Ссылка на фото решения добавлена в ячейку {cell_range}")
+            print(f"✅ Ссылка на фото решения поставлена в очередь для строки {target_row}")
             return True, f"Фото решения сохранено: {file_path}"
-            
+        
         except Exception as e:
             error_msg = f"Ошибка сохранения фото решения: {e}"
             print(f"❌ {error_msg}")
-            return False, error_msg
\ No newline at end of file
+            return False, error_msg
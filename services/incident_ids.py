@@ -0,0 +1,72 @@
+"""
+Выдача ID инцидентов блоками (hi/lo)
+Процесс резервирует в Redis диапазон номеров на день и раздает их без обращения к Redis
+"""
+import asyncio
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Optional
+from config.settings import settings
+from services.redis_client import get_async_redis
+from bot.constants import RedisKeys
+
+COUNTER_TTL = 2 * 24 * 60 * 60
+
+
+class IncidentIdAllocator:
+    """
+    Генератор ID вида #YYYYMMDD-NNN
+    
+    Дневной счетчик увеличивается сразу на INCIDENT_ID_BLOCK_SIZE одним
+    INCRBY: процесс получает номера (hi - block + 1 .. hi) и выдает их
+    локально. Разные процессы получают непересекающиеся блоки, поэтому ID
+    уникальны, но между процессами номера не строго по порядку, а остаток
+    блока при перезапуске пропадает (в нумерации бывают пропуски).
+    """
+    
+    def __init__(self, block_size: Optional[int] = None):
+        self.block_size = max(1, block_size or settings.INCIDENT_ID_BLOCK_SIZE)
+        self.redis = get_async_redis()
+        self._day: Optional[str] = None
+        self._next = 1
+        self._limit = 0
+        self._lock = asyncio.Lock()
+    
+    async def _reserve(self, day: str):
+        """Резервирует следующий блок номеров на день"""
+        counter_key = RedisKeys.INCIDENT_COUNTER.format(date=day)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(counter_key, self.block_size)
+            pipe.expire(counter_key, COUNTER_TTL)
+            high, _ = await pipe.execute()
+        
+        self._day = day
+        self._next = high - self.block_size + 1
+        self._limit = high
+    
+    async def allocate(self) -> str:
+        """Возвращает новый ID инцидента"""
+        day = datetime.now(ZoneInfo('Asia/Tashkent')).strftime('%Y%m%d')
+        async with self._lock:
+            if day != self._day or self._next > self._limit:
+                await self._reserve(day)
+            number = self._next
+            self._next += 1
+        
+        # Формат: #YYYYMMDD-NNN (например: #20250829-001)
+        return f"#{day}-{number:03d}"
+
+
+_allocator: Optional[IncidentIdAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_incident_id_allocator() -> IncidentIdAllocator:
+    """Возвращает общий для процесса генератор ID инцидентов"""
+    global _allocator
+    
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = IncidentIdAllocator()
+        return _allocator
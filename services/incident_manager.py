@@ -1,23 +1,43 @@
+import time
 import asyncio
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import json
 from config.settings import settings
 from zoneinfo import ZoneInfo
-from services.redis_memory import RedisMemory
+from services.redis_memory import get_redis_memory
 from services.google_sheets import GoogleSheetsService
+from services.async_sheets import AsyncSheetsService
 from services.telegram import TelegramService
 from telegram import Bot
+from bot.constants import RedisKeys
+
+INCIDENT_TTL = 30 * 24 * 60 * 60
+
+# Вторичные индексы активных инцидентов (sorted set по дедлайну); эти поля
+# задаются при создании и дальше не меняются. Индекс статуса ведется отдельно.
+INDEXED_FIELDS = ('responsible_id', 'department', 'branch')
+
+# Снимает указатель, только если он все еще ведет на этот инцидент:
+# поздний ответ по старому инциденту не сбросит указатель на новый
+_CLEAR_PENDING_POINTER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 class IncidentManager:
     """Менеджер для управления инцидентами"""
     
     def __init__(self):
-        self.redis = RedisMemory()
+        self.redis = get_redis_memory()
+        self.client = self.redis.async_client
         self.sheets = GoogleSheetsService()
+        self.sheets_async = AsyncSheetsService(self.sheets)
         self.telegram = TelegramService()
         self.bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-        
+    
     def _get_incident_key(self, incident_id: str) -> str:
         """Ключ для хранения инцидента в Redis"""
         return f"roma_bot:incident:{incident_id}"
@@ -26,8 +46,62 @@ class IncidentManager:
         """Ключ для хранения дедлайнов"""
         return f"roma_bot:deadlines:{deadline}"
     
-    def save_incident(self, incident: Dict) -> bool:
-        """Сохраняет инцидент в Redis"""
+    def _get_pending_key(self, user_id) -> str:
+        """Ключ указателя на незавершенный (без фото) инцидент пользователя"""
+        return RedisKeys.PENDING_INCIDENT.format(user_id=user_id)
+    
+    def _get_index_key(self, field: str, value) -> str:
+        """Ключ вторичного индекса инцидентов field=value"""
+        return RedisKeys.INCIDENT_INDEX.format(field=field, value=value)
+    
+    def _deadline_score(self, deadline) -> float:
+        """Дедлайн как score индекса (инциденты без дедлайна - в конце)"""
+        try:
+            deadline_dt = datetime.fromisoformat(str(deadline))
+        except ValueError:
+            return float('inf')
+        if deadline_dt.tzinfo is None:
+            deadline_dt = deadline_dt.replace(tzinfo=ZoneInfo('Asia/Tashkent'))
+        return deadline_dt.timestamp()
+    
+    def _queue_index(self, pipe, incident: Dict):
+        """
+        Добавляет в транзакцию обновление индексов по статусу и полям инцидента
+        
+        Инцидент переносится в индекс своего статуса; решенный инцидент
+        убирается из индексов ответственного, отдела и филиала.
+        """
+        incident_id = incident['id']
+        status = incident.get('status', 'OPEN')
+        score = self._deadline_score(incident.get('deadline'))
+        
+        for other in settings.INCIDENT_STATUSES:
+            if other != status:
+                pipe.zrem(self._get_index_key('status', other), incident_id)
+        pipe.zadd(self._get_index_key('status', status), {incident_id: score})
+        if status == 'RESOLVED':
+            # Решенные храним столько же, сколько сами инциденты
+            pipe.zremrangebyscore(self._get_index_key('status', status), '-inf', time.time() - INCIDENT_TTL)
+        
+        for field in INDEXED_FIELDS:
+            value = incident.get(field)
+            if value in (None, '', 'None'):
+                continue
+            if status == 'RESOLVED':
+                pipe.zrem(self._get_index_key(field, value), incident_id)
+            else:
+                pipe.zadd(self._get_index_key(field, value), {incident_id: score})
+    
+    async def save_incident(self, incident: Dict, new_incident: bool = False) -> bool:
+        """
+        Сохраняет инцидент в Redis
+        
+        Args:
+            incident: Данные инцидента
+            new_incident: Инцидент только что создан - в той же транзакции
+                увеличиваются глобальные счетчики статистики и ставится
+                указатель на незавершенный инцидент пользователя
+        """
         try:
             incident_key = self._get_incident_key(incident['id'])
             
@@ -41,82 +115,151 @@ class IncidentManager:
             incident['status'] = 'OPEN'
             incident['reminders_sent'] = '[]'  # Сохраняем как JSON строку
             
-            # Сохраняем в Redis
-            self.redis.redis_client.hset(
-                incident_key,
-                mapping={k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) 
-                        for k, v in incident.items()}
-            )
-            
-            # Устанавливаем TTL на 30 дней
-            self.redis.redis_client.expire(incident_key, 30 * 24 * 60 * 60)
-            
-            # Добавляем в список активных инцидентов
-            self.redis.redis_client.sadd('roma_bot:active_incidents', incident['id'])
+            async with self.client.pipeline(transaction=True) as pipe:
+                # Сохраняем в Redis
+                pipe.hset(
+                    incident_key,
+                    mapping={k: json.dumps(v) if isinstance(v, (dict, list)) else str(v) 
+                            for k, v in incident.items()}
+                )
+                
+                # Устанавливаем TTL на 30 дней
+                pipe.expire(incident_key, INCIDENT_TTL)
+                
+                # Добавляем в список активных инцидентов и в индексы
+                pipe.sadd('roma_bot:active_incidents', incident['id'])
+                self._queue_index(pipe, incident)
+                
+                if new_incident:
+                    self.redis.queue_incident_counters(pipe, incident)
+                
+                # Указатель живет, пока инцидент ждет фото (не дольше самого инцидента)
+                user_id = incident.get('user_id')
+                if user_id:
+                    pending_key = self._get_pending_key(user_id)
+                    if incident.get('has_image') in (True, 'True', 'true'):
+                        pipe.eval(_CLEAR_PENDING_POINTER, 1, pending_key, incident['id'])
+                    elif new_incident:
+                        pipe.set(pending_key, incident['id'], ex=INCIDENT_TTL)
+                await pipe.execute()
             
             return True
-            
+        
         except Exception as e:
             print(f"Ошибка сохранения инцидента: {e}")
             return False
     
     
-    def get_incident(self, incident_id: str) -> Optional[Dict]:
+    async def get_incident(self, incident_id: str) -> Optional[Dict]:
         """Получает инцидент из Redis"""
         try:
             incident_key = self._get_incident_key(incident_id)
-            data = self.redis.redis_client.hgetall(incident_key)
+            data = await self.client.hgetall(incident_key)
             
             if not data:
                 return None
             
-            # Парсим JSON поля
-            incident = {}
-            for k, v in data.items():
-                try:
-                    incident[k] = json.loads(v)
-                except:
-                    incident[k] = v
-                    
-            return incident
-            
+            return self._parse_incident(data)
+        
         except Exception as e:
             print(f"Ошибка получения инцидента: {e}")
             return None
     
-    def update_incident_status(self, incident_id: str, status: str, 
+    def _parse_incident(self, data: Dict) -> Dict:
+        """Разбирает хеш инцидента (JSON поля)"""
+        incident = {}
+        for k, v in data.items():
+            try:
+                incident[k] = json.loads(v)
+            except:
+                incident[k] = v
+        
+        return incident
+    
+    async def get_incidents(self, incident_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Получает несколько инцидентов за один round trip (pipeline HGETALL)
+        
+        Returns:
+            ID -> инцидент, только для найденных
+        """
+        if not incident_ids:
+            return {}
+        
+        async with self.client.pipeline(transaction=False) as pipe:
+            for incident_id in incident_ids:
+                pipe.hgetall(self._get_incident_key(incident_id))
+            rows = await pipe.execute()
+        
+        return {
+            incident_id: self._parse_incident(data)
+            for incident_id, data in zip(incident_ids, rows) if data
+        }
+    
+    async def find_incidents(self, field: str, value, offset: int = 0,
+                             limit: Optional[int] = None) -> List[Dict]:
+        """
+        Инциденты из вторичного индекса в порядке дедлайна
+        
+        Args:
+            field: responsible_id, department, branch (активные инциденты) или status
+            value: Значение поля
+            offset: Сколько первых инцидентов пропустить
+            limit: Максимум инцидентов (по умолчанию все)
+        
+        Returns:
+            Список инцидентов, ближайший дедлайн первым
+        """
+        index_key = self._get_index_key(field, value)
+        stop = -1 if limit is None else offset + limit - 1
+        incident_ids = await self.client.zrange(index_key, offset, stop)
+        incidents = await self.get_incidents(incident_ids)
+        
+        # Истекшие по TTL инциденты убираем из индекса
+        expired = [incident_id for incident_id in incident_ids if incident_id not in incidents]
+        if expired:
+            await self.client.zrem(index_key, *expired)
+        
+        return [incidents[incident_id] for incident_id in incident_ids if incident_id in incidents]
+    
+    async def update_incident_status(self, incident_id: str, status: str, 
                             manager_report: Optional[str] = None) -> bool:
         """Обновляет статус инцидента"""
         try:
             incident_key = self._get_incident_key(incident_id)
             
-            # Проверяем существование инцидента
-            if not self.redis.redis_client.exists(incident_key):
+            # Проверяем существование инцидента и берем поля индексов
+            fields = ('deadline',) + INDEXED_FIELDS
+            values = await self.client.hmget(incident_key, *fields)
+            if not any(values):
                 print(f"Инцидент {incident_id} не найден в Redis")
                 return False
             
-            # Обновляем статус
-            self.redis.redis_client.hset(incident_key, 'status', status)
+            async with self.client.pipeline(transaction=True) as pipe:
+                # Обновляем статус
+                pipe.hset(incident_key, 'status', status)
+                self._queue_index(pipe, dict(zip(fields, values), id=incident_id, status=status))
+                
+                if status == 'RESOLVED':
+                    pipe.hset(incident_key, 'resolved_at', datetime.now().isoformat())
+                    # ВАЖНО: Удаляем из активных инцидентов
+                    pipe.srem('roma_bot:active_incidents', incident_id)
+                
+                if manager_report:
+                    pipe.hset(incident_key, 'manager_report', manager_report)
+                await pipe.execute()
             
             if status == 'RESOLVED':
-                self.redis.redis_client.hset(incident_key, 'resolved_at', 
-                                        datetime.now().isoformat())
-                # ВАЖНО: Удаляем из активных инцидентов
-                self.redis.redis_client.srem('roma_bot:active_incidents', incident_id)
                 print(f"Инцидент {incident_id} удален из активных")
-                
             elif status == 'OVERDUE':
                 # При просрочке оставляем в активных для возможности решения
                 print(f"Инцидент {incident_id} помечен как просроченный")
-                
-            if manager_report:
-                self.redis.redis_client.hset(incident_key, 'manager_report', manager_report)
             
-            # Обновляем в Google Sheets
-            self._update_sheet_status(incident_id, status, manager_report)
+            # Обновляем в Google Sheets (поиск строки блокирующий - выполняем в пуле Sheets)
+            await self.sheets_async.run(self._update_sheet_status, incident_id, status, manager_report)
             
             return True
-            
+        
         except Exception as e:
             print(f"Ошибка обновления статуса: {e}")
             return False
@@ -125,42 +268,22 @@ class IncidentManager:
                            manager_report: Optional[str] = None):
         """Обновляет статус в Google Sheets"""
         try:
-            # Получаем все инциденты
-            incidents = self.sheets.get_all_incidents()
+            # Обновляем статус (колонка J)
+            updates = {'J': settings.INCIDENT_STATUSES[status]}
+            
+            # Обновляем отчет менеджера если есть (колонка I)
+            if manager_report:
+                updates['I'] = manager_report
             
-            # Находим нужный по ID
-            for i, incident_row in enumerate(incidents):
-                if incident_row[0] == incident_id:
-                    row_number = i + 2  # +2 так как индексация с 1 и есть заголовок
-                    
-                    # Обновляем статус (колонка J)
-                    range_status = f"{settings.SHEET_NAME}!J{row_number}"
-                    self.sheets.service.spreadsheets().values().update(
-                        spreadsheetId=self.sheets.spreadsheet_id,
-                        range=range_status,
-                        valueInputOption='USER_ENTERED',
-                        body={'values': [[settings.INCIDENT_STATUSES[status]]]}
-                    ).execute()
-                    
-                    # Обновляем отчет менеджера если есть (колонка I)
-                    if manager_report:
-                        range_report = f"{settings.SHEET_NAME}!I{row_number}"
-                        self.sheets.service.spreadsheets().values().update(
-                            spreadsheetId=self.sheets.spreadsheet_id,
-                            range=range_report,
-                            valueInputOption='USER_ENTERED',
-                            body={'values': [[manager_report]]}
-                        ).execute()
-                    
-                    break
-                    
+            self.sheets.queue_incident_update(incident_id, updates)
+        
         except Exception as e:
             print(f"Ошибка обновления в Sheets: {e}")
     
     async def send_reminder(self, incident_id: str, minutes_before: int):
         """Отправляет напоминание ответственному"""
         try:
-            incident = self.get_incident(incident_id)
+            incident = await self.get_incident(incident_id)
             
             # Проверяем что инцидент не решен
             if not incident or incident.get('status') != 'OPEN':
@@ -194,72 +317,88 @@ class IncidentManager:
                 reminders = json.loads(reminders_str)
             else:
                 reminders = reminders_str if isinstance(reminders_str, list) else []
-                
+            
             reminders.append(minutes_before)
             
-            self.redis.redis_client.hset(
+            await self.client.hset(
                 self._get_incident_key(incident_id),
                 'reminders_sent',
                 json.dumps(reminders)
             )
-            
+        
         except Exception as e:
             print(f"Ошибка отправки напоминания для {incident_id}: {e}")
-
+    
     async def check_deadlines(self):
         """Проверяет дедлайны и отправляет напоминания"""
         while True:
             try:
-                # Получаем все активные инциденты
-                active_incidents = self.redis.redis_client.smembers('roma_bot:active_incidents')
+                # Получаем все активные инциденты одним pipeline
+                active_ids = list(await self.client.smembers('roma_bot:active_incidents'))
+                incidents = await self.get_incidents(active_ids)
+                
+                # Инциденты проверяются параллельно: ожидание Redis и Telegram
+                # по одному инциденту не задерживает остальные. Одновременных
+                # проверок не больше DEADLINE_CHECK_CONCURRENCY, чтобы не занять
+                # весь пул соединений Redis
+                limit = asyncio.Semaphore(settings.DEADLINE_CHECK_CONCURRENCY)
                 
-                for incident_id in active_incidents:
-                    incident = self.get_incident(incident_id)
-                    if not incident:
-                        continue
-                    
-                    # ВАЖНО: Пропускаем решенные инциденты
-                    if incident.get('status') == 'RESOLVED':
-                        # Удаляем из активных если еще там
-                        self.redis.redis_client.srem('roma_bot:active_incidents', incident_id)
-                        continue
-                    
-                    # Проверяем дедлайн только для открытых инцидентов
-                    if incident.get('status') == 'OPEN':
-                        try:
-                            deadline = datetime.fromisoformat(incident['deadline'])
-                            # если старые записи без tz — считаем, что они в Asia/Tashkent
-                            if deadline.tzinfo is None:
-                                    deadline = deadline.replace(tzinfo=ZoneInfo('Asia/Tashkent'))
-                            # "сейчас" тоже делаем aware в той же зоне
-                            now = datetime.now(ZoneInfo('Asia/Tashkent'))
-                            time_left = deadline - now
-                            
-                            # Проверяем просрочку
-                            if time_left.total_seconds() <= 0:
-                                self.update_incident_status(incident_id, 'OVERDUE')
-                                await self._send_overdue_notification(incident)
-                                continue
-                            
-                            # Проверяем напоминания
-                            minutes_left = time_left.total_seconds() / 60
-                            reminders_sent = incident.get('reminders_sent', [])
-                            
-                            for reminder_time in settings.REMINDER_INTERVALS:
-                                if (minutes_left <= reminder_time and 
-                                    reminder_time not in reminders_sent):
-                                    await self.send_reminder(incident_id, reminder_time)
-                        except Exception as e:
-                            print(f"Ошибка проверки дедлайна для {incident_id}: {e}")
-                            continue
+                async def check(incident_id: str, incident: Dict):
+                    async with limit:
+                        await self._check_incident_deadline(incident_id, incident)
+                
+                await asyncio.gather(*(
+                    check(incident_id, incident) for incident_id, incident in incidents.items()
+                ))
                 
                 # Ждем 1 минуту перед следующей проверкой
                 await asyncio.sleep(60)
-                
+            
             except Exception as e:
                 print(f"Ошибка в проверке дедлайнов: {e}")
                 await asyncio.sleep(60)
-                    
+    
+    async def _check_incident_deadline(self, incident_id: str, incident: Dict):
+        """Проверяет дедлайн одного активного инцидента"""
+        try:
+            # ВАЖНО: Пропускаем решенные инциденты
+            if incident.get('status') == 'RESOLVED':
+                # Удаляем из активных и из индексов если еще там
+                async with self.client.pipeline(transaction=True) as pipe:
+                    pipe.srem('roma_bot:active_incidents', incident_id)
+                    self._queue_index(pipe, dict(incident, id=incident_id))
+                    await pipe.execute()
+                return
+            
+            # Проверяем дедлайн только для открытых инцидентов
+            if incident.get('status') != 'OPEN':
+                return
+            
+            deadline = datetime.fromisoformat(incident['deadline'])
+            # если старые записи без tz — считаем, что они в Asia/Tashkent
+            if deadline.tzinfo is None:
+                deadline = deadline.replace(tzinfo=ZoneInfo('Asia/Tashkent'))
+            # "сейчас" тоже делаем aware в той же зоне
+            now = datetime.now(ZoneInfo('Asia/Tashkent'))
+            time_left = deadline - now
+            
+            # Проверяем просрочку
+            if time_left.total_seconds() <= 0:
+                await self.update_incident_status(incident_id, 'OVERDUE')
+                await self._send_overdue_notification(incident)
+                return
+            
+            # Проверяем напоминания
+            minutes_left = time_left.total_seconds() / 60
+            reminders_sent = incident.get('reminders_sent', [])
+            
+            for reminder_time in settings.REMINDER_INTERVALS:
+                if (minutes_left <= reminder_time and 
+                    reminder_time not in reminders_sent):
+                    await self.send_reminder(incident_id, reminder_time)
+        except Exception as e:
+            print(f"Ошибка проверки дедлайна для {incident_id}: {e}")
+    
     async def _send_overdue_notification(self, incident: Dict):
         """Отправляет уведомление о просрочке"""
         responsible_id = incident.get('responsible_id')
@@ -278,94 +417,100 @@ class IncidentManager:
         
         await self.bot.send_message(chat_id=responsible_id, text=message)
     
-    def get_pending_incident_for_user_simple(self, user_id: str) -> Optional[Dict]:
-        """
-        Простая проверка через Redis - ищем по ключу user_id
-        """
-        try:
-            # Ищем все ключи инцидентов
-            pattern = "roma_bot:incident:*"
-            incident_keys = self.redis.redis_client.keys(pattern)
-            print(f"🔍 Простая проверка: ищем инциденты для user_id={user_id}")
-            print(f"🔍 Найдено ключей инцидентов: {len(incident_keys)}")
-            
-            for key in incident_keys:
-                # Получаем user_id из инцидента
-                incident_user_id = self.redis.redis_client.hget(key, 'user_id')
-                if incident_user_id:
-                    incident_user_id = incident_user_id.decode() if isinstance(incident_user_id, bytes) else str(incident_user_id)
-                    print(f"🔍 Проверяем ключ {key}: user_id={incident_user_id}")
-                    
-                    if incident_user_id == user_id:
-                        # Получаем статус и has_image
-                        status = self.redis.redis_client.hget(key, 'status')
-                        has_image = self.redis.redis_client.hget(key, 'has_image')
-                        
-                        if status:
-                            status = status.decode() if isinstance(status, bytes) else str(status)
-                        if has_image:
-                            has_image = has_image.decode() if isinstance(has_image, bytes) else str(has_image)
-                        
-                        print(f"🔍 Статус: {status}, has_image: {has_image}")
-                        
-                        if status == 'OPEN' and has_image in ['False', 'false', False, '0', 0]:
-                            print(f"🔍 Найден незавершенный инцидент!")
-                            # Извлекаем ID инцидента из ключа
-                            key_str = key.decode() if isinstance(key, bytes) else str(key)
-                            incident_id = key_str.split(':')[-1]
-                            return self.get_incident(incident_id)
-            
-            return None
-            
-        except Exception as e:
-            print(f"Ошибка простой проверки: {e}")
-            return None
-
-    def get_pending_incident_for_user(self, user_id: str) -> Optional[Dict]:
+    async def get_pending_incident_for_user(self, user_id: str) -> Optional[Dict]:
         """
         Получает незавершенный инцидент пользователя (без фото)
         
+        Обычный случай (незавершенного инцидента нет) - один GET указателя.
+        Указатель на уже решенный, сфотографированный или удаленный инцидент
+        снимается.
+        
         Args:
             user_id: ID пользователя
-            
+        
         Returns:
             Словарь с данными инцидента или None
         """
         try:
-            # Получаем все активные инциденты
-            active_incidents = self.redis.redis_client.smembers('roma_bot:active_incidents')
-            print(f"🔍 Отладка: ищем незавершенные инциденты для user_id={user_id}")
-            # Исправляем decode - проверяем тип
-            active_incidents_list = []
-            for incident_id in active_incidents:
-                if isinstance(incident_id, bytes):
-                    active_incidents_list.append(incident_id.decode())
-                else:
-                    active_incidents_list.append(str(incident_id))
-            print(f"🔍 Активные инциденты: {active_incidents_list}")
+            pending_key = self._get_pending_key(user_id)
+            incident_id = await self.client.get(pending_key)
+            if not incident_id:
+                return None
             
-            for incident_id in active_incidents:
-                # Приводим к строке
-                incident_id_str = incident_id.decode() if isinstance(incident_id, bytes) else str(incident_id)
-                incident = self.get_incident(incident_id_str)
-                if not incident:
-                    continue
-                
-                print(f"🔍 Проверяем инцидент {incident_id_str}: status={incident.get('status')}, has_image={incident.get('has_image', False)}, user_id={incident.get('user_id')}")
-                
-                # Проверяем что инцидент открыт и без изображения
-                # Ищем по user_id в контексте или в full_message
-                if (incident.get('status') == 'OPEN' and 
-                    not incident.get('has_image', False)):
-                    
-                    # Проверяем есть ли user_id в контексте инцидента
-                    incident_user_id = incident.get('user_id')
-                    if incident_user_id == user_id:
-                        print(f"🔍 Найден незавершенный инцидент для пользователя: {incident_id_str}")
-                        return incident
+            incident = await self.get_incident(incident_id)
+            if (incident and incident.get('status') == 'OPEN' and
+                    incident.get('has_image') in (False, 'False', 'false', 0, '0', None)):
+                return incident
             
+            await self.client.eval(_CLEAR_PENDING_POINTER, 1, pending_key, incident_id)
             return None
-            
+        
         except Exception as e:
             print(f"Ошибка поиска незавершенного инцидента: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    async def backfill_pending_pointers(self) -> int:
+        """
+        Однократно ставит указатели для инцидентов, созданных до их появления
+        
+        Инциденты перебираются через SCAN (не KEYS), указатель ставится с
+        NX и TTL оставшегося срока жизни инцидента. Отметка о миграции
+        ставится только после полного прохода: прерванный перебор
+        повторится при следующем запуске (повтор безопасен благодаря NX).
+        
+        Returns:
+            Количество поставленных указателей
+        """
+        if await self.client.exists(RedisKeys.PENDING_INCIDENT_MIGRATION):
+            return 0
+        
+        created = 0
+        async for key in self.client.scan_iter(match="roma_bot:incident:*", count=500):
+            user_id, status, has_image, incident_id = await self.client.hmget(
+                key, 'user_id', 'status', 'has_image', 'id'
+            )
+            if not user_id or status != 'OPEN' or has_image not in ('False', 'false', '0'):
+                continue
+            
+            ttl = await self.client.ttl(key)
+            pending_key = self._get_pending_key(user_id)
+            if await self.client.set(pending_key, incident_id or key.split(':', 2)[-1],
+                                     ex=ttl if ttl > 0 else INCIDENT_TTL, nx=True):
+                created += 1
+        
+        await self.client.set(RedisKeys.PENDING_INCIDENT_MIGRATION, datetime.now().isoformat())
+        if created:
+            print(f"📌 Поставлены указатели незавершенных инцидентов: {created}")
+        return created
+    
+    async def backfill_incident_indexes(self) -> int:
+        """
+        Однократно строит индексы для инцидентов, сохраненных до их появления
+        
+        Отметка о миграции ставится только после полного прохода SCAN:
+        прерванное построение повторится при следующем запуске (индексация
+        идемпотентна).
+        
+        Returns:
+            Количество проиндексированных инцидентов
+        """
+        if await self.client.exists(RedisKeys.INCIDENT_INDEX_MIGRATION):
+            return 0
+        
+        fields = ('id', 'status', 'deadline') + INDEXED_FIELDS
+        indexed = 0
+        async for key in self.client.scan_iter(match="roma_bot:incident:*", count=500):
+            values = dict(zip(fields, await self.client.hmget(key, *fields)))
+            if not values['status']:
+                continue
+            values['id'] = values['id'] or key.split(':', 2)[-1]
+            
+            async with self.client.pipeline(transaction=True) as pipe:
+                self._queue_index(pipe, values)
+                await pipe.execute()
+            indexed += 1
+        
+        await self.client.set(RedisKeys.INCIDENT_INDEX_MIGRATION, datetime.now().isoformat())
+        if indexed:
+            print(f"🗂 Построены индексы инцидентов: {indexed}")
+        return indexed
@@ -2,18 +2,26 @@
 Incident processing service
 Handles all incident-related business logic following DRY principles
 """
+import asyncio
 from typing import Dict, Optional, Tuple, Any, List
 from datetime import datetime
-from telegram import Update
+from telegram import Bot, Update
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import ContextTypes
 
 from ai.agent import IncidentAIAgent
 from services.google_sheets import GoogleSheetsService
+from services.async_sheets import AsyncSheetsService
 from services.telegram import TelegramService
-from services.redis_memory import RedisMemory
+from services.redis_memory import get_redis_memory
 from services.incident_manager import IncidentManager
+from services.outbox import Outbox, PermanentTaskError, get_outbox
+from services.photo_store import KIND_INCIDENT, KIND_SOLUTION, PhotoRejected, get_photo_store
+from services.photo_archive import open_photo
+from services.photo_derivatives import get_photo_derivatives
+from services.telegram_media import iter_telegram_file
 from config.settings import settings
-from bot.constants import Messages, Errors, LogMessages, DebugMessages
+from bot.constants import Messages, Errors, LogMessages, DebugMessages, OutboxTasks
 
 
 class IncidentProcessor:
@@ -22,9 +30,12 @@ class IncidentProcessor:
     def __init__(self):
         self.ai_agent = IncidentAIAgent()
         self.sheets_service = GoogleSheetsService()
+        self.sheets_async = AsyncSheetsService(self.sheets_service)
         self.telegram_service = TelegramService()
-        self.memory_service = RedisMemory()
+        self.memory_service = get_redis_memory()
         self.incident_manager = IncidentManager()
+        self.outbox = get_outbox()
+        self.photo_store = get_photo_store()
     
     async def process_text_message(
         self, 
@@ -40,13 +51,13 @@ class IncidentProcessor:
         Returns: (response_text, incident_data, response_type)
         """
         # Save user message
-        self.memory_service.add_message(user_id, "user", message_text)
+        await self.memory_service.add_message(user_id, "user", message_text)
         
         # Get context and history
         if conversation_history is None:
-            conversation_history = self.memory_service.get_context(user_id)
+            conversation_history = await self.memory_service.get_context(user_id)
         if user_summary is None:
-            user_summary = self.memory_service.get_user_summary(user_id)
+            user_summary = await self.memory_service.get_user_summary(user_id)
         
         # Process through AI
         ai_response = self.ai_agent.process_message(
@@ -73,7 +84,7 @@ class IncidentProcessor:
             
             full_message_with_author = f"{full_message}\n\nАвтор: {author_info}"
             
-            incident = self.ai_agent.create_incident_from_data(
+            incident = await self.ai_agent.create_incident_from_data(
                 incident_data, 
                 full_message_with_author
             )
@@ -91,7 +102,7 @@ class IncidentProcessor:
                 # Save incident data
                 incident_dict = incident.dict()
                 incident_dict['user_id'] = str(user_id)
-                self.incident_manager.save_incident(incident_dict)
+                await self.incident_manager.save_incident(incident_dict, new_incident=True)
                 print(LogMessages.INCIDENT_SAVING.format(incident_id=incident.id))
                 
                 return Messages.INCIDENT_ACCEPTED, {
@@ -116,7 +127,7 @@ class IncidentProcessor:
         await update.message.reply_text(Messages.INCIDENT_ACCEPTED)
         
         # Save to memory
-        self.memory_service.add_message(user_id, "assistant", Messages.INCIDENT_ACCEPTED, {
+        await self.memory_service.add_message(user_id, "assistant", Messages.INCIDENT_ACCEPTED, {
             "type": "incident_created",
             "incident_id": incident.id,
             "status": "waiting_for_photo"
@@ -133,37 +144,53 @@ class IncidentProcessor:
         try:
             # Get photo
             photo = update.message.photo[-1]  # Get largest photo
-            file_id = photo.file_id
             
-            # Download file
-            print(LogMessages.PHOTO_DOWNLOADING)
-            file = await context.bot.get_file(file_id)
-            file_data = await file.download_as_bytearray()
-            file_size = len(file_data)
-            
-            # Determine file extension
-            file_extension = self._detect_file_format(file_data)
-            
-            # Validate photo
+            # Reject oversized photos before downloading
             print(LogMessages.PHOTO_VALIDATING)
-            is_valid, error_msg = self._validate_photo(file_extension, file_size)
-            
-            if not is_valid:
-                await update.message.reply_text(Errors.PHOTO_VALIDATION_ERROR.format(error=error_msg))
-                return
+            if photo.file_size:
+                is_valid, error_msg = self._validate_photo('jpg', photo.file_size)
+                if not is_valid:
+                    await update.message.reply_text(Errors.PHOTO_VALIDATION_ERROR.format(error=error_msg))
+                    return
             
             # Get incident from Redis
-            incident = self.incident_manager.get_incident(user_context['incident_id'])
+            incident = await self.incident_manager.get_incident(user_context['incident_id'])
             if not incident:
                 await update.message.reply_text(Errors.INCIDENT_NOT_FOUND.format(incident_id=user_context['incident_id']))
                 return
             
+            is_solution = bool(user_context.get('waiting_for_solution_photo'))
+            if is_solution:
+                kind, description = KIND_SOLUTION, user_context['resolution']
+            else:
+                kind, description = KIND_INCIDENT, incident.get('short_description', '')
+            
+            # Stream file straight into the photo store, validating size and format on the fly
+            print(LogMessages.PHOTO_DOWNLOADING)
+            try:
+                photo_path, _, _ = await self.photo_store.save_stream(
+                    iter_telegram_file(context.bot, photo.file_id),
+                    incident['id'], kind, description
+                )
+            except PhotoRejected as e:
+                await update.message.reply_text(Errors.PHOTO_VALIDATION_ERROR.format(error=e))
+                return
+            except OSError as e:
+                await update.message.reply_text(Errors.PHOTO_SAVE_ERROR.format(error=e))
+                return
+            
+            # Evidence copy and thumbnail are built in the background
+            try:
+                await asyncio.to_thread(self.outbox.enqueue, OutboxTasks.GENERATE_PHOTO_DERIVATIVES, {'photo_path': photo_path})
+            except Exception as e:
+                print(f"Не удалось поставить обработку фото в очередь: {e}")
+            
             # Process photo based on type
-            if user_context.get('waiting_for_solution_photo'):
-                await self._process_solution_photo(update, context, incident, file_data, file_extension, user_context, user_id)
+            if is_solution:
+                await self._process_solution_photo(update, context, incident, photo_path, user_context, user_id)
             else:
-                await self._process_incident_photo(update, context, incident, file_data, file_extension, user_context, user_id)
-                
+                await self._process_incident_photo(update, context, incident, photo_path, user_context, user_id)
+        
         except Exception as e:
             print(f"Ошибка обработки фото: {e}")
             await update.message.reply_text(Errors.GENERAL_ERROR)
@@ -173,51 +200,32 @@ class IncidentProcessor:
         update: Update, 
         context: ContextTypes.DEFAULT_TYPE,
         incident: Dict,
-        file_data: bytes,
-        file_extension: str,
+        photo_path: str,
         user_context: Dict,
         user_id: int
     ) -> None:
-        """Processes incident photo"""
+        """Processes incident photo saved in the photo store"""
         print(LogMessages.PHOTO_SAVING)
         
-        # Add incident to Google Sheets first
-        incident_obj = self._create_incident_object(incident)
-        sheets_ok = self.sheets_service.append_incident(incident_obj)
-        if not sheets_ok:
-            await update.message.reply_text(Errors.SHEETS_ERROR)
-            return
-        
-        # Insert image into Google Sheets
-        try:
-            problem_description = incident.get('short_description', '')
-            success, result = self.sheets_service.insert_image(
-                file_data, 
-                user_context['incident_id'], 
-                problem_description,
-                file_extension
-            )
-            
-            if not success:
-                await update.message.reply_text(Errors.PHOTO_SAVE_ERROR.format(error=result))
-                return
-                
-        except Exception as e:
-            print(f"Ошибка вставки изображения: {e}")
-            await update.message.reply_text(Errors.PHOTO_SAVE_ERROR.format(error="Ошибка сохранения фото в таблице"))
-            return
-        
-        # Update incident with photo in Redis
         incident['photo_file_id'] = update.message.photo[-1].file_id
         incident['has_image'] = True
-        self.incident_manager.save_incident(incident)
         
-        # Update in Google Sheets
-        print(LogMessages.SHEETS_UPDATING)
-        self.sheets_service.update_incident_with_image(incident)
+        # Update incident with photo in Redis
+        incident['photo_path'] = photo_path
+        await self.incident_manager.save_incident(incident)
         
-        # Send notifications
-        await self._send_incident_notifications(context, incident, file_data)
+        # Google Sheets and notifications are delivered by outbox workers with retries
+        print(LogMessages.SHEETS_UPDATING)
+        try:
+            # Row and notification are queued atomically: a crash can't lose one of them
+            await asyncio.to_thread(self.outbox.enqueue_many, [
+                (OutboxTasks.PUBLISH_INCIDENT, {'incident': incident, 'photo_path': photo_path}),
+                self._incident_notification_task(incident, photo_path)
+            ])
+        except Exception as e:
+            print(f"Ошибка постановки задач в outbox: {e}")
+            await update.message.reply_text(Errors.SHEETS_ERROR)
+            return
         
         # Send success response
         deadline_dt = datetime.fromisoformat(incident['deadline'])
@@ -234,7 +242,7 @@ class IncidentProcessor:
         await update.message.reply_text(full_response)
         
         # Save to memory
-        self.memory_service.add_message(user_id, "assistant", full_response, {
+        await self.memory_service.add_message(user_id, "assistant", full_response, {
             "type": "incident_completed",
             "incident_id": incident['id'],
             "branch": incident['branch'],
@@ -249,112 +257,71 @@ class IncidentProcessor:
         update: Update, 
         context: ContextTypes.DEFAULT_TYPE,
         incident: Dict,
-        file_data: bytes,
-        file_extension: str,
+        photo_path: str,
         user_context: Dict,
         user_id: int
     ) -> None:
-        """Processes solution photo"""
+        """Processes solution photo saved in the photo store"""
         print(LogMessages.PHOTO_SAVING)
         
-        # Save solution photo
-        success, result = self.sheets_service.insert_solution_image(
-            file_data, 
-            user_context['incident_id'], 
-            user_context['resolution'],
-            file_extension
-        )
-        
-        if not success:
-            await update.message.reply_text(Errors.PHOTO_SAVE_ERROR.format(error=result))
-            return
-        
         # Update incident
         incident['solution_photo_file_id'] = update.message.photo[-1].file_id
         incident['has_solution_image'] = True
+        incident['solution_photo_path'] = photo_path
         incident['status'] = 'RESOLVED'
-        self.incident_manager.save_incident(incident)
+        await self.incident_manager.save_incident(incident)
         
-        # Update in Google Sheets
+        # Update in Google Sheets and notify the group through the outbox
         print(LogMessages.SHEETS_UPDATING)
-        self.sheets_service.update_incident_with_image(incident)
-        
-        # Send completion notification
-        await self._send_solution_notification(context, incident, file_data, user_context)
+        try:
+            await asyncio.to_thread(self.outbox.enqueue_many, [
+                (OutboxTasks.PUBLISH_SOLUTION, {'incident': incident, 'photo_path': photo_path}),
+                self._solution_notification_task(incident, photo_path, user_context)
+            ])
+        except Exception as e:
+            print(f"Ошибка постановки задач в outbox: {e}")
+            await update.message.reply_text(Errors.SHEETS_ERROR)
+            return
         
         # Send success response
         await update.message.reply_text(Messages.SOLUTION_PHOTO_SAVED)
     
-    async def _send_incident_notifications(
-        self, 
-        context: ContextTypes.DEFAULT_TYPE,
-        incident: Dict,
-        file_data: bytes
-    ) -> None:
-        """Sends incident notifications to group and responsible"""
+    def _incident_notification_task(self, incident: Dict, photo_path: str) -> Tuple[str, Dict]:
+        """Builds one fan-out notification task to group and responsible"""
         print(LogMessages.NOTIFICATION_SENDING)
         
         incident_obj = self._create_incident_object(incident)
         
         # Send to group with photo
-        try:
-            # Convert bytearray to bytes for proper sending
-            photo_bytes = bytes(file_data) if isinstance(file_data, bytearray) else file_data
-            
-            await context.bot.send_photo(
-                chat_id=settings.TELEGRAM_GROUP_CHAT_ID,
-                photo=photo_bytes,
-                caption=incident_obj.to_telegram_message()
-            )
-            print("✅ Фото отправлено в группу")
-        except Exception as e:
-            print(f"Ошибка отправки фото в группу: {e}")
-            # Fallback to text only
-            await self.telegram_service.send_to_group(incident_obj.to_telegram_message())
+        messages = [{
+            'chat_id': settings.TELEGRAM_GROUP_CHAT_ID,
+            'caption': incident_obj.to_telegram_message(),
+            'label': 'группа'
+        }]
         
         # Send to responsible with photo
         if incident.get('responsible_id'):
-            try:
-                deadline_dt = datetime.fromisoformat(incident['deadline'])
-                deadline_str = deadline_dt.strftime('%d.%m.%Y %H:%M')
-                
-                responsible_message = (
-                    f"🚨 Вам назначен новый инцидент!\n\n"
-                    f"{incident_obj.to_telegram_message(include_deadline=True)}\n\n"
-                    f"Пожалуйста, решите проблему до дедлайна.\n"
-                    f"После решения отправьте:\n"
-                    f"/resolve {incident['id']} [описание решения]"
-                )
-                
-                # Convert bytearray to bytes for proper sending
-                photo_bytes = bytes(file_data) if isinstance(file_data, bytearray) else file_data
-                
-                await context.bot.send_photo(
-                    chat_id=incident['responsible_id'],
-                    photo=photo_bytes,
-                    caption=responsible_message
-                )
-                print("✅ Фото отправлено ответственному")
-            except Exception as e:
-                print(f"Не удалось отправить ответственному: {e}")
-                # Fallback to text only
-                try:
-                    await context.bot.send_message(
-                        chat_id=incident['responsible_id'],
-                        text=responsible_message
-                    )
-                    print("✅ Текст отправлен ответственному")
-                except Exception as e2:
-                    print(f"Не удалось отправить ответственному даже текст: {e2}")
+            responsible_message = (
+                f"🚨 Вам назначен новый инцидент!\n\n"
+                f"{incident_obj.to_telegram_message(include_deadline=True)}\n\n"
+                f"Пожалуйста, решите проблему до дедлайна.\n"
+                f"После решения отправьте:\n"
+                f"/resolve {incident['id']} [описание решения]"
+            )
+            messages.append({
+                'chat_id': incident['responsible_id'],
+                'caption': responsible_message,
+                'label': 'ответственный'
+            })
+        
+        return OutboxTasks.FAN_OUT_NOTIFICATION, {
+            'photo_file_id': incident.get('photo_file_id'),
+            'photo_path': photo_path,
+            'messages': messages
+        }
     
-    async def _send_solution_notification(
-        self, 
-        context: ContextTypes.DEFAULT_TYPE,
-        incident: Dict,
-        file_data: bytes,
-        user_context: Dict
-    ) -> None:
-        """Sends solution notification to group"""
+    def _solution_notification_task(self, incident: Dict, photo_path: str, user_context: Dict) -> Tuple[str, Dict]:
+        """Builds solution notification task to group"""
         completion_message = (
             f"✅ Инцидент {incident['id']} решен!\n\n"
             f"📍 Филиал: {incident.get('branch', 'Неизвестно')}\n"
@@ -364,20 +331,143 @@ class IncidentProcessor:
             f"👤 Решил: @{user_context['resolved_by']}"
         )
         
+        return OutboxTasks.SEND_NOTIFICATION, {
+            'chat_id': settings.TELEGRAM_GROUP_CHAT_ID,
+            'caption': completion_message,
+            'photo_file_id': incident.get('solution_photo_file_id'),
+            'photo_path': photo_path,
+            'label': 'группа, решение'
+        }
+    
+    def register_outbox_tasks(self, outbox: Outbox) -> None:
+        """Registers outbox handlers for incident side effects"""
+        outbox.register(OutboxTasks.PUBLISH_INCIDENT, self._publish_incident_task)
+        outbox.register(OutboxTasks.PUBLISH_SOLUTION, self._publish_solution_task)
+        outbox.register(OutboxTasks.SEND_NOTIFICATION, self._send_notification_task)
+        outbox.register(OutboxTasks.FAN_OUT_NOTIFICATION, self._fan_out_notification_task)
+        outbox.register(OutboxTasks.GENERATE_PHOTO_DERIVATIVES, self._generate_derivatives_task)
+    
+    async def _publish_incident_task(self, payload: Dict, bot: Bot, attempt: int) -> None:
+        """Outbox task: appends incident row to Google Sheets"""
+        incident_obj = self._create_incident_object(payload['incident'])
+        
+        # A previous attempt (including one of a worker that died and whose task
+        # was reclaimed) may have appended the row before failing: retries read
+        # the ID column right before appending and skip the append if it is there
+        success, result, _ = await self.sheets_async.publish_incident_row(
+            incident_obj, payload['photo_path'], check_existing=attempt > 0
+        )
+        if not success:
+            raise RuntimeError(result)
+    
+    async def _publish_solution_task(self, payload: Dict, bot: Bot, attempt: int) -> None:
+        """Outbox task: links solution photo and updates status in Google Sheets"""
+        incident = payload['incident']
+        
+        success, result = await self.sheets_async.attach_solution_photo(incident['id'], payload['photo_path'])
+        if not success:
+            raise RuntimeError(result)
+        
+        if not await self.sheets_async.update_incident_with_image(incident):
+            raise RuntimeError(f"Не удалось обновить статус инцидента {incident['id']}")
+        
+        # Both updates sit in the in-memory write buffer: the task is acked only
+        # after they reached Sheets, otherwise a crash would lose them for good
+        if not await self.sheets_async.flush_pending_writes():
+            raise RuntimeError(f"Не удалось записать решение инцидента {incident['id']} в Google Sheets")
+    
+    async def _generate_derivatives_task(self, payload: Dict, bot: Bot, attempt: int) -> None:
+        """Outbox task: builds evidence copy and thumbnail for a stored photo"""
+        try:
+            await get_photo_derivatives().generate(payload['photo_path'])
+        except (OSError, ValueError) as e:
+            # Unreadable or unsupported image: retrying won't help
+            raise PermanentTaskError(f"Не удалось обработать фото {payload['photo_path']}: {e}")
+    
+    async def _send_notification_task(self, payload: Dict, bot: Bot, attempt: int) -> None:
+        """
+        Outbox task: sends photo with caption to one chat, falls back to text
+        
+        Network errors propagate so the outbox retries the task.
+        """
+        await self._deliver_notification(
+            bot, payload['chat_id'], payload['caption'], payload.get('label', payload['chat_id']),
+            payload.get('photo_file_id'), payload.get('photo_path')
+        )
+    
+    async def _fan_out_notification_task(self, payload: Dict, bot: Bot, attempt: int) -> None:
+        """
+        Outbox task: sends the same photo to several chats concurrently
+        
+        Recipients that failed with a retryable error are re-queued as separate
+        SEND_NOTIFICATION tasks, so successful chats don't get duplicates.
+        """
+        messages = payload['messages']
+        results = await asyncio.gather(*(
+            self._deliver_notification(
+                bot, message['chat_id'], message['caption'], message.get('label', message['chat_id']),
+                payload.get('photo_file_id'), payload.get('photo_path')
+            )
+            for message in messages
+        ), return_exceptions=True)
+        
+        for message, result in zip(messages, results):
+            if isinstance(result, PermanentTaskError):
+                print(f"❌ {result}")
+            elif isinstance(result, Exception):
+                print(f"Уведомление отложено ({message.get('label')}): {result}")
+                await asyncio.to_thread(self.outbox.enqueue, OutboxTasks.SEND_NOTIFICATION, {
+                    **message,
+                    'photo_file_id': payload.get('photo_file_id'),
+                    'photo_path': payload.get('photo_path')
+                })
+    
+    async def _deliver_notification(
+        self,
+        bot: Bot,
+        chat_id: Any,
+        caption: str,
+        label: Any,
+        photo_file_id: Optional[str],
+        photo_path: Optional[str]
+    ) -> None:
+        """
+        Sends photo by Telegram file_id, re-uploads bytes only if file_id is rejected,
+        falls back to text when no photo can be sent
+        """
         try:
-            # Convert bytearray to bytes for proper sending
-            photo_bytes = bytes(file_data) if isinstance(file_data, bytearray) else file_data
+            if photo_file_id:
+                try:
+                    await bot.send_photo(chat_id=chat_id, photo=photo_file_id, caption=caption)
+                    print(f"✅ Фото отправлено по file_id ({label})")
+                    return
+                except BadRequest as e:
+                    print(f"file_id отклонен ({label}), загружаю фото: {e}")
             
-            await context.bot.send_photo(
-                chat_id=settings.TELEGRAM_GROUP_CHAT_ID,
-                photo=photo_bytes,
-                caption=completion_message
-            )
-            print("✅ Фото решения отправлено в группу")
-        except Exception as e:
-            print(f"Ошибка отправки фото решения в группу: {e}")
-            await self.telegram_service.send_to_group(completion_message)
-            print("✅ Текст решения отправлен в группу")
+            if photo_path:
+                try:
+                    # Original may have been replaced by the evidence copy or moved to the archive
+                    photo_file = await asyncio.to_thread(open_photo, photo_path)
+                except OSError as e:
+                    print(f"Фото для уведомления недоступно ({label}): {e}")
+                else:
+                    try:
+                        await bot.send_photo(chat_id=chat_id, photo=photo_file, caption=caption)
+                        print(f"✅ Фото отправлено ({label})")
+                        return
+                    except BadRequest as e:
+                        print(f"Ошибка отправки фото ({label}): {e}")
+                    finally:
+                        photo_file.close()
+        except Forbidden as e:
+            raise PermanentTaskError(f"Бот не может писать в чат {chat_id}: {e}")
+        
+        # Fallback to text only
+        try:
+            await bot.send_message(chat_id=chat_id, text=caption)
+            print(f"✅ Текст отправлен ({label})")
+        except (Forbidden, BadRequest) as e:
+            raise PermanentTaskError(f"Не удалось отправить уведомление в чат {chat_id}: {e}")
     
     def _create_incident_object(self, incident: Dict):
         """Creates Incident object from dict"""
@@ -389,17 +479,6 @@ class IncidentProcessor:
         
         return Incident(**incident)
     
-    def _detect_file_format(self, file_data: bytes) -> str:
-        """Detects file format from magic bytes"""
-        from bot.constants import FileHandling
-        
-        for magic_bytes, extension in FileHandling.MAGIC_BYTES.items():
-            if file_data.startswith(magic_bytes):
-                if extension == 'webp' and b'WEBP' not in file_data[:12]:
-                    continue
-                return extension
-        return 'jpg'  # Default to JPEG
-    
     def _validate_photo(self, file_extension: str, file_size: int) -> Tuple[bool, str]:
         """Validates photo file"""
         from utils.validators import validate_photo
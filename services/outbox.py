@@ -0,0 +1,257 @@
+"""
+Надежная очередь побочных эффектов (outbox) на Redis Streams
+Запись в Google Sheets и уведомления выполняются фоновыми обработчиками с повторами
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from telegram import Bot
+from config.settings import settings
+from services.redis_client import get_redis
+from bot.constants import RedisKeys
+
+# Обработчик задачи: (payload, bot, номер попытки)
+TaskHandler = Callable[[Dict, Bot, int], Awaitable[None]]
+
+# Переносит созревшие повторы обратно в поток атомарно, чтобы два
+# обработчика не продублировали одну задачу
+_MOVE_DUE_RETRIES = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('XADD', KEYS[2], '*', 'task', item)
+end
+return #items
+"""
+
+
+class PermanentTaskError(Exception):
+    """Ошибка, которую бесполезно повторять: задача сразу уходит в dead-letter"""
+
+
+class Outbox:
+    """
+    Очередь задач в Redis Stream с группой потребителей
+    
+    Задача подтверждается (XACK) только после успешного выполнения. При ошибке
+    она откладывается в sorted set повторов с экспоненциальной задержкой, после
+    OUTBOX_MAX_ATTEMPTS попыток - в dead-letter поток. Задачи, зависшие у
+    упавшего процесса, забираются через XAUTOCLAIM.
+    """
+    
+    def __init__(self):
+        self.redis = get_redis()
+        self.stream_key = RedisKeys.OUTBOX_STREAM
+        self.retry_key = RedisKeys.OUTBOX_RETRY
+        self.dead_key = RedisKeys.OUTBOX_DEAD
+        self.group = RedisKeys.OUTBOX_GROUP
+        self._handlers: Dict[str, TaskHandler] = {}
+        self._move_due_retries = self.redis.register_script(_MOVE_DUE_RETRIES)
+        self._group_ready = False
+    
+    def register(self, kind: str, handler: TaskHandler):
+        """Регистрирует обработчик задач вида kind"""
+        self._handlers[kind] = handler
+    
+    def enqueue(self, kind: str, payload: Dict) -> str:
+        """
+        Ставит задачу в очередь
+        
+        Args:
+            kind: Вид задачи (имя зарегистрированного обработчика)
+            payload: JSON-сериализуемые данные задачи
+        
+        Returns:
+            ID записи в потоке
+        """
+        return self.enqueue_many([(kind, payload)])[0]
+    
+    def enqueue_many(self, tasks: List[Tuple[str, Dict]]) -> List[str]:
+        """
+        Ставит несколько задач в очередь одной транзакцией (MULTI/EXEC)
+        
+        Либо попадают все задачи, либо ни одной: падение процесса между
+        ними не потеряет, например, уведомление о записанном инциденте.
+        
+        Args:
+            tasks: Список (вид задачи, payload)
+        
+        Returns:
+            ID записей в потоке
+        """
+        with self.redis.pipeline(transaction=True) as pipe:
+            for kind, payload in tasks:
+                pipe.xadd(self.stream_key, {'task': self._encode(kind, payload, attempt=0)})
+            entry_ids = pipe.execute()
+        
+        for (kind, _), entry_id in zip(tasks, entry_ids):
+            print(f"📮 Задача {kind} поставлена в outbox: {entry_id}")
+        return entry_ids
+    
+    @staticmethod
+    def _encode(kind: str, payload: Dict, attempt: int) -> str:
+        return json.dumps({'kind': kind, 'payload': payload, 'attempt': attempt},
+                          ensure_ascii=False, default=str)
+    
+    def _ensure_group(self):
+        """Создает группу потребителей (и поток) при первом запуске"""
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.stream_key, self.group, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+    
+    def _fetch(self, consumer: str) -> List[Tuple[str, Dict, bool]]:
+        """
+        Возвращает следующие задачи для обработчика: (ID, поля, забрана у другого)
+        
+        Сначала переносит созревшие повторы и забирает задачи, зависшие
+        у других потребителей, затем ждет новые задачи до OUTBOX_BLOCK_MS.
+        """
+        self._ensure_group()
+        self._move_due_retries(keys=[self.retry_key, self.stream_key], args=[time.time(), 100])
+        
+        _, claimed, *_ = self.redis.xautoclaim(
+            self.stream_key, self.group, consumer,
+            min_idle_time=settings.OUTBOX_CLAIM_IDLE_MS, start_id='0-0', count=1
+        )
+        if claimed:
+            return [(entry_id, fields, True) for entry_id, fields in claimed if fields]
+        
+        response = self.redis.xreadgroup(
+            self.group, consumer, {self.stream_key: '>'},
+            count=1, block=settings.OUTBOX_BLOCK_MS
+        )
+        return [(entry_id, fields, False) for _, entries in response or [] for entry_id, fields in entries]
+    
+    def _complete(self, entry_id: str):
+        """Подтверждает и удаляет выполненную задачу"""
+        with self.redis.pipeline() as pipe:
+            pipe.xack(self.stream_key, self.group, entry_id)
+            pipe.xdel(self.stream_key, entry_id)
+            pipe.execute()
+    
+    def _fail(self, entry_id: str, task: Dict, error: str, permanent: bool):
+        """Откладывает задачу на повтор или переносит в dead-letter"""
+        attempt = task.get('attempt', 0) + 1
+        
+        with self.redis.pipeline() as pipe:
+            if permanent or attempt >= settings.OUTBOX_MAX_ATTEMPTS:
+                pipe.xadd(self.dead_key, {
+                    'task': self._encode(task.get('kind', ''), task.get('payload', {}), attempt),
+                    'error': error,
+                    'failed_at': str(time.time())
+                }, maxlen=settings.OUTBOX_DEAD_LETTER_MAXLEN, approximate=True)
+                print(f"☠️ Задача {task.get('kind')} перенесена в dead-letter после {attempt} попыток: {error}")
+            else:
+                delay = min(settings.OUTBOX_RETRY_BASE_DELAY * 2 ** (attempt - 1),
+                            settings.OUTBOX_RETRY_MAX_DELAY)
+                pipe.zadd(self.retry_key, {
+                    self._encode(task['kind'], task['payload'], attempt): time.time() + delay
+                })
+                print(f"🔁 Задача {task['kind']} упала ({error}), повтор {attempt} через {delay} с")
+            pipe.xack(self.stream_key, self.group, entry_id)
+            pipe.xdel(self.stream_key, entry_id)
+            pipe.execute()
+    
+    async def _process(self, bot: Bot, entry_id: str, fields: Dict, reclaimed: bool = False):
+        """
+        Выполняет одну задачу и фиксирует результат
+        
+        Задача, забранная у упавшего обработчика, считается повторной попыткой:
+        предыдущий запуск мог успеть выполнить часть побочных эффектов.
+        """
+        try:
+            task = json.loads(fields['task'])
+            handler = self._handlers.get(task['kind'])
+            if reclaimed:
+                task['attempt'] = task.get('attempt', 0) + 1
+        except (KeyError, TypeError, ValueError) as e:
+            # Поврежденная запись: повторять нечего
+            await asyncio.to_thread(self._fail, entry_id, {}, f"Некорректная задача: {e}", True)
+            return
+        
+        try:
+            if handler is None:
+                raise PermanentTaskError(f"Нет обработчика для задачи {task['kind']}")
+            await asyncio.wait_for(
+                handler(task['payload'], bot, task.get('attempt', 0)),
+                settings.OUTBOX_TASK_TIMEOUT
+            )
+        except PermanentTaskError as e:
+            await asyncio.to_thread(self._fail, entry_id, task, str(e), True)
+        except Exception as e:
+            await asyncio.to_thread(self._fail, entry_id, task, str(e) or type(e).__name__, False)
+        else:
+            await asyncio.to_thread(self._complete, entry_id)
+    
+    async def run_worker(self, bot: Bot, consumer: str):
+        """Бесконечный цикл обработки задач одним потребителем"""
+        print(f"📬 Обработчик outbox {consumer} запущен")
+        while True:
+            try:
+                entries = await asyncio.to_thread(self._fetch, consumer)
+                for entry_id, fields, reclaimed in entries:
+                    await self._process(bot, entry_id, fields, reclaimed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка обработчика outbox {consumer}: {e}")
+                await asyncio.sleep(5)
+    
+    async def run_stats_logger(self):
+        """Периодически пишет в лог размеры очереди, если в ней что-то есть"""
+        while True:
+            await asyncio.sleep(settings.OUTBOX_STATS_INTERVAL)
+            try:
+                stats = await asyncio.to_thread(self.stats)
+            except Exception as e:
+                print(f"❌ Ошибка чтения статистики outbox: {e}")
+                continue
+            if any(stats.values()):
+                print(
+                    f"📮 Outbox: в очереди {stats['queued']}, выполняется {stats['in_progress']}, "
+                    f"ждут повтора {stats['retrying']}, в dead-letter {stats['dead']}"
+                )
+    
+    def start_workers(self, bot: Bot, count: Optional[int] = None) -> List[asyncio.Task]:
+        """Запускает обработчиков и журнал размеров очереди в текущем event loop"""
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        tasks = [
+            asyncio.create_task(self.run_worker(bot, f"{prefix}-{i}"))
+            for i in range(count or settings.OUTBOX_WORKERS)
+        ]
+        tasks.append(asyncio.create_task(self.run_stats_logger()))
+        return tasks
+    
+    def stats(self) -> Dict:
+        """Размеры очереди, повторов и dead-letter"""
+        self._ensure_group()
+        pending = self.redis.xpending(self.stream_key, self.group)
+        return {
+            "queued": self.redis.xlen(self.stream_key),
+            "in_progress": pending.get('pending', 0) if pending else 0,
+            "retrying": self.redis.zcard(self.retry_key),
+            "dead": self.redis.xlen(self.dead_key)
+        }
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """Возвращает общий для процесса outbox"""
+    global _outbox
+    
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
@@ -0,0 +1,406 @@
+"""
+Холодный архив фото: закрытые дни упаковываются в один файл-бандл на день
+Индекс смещений позволяет читать фото прямо из бандла через mmap, без распаковки на диск
+"""
+import os
+import io
+import re
+import json
+import mmap
+import time
+import zlib
+import struct
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from config.settings import settings
+from services.photo_store import PhotoStore, get_photo_store
+
+# Старая раскладка photos/<вид>/YYYY/MM/DD/#ID_описание_время.ext
+LEGACY_PHOTO_DIRS = {
+    'incident': os.path.join('photos', 'incidents'),
+    'solution': os.path.join('photos', 'solutions')
+}
+LEGACY_INCIDENT_ID = re.compile(r'^(#\d{8}-\d+)_')
+
+BUNDLE_MAGIC = b'RPHOTOBUNDLE1\n'
+FOOTER = struct.Struct('<Q6s')  # длина JSON-оглавления + метка конца
+FOOTER_MAGIC = b'RPBEND'
+
+# Порядок предпочтения копий при чтении по ID инцидента
+VARIANT_ORDER = ('original', 'evidence', 'thumb')
+
+
+def normalize_path(path: str) -> str:
+    """Ключ фото в архиве - путь в том виде, в каком он записан в таблице"""
+    return os.path.normpath(path)
+
+
+class PhotoArchive:
+    """
+    Архив фото по дням
+    
+    Бандл: заголовок, содержимое фото подряд (сжатое zlib, если это дает
+    выигрыш - JPEG обычно хранится как есть) и JSON-оглавление в конце.
+    Смещения дублируются в индексе SQLite, по которому reader находит фото
+    по исходному пути или ID инцидента. После упаковки отдельные файлы
+    удаляются, ссылки в колонках K/L продолжают работать через open_photo.
+    """
+    
+    def __init__(self, root: str, store: Optional[PhotoStore] = None):
+        self.root = root
+        self.store = store or get_photo_store()
+        os.makedirs(root, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self._maps: "OrderedDict[str, Tuple[BinaryIO, mmap.mmap]]" = OrderedDict()
+        self._create_schema()
+    
+    def _create_schema(self):
+        """Создает таблицы индекса архива"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS bundles (
+                    bundle TEXT PRIMARY KEY,
+                    day TEXT NOT NULL,
+                    members INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS members (
+                    path TEXT PRIMARY KEY,
+                    bundle TEXT NOT NULL REFERENCES bundles(bundle),
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    variant TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS member_incidents (
+                    incident_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    path TEXT NOT NULL REFERENCES members(path),
+                    PRIMARY KEY (incident_id, kind, path)
+                )
+            """)
+    
+    def _legacy_files(self, cutoff_day: str) -> Dict[str, List[Dict]]:
+        """Файлы старой раскладки по дням раньше cutoff_day"""
+        days: Dict[str, List[Dict]] = {}
+        for kind, base in LEGACY_PHOTO_DIRS.items():
+            if not os.path.isdir(base):
+                continue
+            for dirpath, _, filenames in os.walk(base):
+                parts = os.path.relpath(dirpath, base).split(os.sep)
+                if len(parts) != 3 or not all(part.isdigit() for part in parts):
+                    continue
+                day = '-'.join(parts)
+                if day >= cutoff_day:
+                    continue
+                for filename in filenames:
+                    match = LEGACY_INCIDENT_ID.match(filename)
+                    days.setdefault(day, []).append({
+                        "path": os.path.join(dirpath, filename),
+                        "variant": "original",
+                        "incidents": [(match.group(1), kind)] if match else []
+                    })
+        return days
+    
+    def _store_files(self, cutoff_day: str) -> Dict[str, List[Dict]]:
+        """Файлы хранилища по дням сохранения раньше cutoff_day"""
+        created_before = datetime.strptime(cutoff_day, '%Y-%m-%d').timestamp()
+        days: Dict[str, List[Dict]] = {}
+        for file in self.store.files_created_before(created_before):
+            day = datetime.fromtimestamp(file['created_at']).strftime('%Y-%m-%d')
+            days.setdefault(day, []).append(file)
+        return days
+    
+    def _bundle_path(self, day: str) -> str:
+        """Новый файл бандла дня (повторная упаковка дня дает следующий номер)"""
+        directory = os.path.join(self.root, day[:4], day[5:7])
+        os.makedirs(directory, exist_ok=True)
+        number = 1
+        while os.path.exists(os.path.join(directory, f"{day}.{number}.bundle")):
+            number += 1
+        return os.path.join(directory, f"{day}.{number}.bundle")
+    
+    def _is_archived(self, path: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM members WHERE path = ?", (path,)
+            ).fetchone() is not None
+    
+    def pack_day(self, day: str, files: List[Dict]) -> Tuple[int, int]:
+        """
+        Упаковывает файлы дня в новый бандл и удаляет исходные файлы
+        
+        Returns:
+            Tuple[упаковано файлов, размер бандла в байтах]
+        """
+        entries = []
+        for file in files:
+            path = normalize_path(file['path'])
+            if not os.path.exists(path):
+                continue
+            if self._is_archived(path):
+                # Упакован прошлым запуском, который не успел удалить файл
+                os.remove(path)
+                continue
+            entries.append({**file, "path": path})
+        if not entries:
+            return 0, 0
+        
+        bundle_path = self._bundle_path(day)
+        tmp_path = f"{bundle_path}.part"
+        members = []
+        try:
+            with open(tmp_path, 'wb') as out:
+                out.write(BUNDLE_MAGIC)
+                for entry in entries:
+                    with open(entry['path'], 'rb') as f:
+                        data = f.read()
+                    packed = zlib.compress(data, 6)
+                    compressed = len(packed) < len(data) * 0.95
+                    payload = packed if compressed else data
+                    
+                    members.append({
+                        "path": entry['path'], "offset": out.tell(), "length": len(payload),
+                        "size": len(data), "compressed": compressed, "variant": entry['variant'],
+                        "incidents": entry['incidents']
+                    })
+                    out.write(payload)
+                
+                toc = json.dumps(members, ensure_ascii=False).encode('utf-8')
+                out.write(toc)
+                out.write(FOOTER.pack(len(toc), FOOTER_MAGIC))
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, bundle_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        bundle_size = os.path.getsize(bundle_path)
+        self._index_bundle(bundle_path, day, members, bundle_size)
+        
+        # Исходные файлы удаляются только после записи индекса
+        for member in members:
+            try:
+                os.remove(member['path'])
+            except FileNotFoundError:
+                pass
+        return len(members), bundle_size
+    
+    def _index_bundle(self, bundle_path: str, day: str, members: List[Dict], bundle_size: int):
+        """Записывает оглавление бандла в индекс"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bundles (bundle, day, members, bytes, created_at) VALUES (?, ?, ?, ?, ?)",
+                (bundle_path, day, len(members), bundle_size, time.time())
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO members (path, bundle, offset, length, size, compressed, variant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (m['path'], bundle_path, m['offset'], m['length'], m['size'], int(m['compressed']), m['variant'])
+                    for m in members
+                ]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO member_incidents (incident_id, kind, path) VALUES (?, ?, ?)",
+                [(incident_id, kind, m['path']) for m in members for incident_id, kind in m['incidents']]
+            )
+    
+    def recover_bundles(self) -> int:
+        """
+        Вносит в индекс бандлы, которых в нем нет, и удаляет недописанные .part
+        
+        Бандл без индекса остается, если процесс упал между os.replace и
+        записью индекса в pack_day; его файлы после восстановления считаются
+        упакованными и удаляются следующим pack_day.
+        
+        Returns:
+            Число восстановленных бандлов
+        """
+        with self._lock:
+            indexed = {bundle for bundle, in self._conn.execute("SELECT bundle FROM bundles")}
+        
+        recovered = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.endswith('.bundle.part'):
+                    os.remove(path)
+                elif filename.endswith('.bundle') and path not in indexed:
+                    day = filename.split('.', 1)[0]
+                    self._index_bundle(path, day, self.read_bundle_toc(path), os.path.getsize(path))
+                    print(f"🗜 Бандл {path} восстановлен в индексе архива")
+                    recovered += 1
+        return recovered
+    
+    def archive_closed_days(self, after_days: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Упаковывает все дни старше after_days (по умолчанию PHOTO_ARCHIVE_AFTER_DAYS)
+        
+        Returns:
+            Tuple[упаковано файлов, байт в новых бандлах]
+        """
+        after_days = settings.PHOTO_ARCHIVE_AFTER_DAYS if after_days is None else after_days
+        cutoff_day = (datetime.now() - timedelta(days=after_days)).strftime('%Y-%m-%d')
+        
+        # Бандлы прерванной упаковки - до сбора файлов, чтобы не упаковать их повторно
+        self.recover_bundles()
+        
+        days = self._legacy_files(cutoff_day)
+        for day, files in self._store_files(cutoff_day).items():
+            days.setdefault(day, []).extend(files)
+        
+        packed = total_bytes = 0
+        for day in sorted(days):
+            count, size = self.pack_day(day, days[day])
+            if count:
+                print(f"🗜 Фото за {day} упакованы в архив: {count} файлов, {size / (1024 * 1024):.1f} МБ")
+            packed += count
+            total_bytes += size
+        
+        self._remove_empty_legacy_dirs()
+        return packed, total_bytes
+    
+    @staticmethod
+    def _remove_empty_legacy_dirs():
+        for base in LEGACY_PHOTO_DIRS.values():
+            for dirpath, _, _ in os.walk(base, topdown=False):
+                if dirpath != base and not os.listdir(dirpath):
+                    try:
+                        os.rmdir(dirpath)
+                    except OSError:
+                        pass
+    
+    async def run_archiver(self):
+        """Периодически упаковывает закрытые дни"""
+        while True:
+            if settings.PHOTO_ARCHIVE_AFTER_DAYS:
+                try:
+                    await asyncio.to_thread(self.archive_closed_days)
+                except Exception as e:
+                    print(f"❌ Ошибка архивации фото: {e}")
+            await asyncio.sleep(settings.PHOTO_ARCHIVE_INTERVAL)
+    
+    def _get_map(self, bundle_path: str) -> mmap.mmap:
+        """mmap бандла; держим открытыми несколько последних (вызывается под self._lock)"""
+        if bundle_path in self._maps:
+            self._maps.move_to_end(bundle_path)
+            return self._maps[bundle_path][1]
+        
+        f = open(bundle_path, 'rb')
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            f.close()
+            raise
+        self._maps[bundle_path] = (f, mapped)
+        while len(self._maps) > 8:
+            _, (old_file, old_map) = self._maps.popitem(last=False)
+            old_map.close()
+            old_file.close()
+        return mapped
+    
+    def read(self, path: str) -> Optional[bytes]:
+        """Содержимое фото из архива по исходному пути (None, если не архивировано)"""
+        path = normalize_path(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bundle, offset, length, compressed FROM members WHERE path = ?", (path,)
+            ).fetchone()
+            if not row:
+                return None
+            bundle, offset, length, compressed = row
+            data = self._get_map(bundle)[offset:offset + length]
+        return zlib.decompress(data) if compressed else data
+    
+    def photos_for_incident(self, incident_id: str, kind: Optional[str] = None) -> List[Dict]:
+        """Архивированные фото инцидента: path, kind, variant, size"""
+        query = (
+            "SELECT i.path, i.kind, m.variant, m.size FROM member_incidents i "
+            "JOIN members m ON m.path = i.path WHERE i.incident_id = ?"
+        )
+        params = [incident_id]
+        if kind:
+            query += " AND i.kind = ?"
+            params.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        photos = [{"path": path, "kind": kind, "variant": variant, "size": size} for path, kind, variant, size in rows]
+        return sorted(photos, key=lambda p: VARIANT_ORDER.index(p['variant']) if p['variant'] in VARIANT_ORDER else 99)
+    
+    def read_incident_photo(self, incident_id: str, kind: str = 'incident') -> Optional[bytes]:
+        """Лучшая сохраненная копия фото инцидента из архива"""
+        photos = self.photos_for_incident(incident_id, kind)
+        return self.read(photos[0]['path']) if photos else None
+    
+    def read_bundle_toc(self, bundle_path: str) -> List[Dict]:
+        """Оглавление бандла из его хвоста (для восстановления индекса в recover_bundles)"""
+        with open(bundle_path, 'rb') as f:
+            f.seek(-FOOTER.size, os.SEEK_END)
+            toc_length, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic != FOOTER_MAGIC:
+                raise ValueError(f"{bundle_path} не является бандлом фото")
+            f.seek(-FOOTER.size - toc_length, os.SEEK_END)
+            return json.loads(f.read(toc_length))
+    
+    def stats(self) -> Dict:
+        """Число бандлов, файлов в архиве и их размер"""
+        with self._lock:
+            bundles, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM bundles"
+            ).fetchone()
+            members, original = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM members"
+            ).fetchone()
+        return {"bundles": bundles, "members": members, "bundle_bytes": stored, "original_bytes": original}
+
+
+_archive: Optional[PhotoArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_photo_archive() -> PhotoArchive:
+    """Возвращает общий для процесса архив фото"""
+    global _archive
+    
+    with _archive_lock:
+        if _archive is None:
+            _archive = PhotoArchive(settings.PHOTO_ARCHIVE_DIR)
+        return _archive
+
+
+def open_photo(path: str) -> BinaryIO:
+    """
+    Открывает фото по пути из таблицы, где бы оно ни лежало
+    
+    Порядок: исходный файл, копия-доказательство из хранилища, архив.
+    
+    Raises:
+        FileNotFoundError: Фото нигде нет
+    """
+    resolved = get_photo_store().resolve(path)
+    if os.path.exists(resolved):
+        return open(resolved, 'rb')
+    
+    data = get_photo_archive().read(path)
+    if data is None:
+        digest = PhotoStore.digest_of(path)
+        evidence = get_photo_store().derivatives_for(digest).get('evidence') if digest else None
+        data = get_photo_archive().read(evidence['path']) if evidence else None
+    if data is None:
+        raise FileNotFoundError(f"Фото не найдено: {path}")
+    return io.BytesIO(data)
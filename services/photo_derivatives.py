@@ -0,0 +1,187 @@
+"""
+Производные фото: уменьшенная копия-доказательство и миниатюра
+Изображения обрабатываются Pillow в пуле процессов, старые оригиналы удаляются по политике хранения
+"""
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from config.settings import settings
+from services.photo_store import PhotoStore, get_photo_store
+
+VARIANT_EVIDENCE = 'evidence'
+VARIANT_THUMBNAIL = 'thumb'
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def render_derivatives(source_path: str, targets: Dict[str, Tuple[str, int]],
+                       image_format: str, quality: int) -> Dict[str, Dict]:
+    """
+    Строит уменьшенные копии изображения (выполняется в процессе пула)
+    
+    Поворот из EXIF применяется к пикселям, сами метаданные (GPS, модель
+    камеры) в копии не попадают.
+    
+    Args:
+        source_path: Путь к оригиналу
+        targets: variant -> (путь результата, длинная сторона в пикселях)
+        image_format: JPEG или WEBP
+        quality: Качество сжатия
+    
+    Returns:
+        variant -> path, width, height, size
+    """
+    from PIL import Image, ImageOps
+    
+    results = {}
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        for variant, (target_path, max_side) in targets.items():
+            copy = image.copy()
+            copy.thumbnail((max_side, max_side), Image.LANCZOS)
+            
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            tmp_path = f"{target_path}.part"
+            copy.save(tmp_path, format=image_format, quality=quality, optimize=True)
+            os.replace(tmp_path, target_path)
+            
+            results[variant] = {
+                "path": target_path,
+                "width": copy.width,
+                "height": copy.height,
+                "size": os.path.getsize(target_path)
+            }
+    return results
+
+
+class PhotoDerivatives:
+    """
+    Производные файлы фото из хранилища
+    
+    После сохранения фото строятся копия-доказательство (длинная сторона до
+    PHOTO_EVIDENCE_MAX_SIDE) и миниатюра, без EXIF. Оригиналы старше
+    PHOTO_ORIGINAL_RETENTION_DAYS удаляются, если копия уже есть - ссылки
+    в таблице продолжают работать через PhotoStore.resolve.
+    """
+    
+    def __init__(self, store: Optional[PhotoStore] = None):
+        self.store = store or get_photo_store()
+        self.image_format = settings.PHOTO_DERIVATIVE_FORMAT.upper()
+        self.extension = EXTENSIONS.get(self.image_format, 'jpg')
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: дочерние процессы не наследуют потоки и соединения бота
+                self._pool = ProcessPoolExecutor(
+                    max_workers=settings.PHOTO_DERIVATIVE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+    
+    async def generate(self, photo_path: str) -> Dict[str, Dict]:
+        """
+        Строит недостающие производные для фото из хранилища
+        
+        Args:
+            photo_path: Путь к фото, возвращенный PhotoStore
+        
+        Returns:
+            variant -> path, width, height, size (пусто для фото вне хранилища)
+        """
+        digest = self.store.digest_of(photo_path)
+        blob = await asyncio.to_thread(self.store.get_blob, digest) if digest else None
+        if not blob:
+            return {}
+        
+        existing = await asyncio.to_thread(self.store.derivatives_for, digest)
+        if existing and all(os.path.exists(info['path']) for info in existing.values()):
+            return existing
+        if blob['original_deleted_at']:
+            return existing
+        
+        targets = {
+            VARIANT_EVIDENCE: (
+                self.store.derivative_path(digest, VARIANT_EVIDENCE, self.extension),
+                settings.PHOTO_EVIDENCE_MAX_SIDE
+            ),
+            VARIANT_THUMBNAIL: (
+                self.store.derivative_path(digest, VARIANT_THUMBNAIL, self.extension),
+                settings.PHOTO_THUMBNAIL_MAX_SIDE
+            )
+        }
+        
+        loop = asyncio.get_running_loop()
+        derivatives = await loop.run_in_executor(
+            self._get_pool(), render_derivatives,
+            blob['path'], targets, self.image_format, settings.PHOTO_DERIVATIVE_QUALITY
+        )
+        await asyncio.to_thread(self.store.record_derivatives, digest, derivatives)
+        
+        evidence = derivatives[VARIANT_EVIDENCE]
+        print(f"🖼 Производные фото {digest[:12]}: оригинал {blob['size'] // 1024} КБ, "
+              f"копия {evidence['width']}x{evidence['height']} {evidence['size'] // 1024} КБ, "
+              f"миниатюра {derivatives[VARIANT_THUMBNAIL]['size'] // 1024} КБ")
+        return derivatives
+    
+    def apply_retention(self) -> Tuple[int, int]:
+        """
+        Удаляет оригиналы старше PHOTO_ORIGINAL_RETENTION_DAYS, у которых есть копия
+        
+        Returns:
+            Tuple[удалено файлов, освобождено байт]
+        """
+        days = settings.PHOTO_ORIGINAL_RETENTION_DAYS
+        if not days:
+            return 0, 0
+        
+        created_before = time.time() - days * 24 * 60 * 60
+        removed = freed = 0
+        while True:
+            expired = self.store.expired_originals(created_before, VARIANT_EVIDENCE)
+            if not expired:
+                break
+            for digest, path in expired:
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.store.mark_original_deleted(digest)
+                removed += 1
+        
+        if removed:
+            print(f"🧹 Удалено оригиналов фото: {removed}, освобождено {freed / (1024 * 1024):.1f} МБ")
+        return removed, freed
+    
+    async def run_retention(self):
+        """Периодически применяет политику хранения оригиналов"""
+        while True:
+            try:
+                await asyncio.to_thread(self.apply_retention)
+            except Exception as e:
+                print(f"❌ Ошибка очистки оригиналов фото: {e}")
+            await asyncio.sleep(settings.PHOTO_RETENTION_INTERVAL)
+
+
+_derivatives: Optional[PhotoDerivatives] = None
+_derivatives_lock = threading.Lock()
+
+
+def get_photo_derivatives() -> PhotoDerivatives:
+    """Возвращает общий для процесса обработчик производных фото"""
+    global _derivatives
+    
+    with _derivatives_lock:
+        if _derivatives is None:
+            _derivatives = PhotoDerivatives()
+        return _derivatives
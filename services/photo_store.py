@@ -0,0 +1,341 @@
+"""
+Контентно-адресуемое хранилище фото инцидентов
+Файл хранится один раз под SHA-256 содержимого, индекс SQLite связывает инциденты с файлами
+"""
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config.settings import settings
+from utils.validators import detect_photo_format, validate_photo
+
+# Виды фото инцидента
+KIND_INCIDENT = 'incident'
+KIND_SOLUTION = 'solution'
+
+# Сколько первых байт нужно для определения формата
+SNIFF_BYTES = 12
+
+
+class PhotoRejected(ValueError):
+    """Фото не прошло проверку размера или формата"""
+
+
+class PhotoStore:
+    """
+    Хранилище фото с дедупликацией
+    
+    Путь файла зависит только от содержимого: blobs/ab/cd/<sha256>.<ext>,
+    поэтому повторная загрузка того же фото не занимает места, а ссылка
+    в колонках K/L таблицы не меняется. Запись атомарная (временный файл
+    в tmp/ и os.replace), одинаковые фото от разных потоков не портят друг друга.
+    """
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.blobs_dir = os.path.join(root, 'blobs')
+        self.derived_dir = os.path.join(root, 'derived')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self._create_schema()
+    
+    def _create_schema(self):
+        """Создает таблицы индекса"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    extension TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS incident_photos (
+                    incident_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+                    description TEXT NOT NULL DEFAULT '',
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (incident_id, kind, sha256)
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_incident_photos_sha ON incident_photos(sha256)"
+            )
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS derivatives (
+                    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+                    variant TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, variant)
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(blobs)")}
+            if 'original_deleted_at' not in columns:
+                self._conn.execute("ALTER TABLE blobs ADD COLUMN original_deleted_at REAL")
+    
+    def blob_path(self, digest: str, file_extension: str) -> str:
+        """Стабильный путь файла по хешу: blobs/ab/cd/<sha256>.<ext>"""
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:4], f"{digest}.{file_extension}")
+    
+    def derivative_path(self, digest: str, variant: str, file_extension: str) -> str:
+        """Путь производного файла: derived/ab/cd/<sha256>.<variant>.<ext>"""
+        return os.path.join(self.derived_dir, digest[:2], digest[2:4], f"{digest}.{variant}.{file_extension}")
+    
+    @staticmethod
+    def digest_of(path: str) -> Optional[str]:
+        """SHA-256 из пути файла хранилища (None для фото вне хранилища)"""
+        digest = os.path.basename(path).split('.', 1)[0]
+        if len(digest) == 64 and all(c in '0123456789abcdef' for c in digest):
+            return digest
+        return None
+    
+    def resolve(self, path: str) -> str:
+        """
+        Путь, по которому фото можно прочитать сейчас
+        
+        Если оригинал удален политикой хранения, возвращает копию-доказательство,
+        поэтому ссылки в таблице остаются рабочими.
+        """
+        if os.path.exists(path):
+            return path
+        digest = self.digest_of(path)
+        if digest:
+            evidence = self.derivatives_for(digest).get('evidence')
+            if evidence and os.path.exists(evidence['path']):
+                return evidence['path']
+        return path
+    
+    def _commit(self, tmp_path: str, digest: str, file_extension: str, size: int) -> Tuple[str, bool]:
+        """
+        Переносит записанный временный файл на место по хешу
+        
+        Если такое содержимое уже есть, временный файл удаляется.
+        
+        Returns:
+            Tuple[путь к файлу, записан ли новый файл]
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT extension FROM blobs WHERE sha256 = ?", (digest,)
+            ).fetchone()
+        if row:
+            path = self.blob_path(digest, row[0])
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return path, False
+            file_extension = row[0]
+        
+        path = self.blob_path(digest, file_extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        
+        with self._lock, self._conn:
+            # Повторная загрузка после удаления оригинала восстанавливает его
+            self._conn.execute(
+                "INSERT INTO blobs (sha256, extension, size, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET created_at = excluded.created_at, original_deleted_at = NULL",
+                (digest, file_extension, size, time.time())
+            )
+        return path, True
+    
+    def _link(self, incident_id: str, kind: str, digest: str, description: str):
+        """Связывает файл с инцидентом в индексе"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO incident_photos (incident_id, kind, sha256, description, added_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (incident_id, kind, digest, description[:200], time.time())
+            )
+    
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    async def save_stream(self, chunks: AsyncIterator[bytes], incident_id: str, kind: str = KIND_INCIDENT,
+                          description: str = "") -> Tuple[str, str, int]:
+        """
+        Сохраняет фото из потока блоков, не собирая его в памяти
+        
+        Хеш и формат считаются по мере записи, размер и формат проверяются
+        validate_photo до окончания скачивания.
+        
+        Args:
+            chunks: Асинхронный поток блоков файла
+            incident_id: ID инцидента
+            kind: KIND_INCIDENT или KIND_SOLUTION
+            description: Описание проблемы или решения
+        
+        Returns:
+            Tuple[путь к файлу, расширение, размер в байтах]
+        
+        Raises:
+            PhotoRejected: Файл слишком большой или неподдерживаемого формата
+        """
+        digest = hashlib.sha256()
+        head = b''
+        file_extension = None
+        size = 0
+        
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        f = os.fdopen(fd, 'wb')
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                if file_extension is None:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                    if len(head) >= SNIFF_BYTES:
+                        file_extension = detect_photo_format(head)
+                
+                is_valid, error = validate_photo(file_extension or 'jpg', size)
+                if not is_valid:
+                    raise PhotoRejected(error)
+                await asyncio.to_thread(f.write, chunk)
+            
+            if file_extension is None:
+                file_extension = detect_photo_format(head)
+            if not size:
+                raise PhotoRejected("Пустой файл")
+            
+            await asyncio.to_thread(f.close)
+            path, created = await asyncio.to_thread(
+                self._commit, tmp_path, digest.hexdigest(), file_extension, size
+            )
+        except BaseException:
+            f.close()
+            self._remove_quietly(tmp_path)
+            raise
+        
+        await asyncio.to_thread(self._link, incident_id, kind, digest.hexdigest(), description)
+        self._log_saved(incident_id, path, created)
+        return path, file_extension, size
+    
+    @staticmethod
+    def _log_saved(incident_id: str, path: str, created: bool):
+        if created:
+            print(f"💾 Фото {incident_id} сохранено: {path}")
+        else:
+            print(f"♻️ Фото {incident_id} уже есть в хранилище: {path}")
+    
+    def record_derivatives(self, digest: str, derivatives: Dict[str, Dict]):
+        """Сохраняет пути и размеры производных файлов"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO derivatives (sha256, variant, path, width, height, size, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (digest, variant, info['path'], info['width'], info['height'], info['size'], time.time())
+                    for variant, info in derivatives.items()
+                ]
+            )
+    
+    def derivatives_for(self, digest: str) -> Dict[str, Dict]:
+        """Производные файлы содержимого: variant -> path, width, height, size"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT variant, path, width, height, size FROM derivatives WHERE sha256 = ?", (digest,)
+            ).fetchall()
+        return {
+            variant: {"path": path, "width": width, "height": height, "size": size}
+            for variant, path, width, height, size in rows
+        }
+    
+    def get_blob(self, digest: str) -> Optional[Dict]:
+        """Метаданные содержимого или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT extension, size, created_at, original_deleted_at FROM blobs WHERE sha256 = ?", (digest,)
+            ).fetchone()
+        if not row:
+            return None
+        extension, size, created_at, deleted_at = row
+        return {
+            "sha256": digest, "path": self.blob_path(digest, extension), "extension": extension,
+            "size": size, "created_at": created_at, "original_deleted_at": deleted_at
+        }
+    
+    def expired_originals(self, created_before: float, variant: str, limit: int = 500) -> List[Tuple[str, str]]:
+        """Оригиналы старше created_before, у которых уже есть производная variant"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT b.sha256, b.extension FROM blobs b "
+                "JOIN derivatives d ON d.sha256 = b.sha256 AND d.variant = ? "
+                "WHERE b.original_deleted_at IS NULL AND b.created_at < ? LIMIT ?",
+                (variant, created_before, limit)
+            ).fetchall()
+        return [(digest, self.blob_path(digest, extension)) for digest, extension in rows]
+    
+    def mark_original_deleted(self, digest: str):
+        """Отмечает, что оригинал удален и фото отдается из производной"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE blobs SET original_deleted_at = ? WHERE sha256 = ?", (time.time(), digest)
+            )
+    
+    def files_created_before(self, created_before: float) -> List[Dict]:
+        """
+        Файлы фото, сохраненных до created_before: оригинал и производные
+        
+        Returns:
+            Список path, variant, created_at, incidents [(incident_id, kind)]
+        """
+        with self._lock:
+            blobs = self._conn.execute(
+                "SELECT sha256, extension, created_at FROM blobs WHERE created_at < ?", (created_before,)
+            ).fetchall()
+            derivatives = self._conn.execute(
+                "SELECT d.sha256, d.variant, d.path FROM derivatives d "
+                "JOIN blobs b ON b.sha256 = d.sha256 WHERE b.created_at < ?", (created_before,)
+            ).fetchall()
+            links = self._conn.execute(
+                "SELECT p.sha256, p.incident_id, p.kind FROM incident_photos p "
+                "JOIN blobs b ON b.sha256 = p.sha256 WHERE b.created_at < ?", (created_before,)
+            ).fetchall()
+        
+        incidents: Dict[str, List[Tuple[str, str]]] = {}
+        for digest, incident_id, kind in links:
+            incidents.setdefault(digest, []).append((incident_id, kind))
+        created = {digest: created_at for digest, _, created_at in blobs}
+        
+        files = [
+            {"path": self.blob_path(digest, extension), "variant": "original",
+             "created_at": created_at, "incidents": incidents.get(digest, [])}
+            for digest, extension, created_at in blobs
+        ]
+        files.extend(
+            {"path": path, "variant": variant,
+             "created_at": created[digest], "incidents": incidents.get(digest, [])}
+            for digest, variant, path in derivatives
+        )
+        return files
+
+
+_store: Optional[PhotoStore] = None
+_store_lock = threading.Lock()
+
+
+def get_photo_store() -> PhotoStore:
+    """Возвращает общее для процесса хранилище фото"""
+    global _store
+    
+    with _store_lock:
+        if _store is None:
+            _store = PhotoStore(settings.PHOTO_STORE_DIR)
+        return _store
@@ -0,0 +1,74 @@
+"""
+Клиенты Redis с общими для процесса пулами соединений
+Все сервисы берут клиентов отсюда: соединения не создаются заново на каждый вызов
+"""
+import threading
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+from config.settings import settings
+
+_pool: Optional[redis.BlockingConnectionPool] = None
+_async_pool: Optional[aioredis.BlockingConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def _connection_kwargs() -> dict:
+    return {
+        "host": settings.REDIS_HOST,
+        "port": settings.REDIS_PORT,
+        "db": settings.REDIS_DB,
+        "password": settings.REDIS_PASSWORD,
+        "decode_responses": True,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "timeout": settings.REDIS_POOL_TIMEOUT
+    }
+
+
+def get_redis() -> redis.Redis:
+    """
+    Возвращает синхронный клиент поверх общего для процесса пула
+    
+    Для кода, который выполняется в потоках (outbox, индекс строк Sheets).
+    Подключение проверяется один раз, при создании пула.
+    """
+    global _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            pool = redis.BlockingConnectionPool(**_connection_kwargs())
+            try:
+                redis.Redis(connection_pool=pool).ping()
+                print("✅ Redis подключен успешно")
+            except Exception as e:
+                print(f"❌ Ошибка подключения к Redis: {e}")
+                pool.disconnect()
+                raise
+            _pool = pool
+        return redis.Redis(connection_pool=_pool)
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    Возвращает асинхронный клиент поверх общего для процесса пула
+    
+    Клиент легкий: соединения берутся из пула на время команды и
+    возвращаются обратно. Если все REDIS_MAX_CONNECTIONS заняты, команда
+    ждет освобождения до REDIS_POOL_TIMEOUT секунд.
+    """
+    global _async_pool
+    
+    with _pool_lock:
+        if _async_pool is None:
+            _async_pool = aioredis.BlockingConnectionPool(**_connection_kwargs())
+        return aioredis.Redis(connection_pool=_async_pool)
+
+
+async def close_async_redis():
+    """Закрывает соединения общего асинхронного пула (при остановке бота)"""
+    global _async_pool
+    
+    with _pool_lock:
+        pool, _async_pool = _async_pool, None
+    if pool is not None:
+        await pool.disconnect()
@@ -1,29 +1,32 @@
-import redis
 import json
+import time
+import asyncio
+import threading
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from config.settings import settings
+from services.redis_client import get_redis, get_async_redis
+from bot.constants import RedisKeys
+
+# Разрезы глобальной статистики: поле инцидента -> хеш roma_bot:global_stats:{поле}
+GLOBAL_STATS_DIMENSIONS = ('branch', 'department', 'priority')
+# Значение разреза для инцидентов без этого поля: сумма по разрезу всегда равна total_incidents
+GLOBAL_STATS_UNKNOWN = 'Не указан'
 
 class RedisMemory:
-    """Сервис для управления памятью диалогов через Redis"""
+    """
+    Сервис для управления памятью диалогов через Redis
+    
+    Методы памяти асинхронные и работают через общий пул redis.asyncio.
+    Синхронный redis_client (общий пул, подключение проверяется при первом
+    обращении) остается для кода, выполняемого в потоках.
+    """
     
     def __init__(self):
-        self.redis_client = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-            password=settings.REDIS_PASSWORD,
-            decode_responses=True
-        )
+        self.redis_client = get_redis()
+        self.async_client = get_async_redis()
         self.ttl_seconds = settings.MEMORY_TTL_DAYS * 24 * 60 * 60
-        
-        # Проверяем подключение
-        try:
-            self.redis_client.ping()
-            print("✅ Redis подключен успешно")
-        except Exception as e:
-            print(f"❌ Ошибка подключения к Redis: {e}")
-            raise
     
     def _get_user_key(self, user_id: int) -> str:
         """Генерирует ключ для пользователя"""
@@ -37,7 +40,7 @@ class RedisMemory:
         """Генерирует ключ для статистики пользователя"""
         return f"roma_bot:stats:{user_id}"
     
-    def add_message(self, user_id: int, role: str, content: str, metadata: Optional[Dict] = None):
+    async def add_message(self, user_id: int, role: str, content: str, metadata: Optional[Dict] = None):
         """
         Добавляет сообщение в историю
         
@@ -47,62 +50,88 @@ class RedisMemory:
             content: Текст сообщения
             metadata: Дополнительные данные
         """
+        await self.add_messages(user_id, [(role, content, metadata)])
+    
+    async def add_exchange(self, user_id: int, user_content: str, assistant_content: str,
+                     assistant_metadata: Optional[Dict] = None):
+        """Добавляет сообщение пользователя и ответ бота за один запрос к Redis"""
+        await self.add_messages(user_id, [
+            ("user", user_content, None),
+            ("assistant", assistant_content, assistant_metadata)
+        ])
+    
+    async def add_messages(self, user_id: int, messages: List[Tuple[str, str, Optional[Dict]]]):
+        """
+        Добавляет сообщения в историю одной транзакцией (MULTI/EXEC, один round trip)
+        
+        Args:
+            user_id: ID пользователя
+            messages: Список (role, content, metadata) в хронологическом порядке
+        """
         messages_key = self._get_messages_key(user_id)
         stats_key = self._get_stats_key(user_id)
+        user_key = self._get_user_key(user_id)
         
-        # Создаем сообщение
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        if metadata:
-            message["metadata"] = metadata
-            
-            # Обновляем статистику
-            if metadata.get("type") == "incident":
-                self.redis_client.hincrby(stats_key, "incidents_count", 1)
+        async with self.async_client.pipeline(transaction=True) as pipe:
+            encoded = []
+            for role, content, metadata in messages:
+                # Создаем сообщение
+                message = {
+                    "role": role,
+                    "content": content,
+                    "timestamp": datetime.now().isoformat()
+                }
                 
-                # Инкрементируем счетчики филиалов и отделов
-                if metadata.get("branch"):
-                    self.redis_client.hincrby(stats_key, f"branch:{metadata['branch']}", 1)
-                if metadata.get("department"):
-                    self.redis_client.hincrby(stats_key, f"dept:{metadata['department']}", 1)
-        
-        # Добавляем сообщение в список
-        self.redis_client.lpush(messages_key, json.dumps(message, ensure_ascii=False))
-        
-        # Обрезаем список до максимального размера
-        self.redis_client.ltrim(messages_key, 0, settings.MAX_MESSAGES_PER_USER - 1)
-        
-        # Обновляем TTL
-        self.redis_client.expire(messages_key, self.ttl_seconds)
-        self.redis_client.expire(stats_key, self.ttl_seconds)
-        
-        # Обновляем последнюю активность
-        user_key = self._get_user_key(user_id)
-        self.redis_client.hset(user_key, "last_activity", datetime.now().isoformat())
-        self.redis_client.expire(user_key, self.ttl_seconds)
+                if metadata:
+                    message["metadata"] = metadata
+                    
+                    # Обновляем статистику
+                    if metadata.get("type") == "incident":
+                        pipe.hincrby(stats_key, "incidents_count", 1)
+                        
+                        # Инкрементируем счетчики филиалов и отделов
+                        if metadata.get("branch"):
+                            pipe.hincrby(stats_key, f"branch:{metadata['branch']}", 1)
+                        if metadata.get("department"):
+                            pipe.hincrby(stats_key, f"dept:{metadata['department']}", 1)
+                
+                encoded.append(json.dumps(message, ensure_ascii=False))
+            
+            # Добавляем сообщения в список (последнее оказывается первым)
+            pipe.lpush(messages_key, *encoded)
+            
+            # Обрезаем список до максимального размера
+            pipe.ltrim(messages_key, 0, settings.MAX_MESSAGES_PER_USER - 1)
+            
+            # Обновляем TTL
+            pipe.expire(messages_key, self.ttl_seconds)
+            pipe.expire(stats_key, self.ttl_seconds)
+            
+            # Обновляем последнюю активность
+            pipe.hset(user_key, "last_activity", datetime.now().isoformat())
+            pipe.expire(user_key, self.ttl_seconds)
+            self._queue_activity(pipe, user_id)
+            
+            await pipe.execute()
     
-    def get_context(self, user_id: int, last_n: int = None) -> List[Dict]:
+    async def get_context(self, user_id: int, last_n: int = None) -> List[Dict]:
         """
         Получает контекст последних сообщений
         
         Args:
             user_id: ID пользователя
             last_n: Количество последних сообщений (по умолчанию из настроек)
-            
+        
         Returns:
             Список сообщений в хронологическом порядке
         """
         if last_n is None:
             last_n = settings.CONTEXT_MESSAGES
-            
+        
         messages_key = self._get_messages_key(user_id)
         
         # Получаем последние N сообщений (они хранятся в обратном порядке)
-        raw_messages = self.redis_client.lrange(messages_key, 0, last_n - 1)
+        raw_messages = await self.async_client.lrange(messages_key, 0, last_n - 1)
         
         # Парсим и разворачиваем в правильном порядке
         messages = []
@@ -111,17 +140,19 @@ class RedisMemory:
                 messages.append(json.loads(raw_msg))
             except:
                 continue
-                
+        
         return messages
     
-    def get_user_summary(self, user_id: int) -> Dict:
+    async def get_user_summary(self, user_id: int) -> Dict:
         """Получает сводку о пользователе"""
         user_key = self._get_user_key(user_id)
         stats_key = self._get_stats_key(user_id)
         
-        # Получаем основную информацию
-        user_info = self.redis_client.hgetall(user_key)
-        stats = self.redis_client.hgetall(stats_key)
+        # Получаем основную информацию и статистику за один round trip
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(user_key)
+            pipe.hgetall(stats_key)
+            user_info, stats = await pipe.execute()
         
         if not stats:
             return {
@@ -158,55 +189,228 @@ class RedisMemory:
             "user_info": user_info
         }
     
-    def update_user_info(self, user_id: int, info: Dict):
+    async def update_user_info(self, user_id: int, info: Dict):
         """Обновляет информацию о пользователе"""
         user_key = self._get_user_key(user_id)
         
-        for key, value in info.items():
-            self.redis_client.hset(user_key, key, value)
+        async with self.async_client.pipeline(transaction=True) as pipe:
+            if info:
+                pipe.hset(user_key, mapping=info)
+            pipe.expire(user_key, self.ttl_seconds)
+            await pipe.execute()
+    
+    def _get_daily_users_key(self, day: datetime) -> str:
+        """Ключ HyperLogLog уникальных пользователей за день"""
+        return RedisKeys.DAILY_USERS.format(date=day.strftime('%Y%m%d'))
+    
+    def _queue_activity(self, pipe, user_id: int):
+        """Добавляет в транзакцию отметку активности пользователя"""
+        daily_key = self._get_daily_users_key(datetime.now())
+        pipe.zadd(RedisKeys.ACTIVE_USERS, {str(user_id): time.time()})
+        pipe.pfadd(daily_key, str(user_id))
+        pipe.expire(daily_key, settings.ACTIVITY_DAILY_RETENTION_DAYS * 24 * 60 * 60)
+    
+    async def get_active_users_count(self, hours: int = 24) -> int:
+        """Получает количество активных пользователей за период (ZCOUNT по времени активности)"""
+        return await self.async_client.zcount(RedisKeys.ACTIVE_USERS, time.time() - hours * 60 * 60, '+inf')
+    
+    async def get_unique_users_series(self, days: int = 7, period_days: int = 1) -> List[Tuple[str, int]]:
+        """
+        Ряд уникальных пользователей по периодам (по дневным HyperLogLog)
+        
+        Args:
+            days: Сколько последних дней охватить
+            period_days: Длина периода: 1 - по дням, 7 - по неделям
         
-        self.redis_client.expire(user_key, self.ttl_seconds)
+        Returns:
+            Список (YYYY-MM-DD первого дня периода, уникальных пользователей),
+            от старых к новым. Погрешность HyperLogLog около 0.8%.
+        """
+        today = datetime.now()
+        day_list = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+        periods = [day_list[i:i + period_days] for i in range(0, len(day_list), period_days)]
+        
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            for period in periods:
+                # PFCOUNT по нескольким ключам считает уникальных в объединении
+                pipe.pfcount(*(self._get_daily_users_key(day) for day in period))
+            counts = await pipe.execute()
+        
+        return [(period[0].strftime('%Y-%m-%d'), count) for period, count in zip(periods, counts)]
+    
+    async def get_unique_users_count(self, days: int) -> int:
+        """Уникальных пользователей за последние days дней"""
+        series = await self.get_unique_users_series(days, period_days=days)
+        return series[0][1] if series else 0
     
-    def get_active_users_count(self, hours: int = 24) -> int:
-        """Получает количество активных пользователей за период"""
-        # Используем SCAN для подсчета активных пользователей
-        count = 0
-        cutoff_time = datetime.now() - timedelta(hours=hours)
+    async def trim_activity(self) -> int:
+        """Удаляет из sorted set активности записи старше ACTIVITY_WINDOW_DAYS"""
+        cutoff = time.time() - settings.ACTIVITY_WINDOW_DAYS * 24 * 60 * 60
+        return await self.async_client.zremrangebyscore(RedisKeys.ACTIVE_USERS, '-inf', cutoff)
+    
+    async def ensure_activity_index(self):
+        """
+        Заполняет sorted set активности из last_activity пользователей
         
-        for key in self.redis_client.scan_iter(match="roma_bot:user:*"):
-            last_activity = self.redis_client.hget(key, "last_activity")
+        Выполняется, пока sorted set пуст (первый запуск после перехода):
+        ZADD NX не перезаписывает отметки, уже поставленные новыми сообщениями.
+        """
+        if await self.async_client.exists(RedisKeys.ACTIVE_USERS):
+            return
+        
+        cutoff = time.time() - settings.ACTIVITY_WINDOW_DAYS * 24 * 60 * 60
+        activity = {}
+        async for key in self.async_client.scan_iter(match="roma_bot:user:*"):
+            last_activity = await self.async_client.hget(key, "last_activity")
             if last_activity:
-                activity_time = datetime.fromisoformat(last_activity)
-                if activity_time > cutoff_time:
-                    count += 1
+                timestamp = datetime.fromisoformat(last_activity).timestamp()
+                if timestamp > cutoff:
+                    activity[key.split(':')[-1]] = timestamp
+        
+        if activity:
+            await self.async_client.zadd(RedisKeys.ACTIVE_USERS, activity, nx=True)
+            print(f"👥 Активность перенесена в sorted set: {len(activity)} пользователей")
+    
+    async def run_activity_trimmer(self):
+        """Периодически удаляет старые записи активности"""
+        while True:
+            try:
+                removed = await self.trim_activity()
+                if removed:
+                    print(f"🧹 Удалено старых записей активности: {removed}")
+            except Exception as e:
+                print(f"❌ Ошибка очистки активности: {e}")
+            await asyncio.sleep(settings.ACTIVITY_TRIM_INTERVAL)
+    
+    def queue_incident_counters(self, pipe, incident: Dict):
+        """
+        Добавляет в транзакцию инкременты глобальных счетчиков по новому инциденту
+        
+        Args:
+            pipe: Открытый pipeline (MULTI), в котором сохраняется инцидент
+            incident: Данные инцидента (branch, department, priority)
+        """
+        pipe.hincrby(RedisKeys.GLOBAL_STATS, "total_incidents", 1)
+        for dimension in GLOBAL_STATS_DIMENSIONS:
+            pipe.hincrby(RedisKeys.GLOBAL_STATS_BY.format(dimension=dimension),
+                         incident.get(dimension) or GLOBAL_STATS_UNKNOWN, 1)
+    
+    async def ensure_global_stats(self):
+        """
+        Однократно переносит в глобальные счетчики статистику пользователей
         
-        return count
+        Счетчики ведутся с момента перехода на них; инциденты, учтенные до
+        этого только в roma_bot:stats:*, добавляются инкрементами. Отметка
+        migrated_at пишется в той же транзакции, что и инкременты, поэтому
+        прерванный перенос повторяется целиком при следующем запуске.
+        Одновременный перенос из нескольких процессов исключен отдельной
+        короткой блокировкой; остальные процессы ждут отметку.
+        
+        Статистика пользователей не хранит время инцидентов, поэтому
+        перенос выполняется при старте до приема обновлений (post_init), а
+        процессы, не дождавшиеся отметки, инцидентов не создают: иначе
+        инцидент попал бы и в счетчики, и в просканированную статистику.
+        
+        Приоритета в статистике пользователей нет: он берется из хешей
+        инцидентов, созданных до перехода (за время их жизни). Инциденты,
+        для которых значение разреза неизвестно, учитываются как
+        GLOBAL_STATS_UNKNOWN, чтобы каждый разрез в сумме давал total_incidents.
+        """
+        lock_token = uuid.uuid4().hex
+        while not await self.async_client.hexists(RedisKeys.GLOBAL_STATS, "migrated_at"):
+            if not await self.async_client.set(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK, lock_token, nx=True,
+                                               ex=settings.GLOBAL_STATS_MIGRATION_LOCK_TTL):
+                await asyncio.sleep(0.5)
+                continue
+            try:
+                if not await self.async_client.hexists(RedisKeys.GLOBAL_STATS, "migrated_at"):
+                    await self._migrate_global_stats()
+            finally:
+                if await self.async_client.get(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK) == lock_token:
+                    await self.async_client.delete(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK)
+            return
     
-    def get_global_stats(self) -> Dict:
-        """Получает глобальную статистику"""
+    async def _migrate_global_stats(self):
+        """Считает статистику до перехода и применяет ее вместе с отметкой migrated_at"""
+        started = time.time()
         total_incidents = 0
-        branch_stats = {}
-        dept_stats = {}
+        counters = {dimension: {} for dimension in GLOBAL_STATS_DIMENSIONS}
         
-        # Сканируем все статистики пользователей
-        for key in self.redis_client.scan_iter(match="roma_bot:stats:*"):
-            stats = self.redis_client.hgetall(key)
-            
-            # Суммируем инциденты
+        # Сканируем все статистики пользователей (один раз)
+        async for key in self.async_client.scan_iter(match="roma_bot:stats:*"):
+            stats = await self.async_client.hgetall(key)
             total_incidents += int(stats.get("incidents_count", 0))
             
-            # Суммируем по филиалам и отделам
             for stat_key, value in stats.items():
                 if stat_key.startswith("branch:"):
                     branch = stat_key.replace("branch:", "")
-                    branch_stats[branch] = branch_stats.get(branch, 0) + int(value)
+                    counters["branch"][branch] = counters["branch"].get(branch, 0) + int(value)
                 elif stat_key.startswith("dept:"):
                     dept = stat_key.replace("dept:", "")
-                    dept_stats[dept] = dept_stats.get(dept, 0) + int(value)
+                    counters["department"][dept] = counters["department"].get(dept, 0) + int(value)
+        
+        # Приоритеты инцидентов, созданных до перехода на счетчики
+        legacy_incidents = 0
+        async for key in self.async_client.scan_iter(match="roma_bot:incident:*", count=500):
+            priority, created_at = await self.async_client.hmget(key, "priority", "created_at")
+            try:
+                if created_at and datetime.fromisoformat(created_at).timestamp() >= started:
+                    continue
+            except ValueError:
+                pass
+            legacy_incidents += 1
+            priority = priority or GLOBAL_STATS_UNKNOWN
+            counters["priority"][priority] = counters["priority"].get(priority, 0) + 1
+        
+        # Остаток каждого разреза (истекшие инциденты, пустые поля) - в "Не указан"
+        total_incidents = max(total_incidents, legacy_incidents)
+        for values in counters.values():
+            missing = total_incidents - sum(values.values())
+            if missing > 0:
+                values[GLOBAL_STATS_UNKNOWN] = values.get(GLOBAL_STATS_UNKNOWN, 0) + missing
+        
+        async with self.async_client.pipeline(transaction=True) as pipe:
+            pipe.hincrby(RedisKeys.GLOBAL_STATS, "total_incidents", total_incidents)
+            for dimension, values in counters.items():
+                for name, count in values.items():
+                    pipe.hincrby(RedisKeys.GLOBAL_STATS_BY.format(dimension=dimension), name, count)
+            pipe.hset(RedisKeys.GLOBAL_STATS, "migrated_at", datetime.now().isoformat())
+            await pipe.execute()
+        
+        print(f"📊 Глобальная статистика перенесена: {total_incidents} инцидентов")
+    
+    async def get_global_stats(self) -> Dict:
+        """Получает глобальную статистику (чтение нескольких небольших хешей)"""
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            pipe.hget(RedisKeys.GLOBAL_STATS, "total_incidents")
+            for dimension in GLOBAL_STATS_DIMENSIONS:
+                pipe.hgetall(RedisKeys.GLOBAL_STATS_BY.format(dimension=dimension))
+            total_incidents, *breakdowns = await pipe.execute()
+        
+        branch_stats, dept_stats, priority_stats = (
+            dict(sorted(((name, int(count)) for name, count in values.items()),
+                        key=lambda x: x[1], reverse=True))
+            for values in breakdowns
+        )
         
         return {
-            "total_incidents": total_incidents,
-            "active_users_24h": self.get_active_users_count(24),
-            "branch_stats": dict(sorted(branch_stats.items(), key=lambda x: x[1], reverse=True)),
-            "department_stats": dict(sorted(dept_stats.items(), key=lambda x: x[1], reverse=True))
-        }
\ No newline at end of file
+            "total_incidents": int(total_incidents or 0),
+            "active_users_24h": await self.get_active_users_count(24),
+            "active_users_7d": await self.get_unique_users_count(7),
+            "branch_stats": branch_stats,
+            "department_stats": dept_stats,
+            "priority_stats": priority_stats
+        }
+
+_memory: Optional[RedisMemory] = None
+_memory_lock = threading.Lock()
+
+
+def get_redis_memory() -> RedisMemory:
+    """Возвращает общий для процесса сервис памяти"""
+    global _memory
+    
+    with _memory_lock:
+        if _memory is None:
+            _memory = RedisMemory()
+        return _memory
@@ -0,0 +1,318 @@
+"""
+Локальное зеркало таблицы инцидентов в SQLite
+Синхронизируется инкрементально и отдает чтения без обращения к Google Sheets
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+from config.settings import settings
+
+# Колонки таблицы A:L в порядке следования
+COLUMNS = [
+    'id', 'date', 'time', 'branch', 'department', 'short_description',
+    'priority', 'full_message', 'manager_report', 'status', 'photo', 'solution_photo'
+]
+LAST_COLUMN = chr(ord('A') + len(COLUMNS) - 1)
+
+
+class SheetMirror:
+    """Зеркало листов Google Sheets в локальной базе SQLite"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._last_sync: Dict[str, float] = {}
+        # Синхронизации одного листа идут по очереди; чтения их не ждут
+        self._sync_locks: Dict[str, threading.Lock] = {}
+        # Локальные записи, сделанные пока лист читается из таблицы (повторяются после замены)
+        self._journals: Dict[str, List[tuple]] = {}
+        self._create_schema()
+    
+    def _create_schema(self):
+        """Создает таблицы и индексы зеркала"""
+        columns = ",\n".join(f"{name} TEXT NOT NULL DEFAULT ''" for name in COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS incidents (
+                    sheet TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    {columns},
+                    PRIMARY KEY (sheet, row_number)
+                )
+            """)
+            for column in ('id', 'date', 'branch', 'department'):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_incidents_{column} ON incidents(sheet, {column})"
+                )
+            # По статусу отчеты не фильтруются
+            self._conn.execute("DROP INDEX IF EXISTS idx_incidents_status")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    sheet TEXT PRIMARY KEY,
+                    last_row INTEGER NOT NULL,
+                    full_synced_at REAL NOT NULL
+                )
+            """)
+    
+    @staticmethod
+    def _pad(values: List[str]) -> List[str]:
+        """Дополняет строку пустыми ячейками (Sheets API обрезает пустой хвост)"""
+        values = [str(v) for v in values[:len(COLUMNS)]]
+        return values + [''] * (len(COLUMNS) - len(values))
+    
+    def _get_state(self, sheet: str) -> Optional[tuple]:
+        """Возвращает (last_row, full_synced_at) для листа"""
+        return self._conn.execute(
+            "SELECT last_row, full_synced_at FROM sync_state WHERE sheet = ?", (sheet,)
+        ).fetchone()
+    
+    def _set_last_row(self, sheet: str, last_row: int, full_synced_at: Optional[float] = None):
+        """Сохраняет номер последней известной строки листа"""
+        state = self._get_state(sheet)
+        if full_synced_at is None:
+            full_synced_at = state[1] if state else 0.0
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (sheet, last_row, full_synced_at) VALUES (?, ?, ?)",
+            (sheet, last_row, full_synced_at)
+        )
+    
+    def _write_rows(self, sheet: str, first_row: int, rows: List[List[str]]):
+        """Записывает строки листа начиная с first_row (вызывается под self._lock)"""
+        placeholders = ", ".join("?" for _ in range(len(COLUMNS) + 2))
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO incidents (sheet, row_number, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+            [(sheet, first_row + i, *self._pad(row)) for i, row in enumerate(rows)]
+        )
+    
+    def _apply_row(self, sheet: str, row_number: int, values: List[str]):
+        """Записывает собственную строку и двигает хвост (вызывается под self._lock)"""
+        self._write_rows(sheet, row_number, [values])
+        state = self._get_state(sheet)
+        # Строка за пределами известного хвоста: промежуток досинхронизируем позже
+        if state and state[0] == row_number - 1:
+            self._set_last_row(sheet, row_number)
+    
+    def _apply_cell(self, sheet: str, row_number: int, index: int, value: str):
+        """Записывает значение ячейки (вызывается под self._lock)"""
+        self._conn.execute(
+            f"UPDATE incidents SET {COLUMNS[index]} = ? WHERE sheet = ? AND row_number = ?",
+            (value, sheet, row_number)
+        )
+    
+    def _replay_journal(self, sheet: str):
+        """Повторяет записи, сделанные во время чтения листа (вызывается под self._lock)"""
+        for kind, row_number, payload in self._journals.pop(sheet, []):
+            if kind == 'row':
+                self._apply_row(sheet, row_number, payload)
+            else:
+                self._apply_cell(sheet, row_number, *payload)
+    
+    def upsert_row(self, sheet: str, row_number: int, values: List[str]):
+        """
+        Записывает строку после собственной вставки в таблицу
+        
+        Args:
+            sheet: Имя листа
+            row_number: Номер строки в таблице
+            values: Значения колонок A:L
+        """
+        with self._lock, self._conn:
+            self._apply_row(sheet, row_number, values)
+            if sheet in self._journals:
+                self._journals[sheet].append(('row', row_number, values))
+    
+    def update_cell(self, sheet: str, row_number: int, column: str, value: str):
+        """Применяет обновление ячейки, отправленное в таблицу"""
+        index = ord(column.upper()) - ord('A')
+        if not 0 <= index < len(COLUMNS):
+            return
+        with self._lock, self._conn:
+            self._apply_cell(sheet, row_number, index, value)
+            if sheet in self._journals:
+                self._journals[sheet].append(('cell', row_number, (index, value)))
+    
+    @staticmethod
+    def _fingerprint(ids: List[str]) -> tuple:
+        """Количество строк и контрольная сумма колонки ID (пустой хвост не учитывается)"""
+        while ids and not ids[-1]:
+            ids = ids[:-1]
+        return len(ids), hashlib.sha1("\n".join(ids).encode('utf-8')).hexdigest()
+    
+    def sync(self, service, spreadsheet_id: str, sheet: str, force: bool = False,
+             before_full_sync: Optional[Callable] = None) -> bool:
+        """
+        Синхронизирует зеркало с листом
+        
+        Инкрементальная синхронизация - один batchGet: колонка ID известных
+        строк (количество строк и контрольная сумма сверяются с зеркалом -
+        удаления, вставки и перестановки строк обнаруживаются) и все строки
+        после них. При расхождении или раз в SHEET_MIRROR_FULL_SYNC_INTERVAL
+        лист перечитывается целиком.
+        
+        Сетевые запросы выполняются без self._lock: чтения из зеркала
+        не ждут Sheets API, блокировка берется только на запись в SQLite.
+        
+        Args:
+            service: Клиент Sheets API
+            spreadsheet_id: ID таблицы
+            sheet: Имя листа
+            force: Синхронизировать без учета интервала
+            before_full_sync: Вызывается перед полным перечитыванием (отправка отложенных записей)
+        
+        Returns:
+            True если лист был перечитан целиком (номера строк могли измениться)
+        """
+        now = time.time()
+        if not force and now - self._last_sync.get(sheet, 0.0) < settings.SHEET_MIRROR_SYNC_INTERVAL:
+            return False
+        
+        with self._lock:
+            sync_lock = self._sync_locks.setdefault(sheet, threading.Lock())
+        
+        with sync_lock:
+            # Пока ждали, лист мог синхронизировать другой поток
+            if not force and time.time() - self._last_sync.get(sheet, 0.0) < settings.SHEET_MIRROR_SYNC_INTERVAL:
+                return False
+            
+            with self._lock:
+                state = self._get_state(sheet)
+                if (not state or state[0] <= 1
+                        or now - state[1] > settings.SHEET_MIRROR_FULL_SYNC_INTERVAL):
+                    state = None
+                else:
+                    self._journals[sheet] = []
+            if state is None:
+                self._full_sync(service, spreadsheet_id, sheet, before_full_sync)
+                return True
+            
+            last_row = state[0]
+            try:
+                result = service.spreadsheets().values().batchGet(
+                    spreadsheetId=spreadsheet_id,
+                    ranges=[f"{sheet}!A2:A{last_row}", f"{sheet}!A{last_row + 1}:{LAST_COLUMN}"]
+                ).execute()
+            except Exception:
+                with self._lock:
+                    self._journals.pop(sheet, None)
+                raise
+            check_range, new_range = result.get('valueRanges', [{}, {}])
+            sheet_ids = [row[0] if row else '' for row in check_range.get('values', [])]
+            new_rows = new_range.get('values', [])
+            
+            with self._lock:
+                known_ids = [''] * (last_row - 1)
+                for row_number, incident_id in self._conn.execute(
+                    "SELECT row_number, id FROM incidents WHERE sheet = ? AND row_number BETWEEN 2 AND ?",
+                    (sheet, last_row)
+                ):
+                    known_ids[row_number - 2] = incident_id
+                changed = self._fingerprint(sheet_ids) != self._fingerprint(known_ids)
+                if changed:
+                    self._journals.pop(sheet, None)
+                else:
+                    with self._conn:
+                        if new_rows:
+                            self._write_rows(sheet, last_row + 1, new_rows)
+                        current = self._get_state(sheet)
+                        self._set_last_row(sheet, max(last_row + len(new_rows), current[0] if current else 0))
+                        self._replay_journal(sheet)
+                    self._last_sync[sheet] = now
+            
+            if changed:
+                print(f"🔄 Лист {sheet} изменился вне бота, полная синхронизация зеркала")
+                self._full_sync(service, spreadsheet_id, sheet, before_full_sync)
+                return True
+            
+            if new_rows:
+                print(f"🗄 Зеркало {sheet}: добавлено строк {len(new_rows)}")
+            return False
+    
+    def _full_sync(self, service, spreadsheet_id: str, sheet: str, before_full_sync: Optional[Callable]):
+        """Перечитывает лист целиком (вызывается под блокировкой синхронизации листа)"""
+        if before_full_sync:
+            before_full_sync()
+        
+        with self._lock:
+            self._journals[sheet] = []
+        try:
+            result = service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet}!A:{LAST_COLUMN}"
+            ).execute()
+        except Exception:
+            with self._lock:
+                self._journals.pop(sheet, None)
+            raise
+        rows = result.get('values', [])[1:]  # Пропускаем заголовок
+        
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM incidents WHERE sheet = ?", (sheet,))
+            self._write_rows(sheet, 2, rows)
+            self._set_last_row(sheet, len(rows) + 1, full_synced_at=now)
+            self._replay_journal(sheet)
+        self._last_sync[sheet] = now
+        
+        print(f"🗄 Зеркало {sheet}: полная синхронизация, {len(rows)} строк")
+    
+    def get_rows(self, sheet: str, columns: Optional[Sequence[str]] = None,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 branch: Optional[str] = None, department: Optional[str] = None) -> List[List[str]]:
+        """
+        Возвращает строки листа в формате values API (без заголовка)
+        
+        Args:
+            sheet: Имя листа
+            columns: Буквы колонок в нужном порядке (по умолчанию A:L)
+            date_from: Дата с (YYYY-MM-DD, включительно)
+            date_to: Дата по (YYYY-MM-DD, включительно)
+            branch: Только инциденты филиала
+            department: Только инциденты отдела
+        """
+        names = [COLUMNS[ord(c.upper()) - ord('A')] for c in columns] if columns else COLUMNS
+        conditions = ["sheet = ?"]
+        params: List[str] = [sheet]
+        for column, operator, value in (
+            ('date', '>=', date_from), ('date', '<=', date_to),
+            ('branch', '=', branch), ('department', '=', department)
+        ):
+            if value:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(names)} FROM incidents "
+                f"WHERE {' AND '.join(conditions)} ORDER BY row_number",
+                params
+            )
+            return [list(row) for row in cursor]
+    
+    def get_row_number(self, sheet: str, incident_id: str) -> Optional[int]:
+        """Возвращает номер строки инцидента"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT row_number FROM incidents WHERE sheet = ? AND id = ?", (sheet, incident_id)
+            ).fetchone()
+        return row[0] if row else None
+
+_mirror: Optional[SheetMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_sheet_mirror() -> SheetMirror:
+    """Возвращает общее для процесса зеркало таблицы"""
+    global _mirror
+    
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = SheetMirror(settings.SHEET_MIRROR_PATH)
+        return _mirror
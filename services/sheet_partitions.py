@@ -0,0 +1,226 @@
+"""
+Помесячное разбиение таблицы инцидентов на листы
+Индексный лист хранит соответствие префикса ID (#YYYYMM) листу месяца
+"""
+import re
+import time
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Callable, Dict, List, Optional
+from googleapiclient.errors import HttpError
+from config.settings import settings
+
+INDEX_HEADERS = ['Префикс ID', 'Лист', 'Создан']
+
+
+class SheetPartitions:
+    """
+    Маршрутизация инцидентов по листам месяцев
+    
+    Новый инцидент пишется в лист месяца из своего ID (лист и строка индекса
+    создаются при первой записи), чтение и поиск идут в лист, найденный по
+    префиксу ID в индексе. Инциденты, созданные до разбиения, остаются
+    на исходном листе SHEET_NAME.
+    
+    self._lock защищает только словарь листов: запросы к Sheets API идут
+    без него, а одинаковые запросы из разных потоков (перечитывание индекса,
+    создание листа месяца) объединяются в один через общий Future.
+    """
+    
+    def __init__(self, spreadsheet_id: str):
+        self.spreadsheet_id = spreadsheet_id
+        self.legacy_sheet = settings.SHEET_NAME
+        self.index_sheet = settings.SHEET_INDEX_NAME
+        self._lock = threading.Lock()
+        self._tabs: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._inflight: Dict[str, Future] = {}
+    
+    @staticmethod
+    def partition_key(incident_id: str) -> Optional[str]:
+        """Префикс месяца из ID вида #YYYYMMDD-NNN -> #YYYYMM"""
+        match = re.match(r'#(\d{6})\d{2}-', incident_id or '')
+        return f"#{match.group(1)}" if match else None
+    
+    @staticmethod
+    def tab_name(prefix: str) -> str:
+        """Имя листа месяца: #202510 -> incidents_2025_10"""
+        return f"{settings.SHEET_NAME}_{prefix[1:5]}_{prefix[5:7]}"
+    
+    def _single_flight(self, key: str, func: Callable):
+        """
+        Выполняет func один раз для всех потоков, запросивших key одновременно
+        
+        Первый поток выполняет запрос без self._lock, остальные ждут его результата.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        
+        if owner:
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return future.result()
+    
+    def _load_index(self, service, force: bool = False):
+        """Перечитывает индексный лист, если кэш устарел"""
+        with self._lock:
+            if not force and time.time() - self._loaded_at < settings.SHEET_PARTITION_INDEX_REFRESH:
+                return
+        self._single_flight('index', lambda: self._fetch_index(service))
+    
+    def _fetch_index(self, service):
+        """Читает индексный лист из таблицы"""
+        try:
+            result = service.spreadsheets().values().get(
+                spreadsheetId=self.spreadsheet_id,
+                range=f"{self.index_sheet}!A2:B"
+            ).execute()
+        except HttpError as error:
+            if error.resp.status != 400:
+                raise
+            # Индексного листа еще нет - первый запуск с разбиением
+            self._add_sheet(service, self.index_sheet, INDEX_HEADERS)
+            result = {}
+        
+        tabs = {row[0]: row[1] for row in result.get('values', []) if len(row) >= 2}
+        with self._lock:
+            self._tabs = tabs
+            self._loaded_at = time.time()
+    
+    def _add_sheet(self, service, title: str, headers: List[str]):
+        """Создает лист с заголовком, если его еще нет"""
+        try:
+            service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': [{'addSheet': {'properties': {
+                    'title': title,
+                    'gridProperties': {'frozenRowCount': 1}
+                }}}]}
+            ).execute()
+        except HttpError as error:
+            # Лист мог создать другой процесс
+            if 'already exists' not in str(error):
+                raise
+            return
+        
+        service.spreadsheets().values().update(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"{title}!A1",
+            valueInputOption='RAW',
+            body={'values': [headers]}
+        ).execute()
+        print(f"🗂 Создан лист {title}")
+    
+    def sheet_for_incident(self, service, incident_id: str) -> str:
+        """Лист, в котором лежит инцидент (для чтения и обновлений)"""
+        prefix = self.partition_key(incident_id)
+        if not settings.SHEET_PARTITION_BY_MONTH or not prefix:
+            return self.legacy_sheet
+        
+        self._load_index(service)
+        with self._lock:
+            stale = (prefix not in self._tabs and prefix >= datetime.now(ZoneInfo('Asia/Tashkent')).strftime('#%Y%m')
+                     and time.time() - self._loaded_at > 5)
+        if stale:
+            # Лист текущего месяца мог только что создать другой процесс;
+            # прошлые месяцы без листа - инциденты до разбиения, индекс не перечитываем
+            self._load_index(service, force=True)
+        with self._lock:
+            return self._tabs.get(prefix, self.legacy_sheet)
+    
+    def sheet_for_new_incident(self, service, incident_id: str) -> str:
+        """Лист для записи нового инцидента, создается при необходимости"""
+        prefix = self.partition_key(incident_id)
+        if not settings.SHEET_PARTITION_BY_MONTH or not prefix:
+            return self.legacy_sheet
+        
+        self._load_index(service)
+        with self._lock:
+            if prefix in self._tabs:
+                return self._tabs[prefix]
+        
+        self._load_index(service, force=True)
+        with self._lock:
+            if prefix in self._tabs:
+                return self._tabs[prefix]
+        
+        return self._single_flight(prefix, lambda: self._create_partition(service, prefix))
+    
+    def _create_partition(self, service, prefix: str) -> str:
+        """Создает лист месяца и строку индекса"""
+        with self._lock:
+            # Лист мог создать поток, закончивший раньше нас
+            if prefix in self._tabs:
+                return self._tabs[prefix]
+        
+        tab = self.tab_name(prefix)
+        self._add_sheet(service, tab, settings.SHEET_HEADERS)
+        service.spreadsheets().values().append(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"{self.index_sheet}!A:C",
+            valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            body={'values': [[prefix, tab, datetime.now(ZoneInfo('Asia/Tashkent')).isoformat(timespec='seconds')]]}
+        ).execute()
+        with self._lock:
+            self._tabs[prefix] = tab
+        print(f"🗂 Инциденты {prefix} теперь пишутся в лист {tab}")
+        return tab
+    
+    def all_sheets(self, service) -> List[str]:
+        """Исходный лист и все листы месяцев в хронологическом порядке"""
+        if not settings.SHEET_PARTITION_BY_MONTH:
+            return [self.legacy_sheet]
+        
+        self._load_index(service)
+        return self.known_sheets()
+    
+    def known_sheets(self) -> List[str]:
+        """Листы из последнего прочитанного индекса, без обращения к API"""
+        with self._lock:
+            return [self.legacy_sheet] + [self._tabs[prefix] for prefix in sorted(self._tabs)]
+    
+    def sheets_for_dates(self, service, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None) -> List[str]:
+        """
+        Листы, которые могут содержать инциденты за период
+        
+        Args:
+            date_from: Дата с (YYYY-MM-DD, включительно)
+            date_to: Дата по (YYYY-MM-DD, включительно)
+        """
+        if not settings.SHEET_PARTITION_BY_MONTH:
+            return [self.legacy_sheet]
+        
+        first = f"#{date_from[:4]}{date_from[5:7]}" if date_from else None
+        last = f"#{date_to[:4]}{date_to[5:7]}" if date_to else None
+        
+        self._load_index(service)
+        with self._lock:
+            tabs = [
+                self._tabs[prefix] for prefix in sorted(self._tabs)
+                if (not first or prefix >= first) and (not last or prefix <= last)
+            ]
+        return [self.legacy_sheet] + tabs
+
+
+_partitions: Dict[str, SheetPartitions] = {}
+_partitions_lock = threading.Lock()
+
+
+def get_sheet_partitions(spreadsheet_id: str) -> SheetPartitions:
+    """Возвращает общий для процесса маршрутизатор листов таблицы"""
+    with _partitions_lock:
+        if spreadsheet_id not in _partitions:
+            _partitions[spreadsheet_id] = SheetPartitions(spreadsheet_id)
+        return _partitions[spreadsheet_id]
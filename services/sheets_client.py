@@ -0,0 +1,128 @@
+"""
+Общий клиент Google Sheets API
+Одна авторизация и один discovery-документ на процесс, keep-alive соединение на поток
+"""
+import os
+import json
+import threading
+import httplib2
+import google_auth_httplib2
+from google.oauth2 import service_account
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from config.settings import settings
+from services.sheets_scheduler import get_sheets_scheduler
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+_lock = threading.Lock()
+_credentials = None
+_discovery_document = None
+_service = None
+
+
+def get_credentials() -> service_account.Credentials:
+    """
+    Возвращает единый объект credentials сервисного аккаунта
+    
+    Токен обновляется автоматически через AuthorizedHttp при истечении
+    """
+    global _credentials
+    
+    with _lock:
+        if _credentials is None:
+            if not os.path.exists(settings.GOOGLE_CREDENTIALS_FILE):
+                raise FileNotFoundError(f"Файл {settings.GOOGLE_CREDENTIALS_FILE} не найден")
+            
+            _credentials = service_account.Credentials.from_service_account_file(
+                settings.GOOGLE_CREDENTIALS_FILE,
+                scopes=SCOPES
+            )
+        return _credentials
+
+
+def get_discovery_document() -> dict:
+    """Загружает discovery-документ Sheets v4 из пакета один раз за процесс"""
+    global _discovery_document
+    
+    with _lock:
+        if _discovery_document is None:
+            document = get_static_doc('sheets', 'v4')
+            if document is None:
+                raise RuntimeError("Discovery-документ sheets v4 не найден в googleapiclient")
+            _discovery_document = json.loads(document)
+        return _discovery_document
+
+
+def create_authorized_http() -> httplib2.Http:
+    """Создает HTTP-транспорт с keep-alive, подписывающий запросы общими credentials"""
+    if settings.SHEETS_API_ENDPOINT:
+        # Локальный fake-сервер не проверяет авторизацию
+        return httplib2.Http(timeout=settings.SHEETS_HTTP_TIMEOUT)
+    return google_auth_httplib2.AuthorizedHttp(
+        get_credentials(),
+        http=httplib2.Http(timeout=settings.SHEETS_HTTP_TIMEOUT)
+    )
+
+
+class ThreadLocalHttp:
+    """
+    Транспорт, выдающий каждому потоку свое keep-alive соединение
+    
+    httplib2.Http не потокобезопасен, а запросы к Sheets выполняются
+    из пула потоков, поэтому один общий клиент работает поверх этого прокси.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+    
+    def _get_http(self) -> httplib2.Http:
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = create_authorized_http()
+            self._local.http = http
+        return http
+    
+    def request(self, *args, **kwargs):
+        """Выполняет запрос в пределах квоты, повторяя его после ответа 429"""
+        scheduler = get_sheets_scheduler()
+        for attempt in range(settings.SHEETS_THROTTLE_RETRIES + 1):
+            scheduler.acquire()
+            response, content = self._get_http().request(*args, **kwargs)
+            if response.status != 429:
+                scheduler.record_success()
+                return response, content
+            if attempt < settings.SHEETS_THROTTLE_RETRIES:
+                scheduler.record_throttled(response.get('retry-after'))
+        return response, content
+    
+    def __getattr__(self, name):
+        return getattr(self._get_http(), name)
+
+
+def get_sheets_service():
+    """
+    Возвращает общий для процесса клиент Sheets API
+    
+    Returns:
+        Resource googleapiclient, построенный один раз
+    """
+    global _service
+    
+    if _service is not None:
+        return _service
+    
+    document = get_discovery_document()
+    
+    with _lock:
+        if _service is None:
+            if settings.SHEETS_API_ENDPOINT:
+                _service = build_from_document(
+                    document, http=ThreadLocalHttp(),
+                    client_options={'api_endpoint': settings.SHEETS_API_ENDPOINT}
+                )
+                print(f"🧪 Клиент Google Sheets направлен на {settings.SHEETS_API_ENDPOINT}")
+            else:
+                _service = build_from_document(document, http=ThreadLocalHttp())
+                print("✅ Клиент Google Sheets инициализирован")
+        return _service
@@ -0,0 +1,185 @@
+"""
+Планировщик запросов к Google Sheets с учетом квоты
+Token bucket с приоритетными полосами и адаптивным замедлением при 429
+"""
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+from config.settings import settings
+
+
+class Lane:
+    """Приоритетные полосы запросов (меньше - важнее)"""
+    PUBLISH = 0     # Публикация нового инцидента
+    STATUS = 1      # Обновления статусов, поиск строк, служебные запросы
+    ANALYTICS = 2   # Чтения для отчетов
+    
+    NAMES = {PUBLISH: 'publish', STATUS: 'status', ANALYTICS: 'analytics'}
+
+
+_current = threading.local()
+
+
+def current_lane() -> int:
+    """Полоса запросов текущего потока (по умолчанию STATUS)"""
+    return getattr(_current, 'lane', Lane.STATUS)
+
+
+@contextmanager
+def sheets_lane(lane: int):
+    """Выполняет запросы к Sheets внутри блока в указанной полосе"""
+    previous = current_lane()
+    _current.lane = lane
+    try:
+        yield
+    finally:
+        _current.lane = previous
+
+
+class SheetsScheduler:
+    """
+    Token bucket для всех запросов к Sheets API
+    
+    Токены пополняются со скоростью SHEETS_QUOTA_PER_MINUTE, запас не больше
+    SHEETS_QUOTA_BURST. Освободившийся токен получает самая приоритетная
+    ожидающая полоса, поэтому отчеты не задерживают публикацию инцидентов.
+    На ответ 429 скорость уменьшается вдвое и все полосы ждут паузу
+    (Retry-After или экспоненциальная задержка), после успешных
+    запросов скорость плавно возвращается к квоте.
+    """
+    
+    def __init__(self, per_minute: float, burst: int):
+        self.max_rate = per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._cond = threading.Condition()
+        
+        lanes = list(Lane.NAMES)
+        self._waiting: Dict[int, int] = {lane: 0 for lane in lanes}
+        self._granted: Dict[int, int] = {lane: 0 for lane in lanes}
+        self._total_wait: Dict[int, float] = {lane: 0.0 for lane in lanes}
+        self._max_wait: Dict[int, float] = {lane: 0.0 for lane in lanes}
+        self._throttled = 0
+    
+    def _refill(self, now: float):
+        """Пополняет токены (вызывается под self._cond)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def _has_priority_waiters(self, lane: int) -> bool:
+        return any(count for other, count in self._waiting.items() if other < lane)
+    
+    def acquire(self, lane: Optional[int] = None):
+        """Блокирует поток до получения токена для запроса"""
+        lane = current_lane() if lane is None else lane
+        started_at = time.monotonic()
+        
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if (now >= self._paused_until and self.tokens >= 1
+                            and not self._has_priority_waiters(lane)):
+                        self.tokens -= 1
+                        break
+                    
+                    if now < self._paused_until:
+                        timeout = self._paused_until - now
+                    elif self.tokens < 1:
+                        timeout = (1 - self.tokens) / self.rate
+                    else:
+                        # Токен есть, но его ждет более важная полоса
+                        timeout = 0.05
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting[lane] -= 1
+                self._cond.notify_all()
+            
+            waited = time.monotonic() - started_at
+            self._granted[lane] += 1
+            self._total_wait[lane] += waited
+            self._max_wait[lane] = max(self._max_wait[lane], waited)
+        
+        if waited > 5:
+            print(f"⏳ Запрос Sheets ({Lane.NAMES[lane]}) ждал квоту {waited:.1f} с")
+    
+    def record_success(self):
+        """Аддитивно возвращает скорость к квоте после успешного запроса"""
+        with self._cond:
+            self._consecutive_throttles = 0
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+    
+    def record_throttled(self, retry_after: Optional[str] = None) -> float:
+        """
+        Обрабатывает ответ 429: снижает скорость и ставит все полосы на паузу
+        
+        Returns:
+            Длительность паузы в секундах
+        """
+        with self._cond:
+            self._throttled += 1
+            self._consecutive_throttles += 1
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            
+            try:
+                delay = float(retry_after) if retry_after else 0.0
+            except ValueError:
+                delay = 0.0
+            if not delay:
+                delay = min(settings.SHEETS_BACKOFF_MAX,
+                            settings.SHEETS_BACKOFF_BASE * 2 ** (self._consecutive_throttles - 1))
+                delay += random.uniform(0, delay / 4)
+            
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+        
+        print(f"🚦 Sheets API вернул 429: пауза {delay:.1f} с, скорость {self.rate * 60:.0f} запросов/мин")
+        return delay
+    
+    def stats(self) -> Dict:
+        """Метрики очередей по полосам и текущая скорость"""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "rate_per_minute": round(self.rate * 60, 1),
+                "tokens": round(self.tokens, 2),
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+                "throttled": self._throttled,
+                "lanes": {
+                    name: {
+                        "waiting": self._waiting[lane],
+                        "granted": self._granted[lane],
+                        "avg_wait_ms": round(self._total_wait[lane] / self._granted[lane] * 1000, 1)
+                        if self._granted[lane] else 0.0,
+                        "max_wait_ms": round(self._max_wait[lane] * 1000, 1)
+                    }
+                    for lane, name in Lane.NAMES.items()
+                }
+            }
+
+
+_scheduler: Optional[SheetsScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_sheets_scheduler() -> SheetsScheduler:
+    """Возвращает общий для процесса планировщик запросов к Sheets"""
+    global _scheduler
+    
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SheetsScheduler(settings.SHEETS_QUOTA_PER_MINUTE, settings.SHEETS_QUOTA_BURST)
+        return _scheduler
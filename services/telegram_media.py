@@ -0,0 +1,62 @@
+"""
+Потоковое скачивание файлов из Telegram
+Файл читается блоками, целиком в памяти не держится
+"""
+import os
+import asyncio
+import threading
+from typing import AsyncIterator, Optional
+import httpx
+from telegram import Bot
+from config.settings import settings
+
+_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+def get_download_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент для скачивания файлов (keep-alive к api.telegram.org)"""
+    global _client
+    
+    with _client_lock:
+        if _client is None:
+            _client = httpx.AsyncClient(timeout=settings.PHOTO_REQUEST_TIMEOUT)
+        return _client
+
+
+def _read_block(f, size: int) -> bytes:
+    return f.read(size)
+
+
+async def iter_telegram_file(bot: Bot, file_id: str, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Отдает содержимое файла Telegram блоками
+    
+    Args:
+        bot: Бот, от имени которого скачивается файл
+        file_id: Telegram file_id
+        chunk_size: Размер блока (по умолчанию PHOTO_DOWNLOAD_CHUNK_SIZE)
+    """
+    chunk_size = chunk_size or settings.PHOTO_DOWNLOAD_CHUNK_SIZE
+    file = await bot.get_file(file_id)
+    if not file.file_path:
+        raise OSError(f"Telegram не вернул путь к файлу {file_id}")
+    
+    if os.path.isabs(file.file_path) and os.path.exists(file.file_path):
+        # Локальный Bot API сервер отдает путь на диске
+        f = await asyncio.to_thread(open, file.file_path, 'rb')
+        try:
+            while chunk := await asyncio.to_thread(_read_block, f, chunk_size):
+                yield chunk
+        finally:
+            f.close()
+        return
+    
+    async with get_download_client().stream('GET', file.file_path) as response:
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            # Текст исключения httpx содержит URL с токеном бота - не передаем его дальше
+            raise OSError(f"Telegram вернул HTTP {response.status_code} при скачивании файла {file_id}") from None
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
@@ -1,84 +1,153 @@
-import os
-import re
+import io
+import asyncio
 import openai
+from pydub import AudioSegment
+from pydub.silence import detect_leading_silence, detect_nonsilent
 from config.settings import settings
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from bot.constants import Messages
+from utils.text_normalizer import text_normalizer
 
 
 class VoiceHandler:
     """Voice message handler following DRY principles - only transcribes and delegates"""
     
     def __init__(self):
+        if settings.VOICE_CHUNK_TARGET_S > settings.VOICE_SPLIT_THRESHOLD_S:
+            raise ValueError(
+                f"VOICE_CHUNK_TARGET_S ({settings.VOICE_CHUNK_TARGET_S}) must not exceed "
+                f"VOICE_SPLIT_THRESHOLD_S ({settings.VOICE_SPLIT_THRESHOLD_S})"
+            )
         self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        self._text_replacements = self._init_text_replacements()
-    
-    def _init_text_replacements(self) -> dict:
-        """Initialize text replacement mappings"""
-        return {
-            # Branch name corrections
-            "новза": "Novza",
-            "сергели": "Sergeli", 
-            "чилонзор": "Chilonzor",
-            "бодомзор": "Bodomzor",
-            "буюк ипак йули": "Buyul Ipak Yoli",
-            "максимка": "Buyul Ipak Yoli",
-            "максим горький": "Buyul Ipak Yoli",
-            
-            # Uzbek words
-            "тугади": "закончилось",
-            "бузилди": "сломалось", 
-            "ишламаяпти": "не работает",
-            "йук": "нет",
-            "керак": "нужно",
-        }
     
     async def process_voice_message(self, file_data: bytes, file_name: str) -> Tuple[bool, str]:
         """
         Processes voice message - ONLY transcribes and returns text
         Following DRY principle - no duplicate incident processing logic
         
+        Long notes are split at pauses and the chunks are transcribed
+        concurrently, then stitched back in their original order.
+        
         Args:
             file_data: Audio file bytes
             file_name: File name
-            
+        
         Returns:
             Tuple[success, transcribed_text_or_error_message]
         """
         try:
-            # Create temporary file
-            temp_path = f"temp_{file_name}"
-            with open(temp_path, 'wb') as f:
-                f.write(file_data)
+            # Decoding and re-encoding go through ffmpeg, keep it off the event loop
+            chunks = await asyncio.to_thread(self._prepare_audio, file_data)
+            if not chunks:
+                # Could not preprocess (e.g. no ffmpeg) - Whisper accepts OGG directly
+                chunks = [bytes(file_data)]
+            
+            base_name = file_name.rsplit('.', 1)[0]
+            semaphore = asyncio.Semaphore(settings.VOICE_MAX_PARALLEL_CHUNKS)
+            
+            async def transcribe_chunk(index: int, chunk: bytes) -> str:
+                async with semaphore:
+                    return await asyncio.to_thread(
+                        self._transcribe, chunk, f"{base_name}_{index}.ogg"
+                    )
             
-            # Whisper API accepts OGG directly
-            with open(temp_path, 'rb') as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    # Let Whisper auto-detect language
-                )
+            # gather keeps results in the order of the chunks
+            parts = await asyncio.gather(
+                *(transcribe_chunk(i, chunk) for i, chunk in enumerate(chunks))
+            )
             
-            # Clean up temporary file
-            os.remove(temp_path)
+            text = " ".join(part.strip() for part in parts if part and part.strip())
+            if not text:
+                return False, Messages.VOICE_ERROR
             
             # Post-process text
-            text = self._postprocess_text(transcript.text)
+            text = self._postprocess_text(text)
             
             return True, text
-            
+        
         except Exception as e:
             print(f"Voice processing error: {e}")
             return False, Messages.VOICE_ERROR
     
-    def _postprocess_text(self, text: str) -> str:
-        """Post-processes transcribed text with replacements"""
-        text_lower = text.lower()
+    def _transcribe(self, audio_data: bytes, file_name: str) -> str:
+        """Sends a single audio chunk to Whisper"""
+        transcript = self.client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(file_name, audio_data),
+            # Let Whisper auto-detect language
+        )
+        return transcript.text
+    
+    def _prepare_audio(self, file_data: bytes) -> List[bytes]:
+        """
+        Decodes OGG/Opus, trims silence, downmixes to mono speech format
+        and splits long notes at pauses
         
-        for old, new in self._text_replacements.items():
-            if old in text_lower:
-                # Replace with case preservation
-                pattern = re.compile(re.escape(old), re.IGNORECASE)
-                text = pattern.sub(new, text)
+        Returns:
+            List of encoded chunks in playback order, empty list on failure
+        """
+        try:
+            audio = AudioSegment.from_file(io.BytesIO(file_data), format="ogg")
+        except Exception as e:
+            print(f"Audio decoding error, sending original file: {e}")
+            return []
+        
+        audio = audio.set_channels(1).set_frame_rate(settings.VOICE_SAMPLE_RATE)
+        trimmed = self._trim_silence(audio)
+        if len(trimmed) > 0:
+            audio = trimmed
+        
+        if len(audio) <= settings.VOICE_SPLIT_THRESHOLD_S * 1000:
+            segments = [audio]
+        else:
+            segments = self._split_on_pauses(audio)
+        
+        return [self._export_segment(segment) for segment in segments]
+    
+    def _trim_silence(self, audio: AudioSegment) -> AudioSegment:
+        """Removes leading and trailing silence"""
+        keep = settings.VOICE_KEEP_SILENCE_MS
+        start = detect_leading_silence(audio, silence_threshold=settings.VOICE_SILENCE_THRESH_DB)
+        end = detect_leading_silence(audio.reverse(), silence_threshold=settings.VOICE_SILENCE_THRESH_DB)
+        return audio[max(start - keep, 0):max(len(audio) - end + keep, 0)]
+    
+    def _split_on_pauses(self, audio: AudioSegment) -> List[AudioSegment]:
+        """Splits audio into chunks of roughly the target duration, cutting only inside pauses"""
+        max_ms = settings.VOICE_CHUNK_TARGET_S * 1000
+        speech_ranges = detect_nonsilent(
+            audio,
+            min_silence_len=settings.VOICE_MIN_SILENCE_MS,
+            silence_thresh=settings.VOICE_SILENCE_THRESH_DB,
+            # The default 1 ms step scans every millisecond; pauses are >= 500 ms anyway
+            seek_step=10
+        )
+        if not speech_ranges:
+            return [audio]
+        
+        # Cut points are placed in the middle of the pause between speech ranges
+        cuts = [0]
+        chunk_start = 0
+        for (_, prev_end), (next_start, _) in zip(speech_ranges, speech_ranges[1:]):
+            if next_start - chunk_start > max_ms:
+                cut = (prev_end + next_start) // 2
+                if cut > chunk_start:
+                    cuts.append(cut)
+                    chunk_start = cut
+        cuts.append(len(audio))
         
-        return text
\ No newline at end of file
+        segments = []
+        for start, end in zip(cuts, cuts[1:]):
+            # A monologue without pauses is cut hard so no chunk grows unbounded
+            for offset in range(start, end, 2 * max_ms):
+                segments.append(audio[offset:min(offset + 2 * max_ms, end)])
+        return segments
+    
+    def _export_segment(self, segment: AudioSegment) -> bytes:
+        """Encodes a segment as low-bitrate Opus in OGG container"""
+        buffer = io.BytesIO()
+        segment.export(buffer, format="ogg", codec="libopus", bitrate="24k")
+        return buffer.getvalue()
+    
+    def _postprocess_text(self, text: str) -> str:
+        """Post-processes transcribed text with glossary replacements"""
+        return text_normalizer.normalize(text)
@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+import services.redis_client as redis_client
+from bot.constants import RedisKeys
+from services.redis_memory import GLOBAL_STATS_DIMENSIONS, GLOBAL_STATS_UNKNOWN, RedisMemory
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_client, '_pool',
+                        fakeredis.FakeRedis(server=server, decode_responses=True).connection_pool)
+    monkeypatch.setattr(redis_client, '_async_pool',
+                        fakeredis.aioredis.FakeRedis(server=server, decode_responses=True).connection_pool)
+    return RedisMemory()
+
+
+async def seed_legacy(client):
+    """Статистика пользователей и хеши инцидентов до перехода на глобальные счетчики"""
+    await client.hset('roma_bot:stats:1', mapping={
+        'incidents_count': 3, 'branch:Novza': 2, 'branch:Sergeli': 1, 'dept:IT': 3
+    })
+    # Один инцидент записан без филиала и отдела
+    await client.hset('roma_bot:stats:2', mapping={'incidents_count': 2, 'branch:Novza': 1, 'dept:HR': 1})
+
+    created_at = (datetime.now(ZoneInfo('Asia/Tashkent')) - timedelta(days=1)).isoformat()
+    for incident_id, priority in (('#1', 'Высокий'), ('#2', 'Средний'), ('#3', 'Высокий')):
+        await client.hset(f'roma_bot:incident:{incident_id}', mapping={
+            'id': incident_id, 'priority': priority, 'created_at': created_at
+        })
+
+
+async def create_incident(memory, incident):
+    async with memory.async_client.pipeline(transaction=True) as pipe:
+        memory.queue_incident_counters(pipe, incident)
+        await pipe.execute()
+
+
+async def breakdowns(memory):
+    client = memory.async_client
+    total = int(await client.hget(RedisKeys.GLOBAL_STATS, 'total_incidents'))
+    return total, {
+        dimension: {
+            name: int(count)
+            for name, count in (await client.hgetall(RedisKeys.GLOBAL_STATS_BY.format(dimension=dimension))).items()
+        }
+        for dimension in GLOBAL_STATS_DIMENSIONS
+    }
+
+
+def test_each_breakdown_sums_to_total(memory):
+    async def scenario():
+        await seed_legacy(memory.async_client)
+        await memory.ensure_global_stats()
+        await create_incident(memory, {'branch': 'Novza', 'department': 'IT', 'priority': 'Критический'})
+        await create_incident(memory, {'branch': 'Sergeli', 'department': 'HR'})
+        # Повторный перенос ничего не добавляет
+        await memory.ensure_global_stats()
+        return await breakdowns(memory)
+
+    total, by_dimension = asyncio.run(scenario())
+
+    assert total == 7
+    for dimension, values in by_dimension.items():
+        assert sum(values.values()) == total, dimension
+    assert by_dimension['priority'] == {
+        'Высокий': 2, 'Средний': 1, 'Критический': 1, GLOBAL_STATS_UNKNOWN: 3
+    }
+    assert by_dimension['branch'][GLOBAL_STATS_UNKNOWN] == 1
+
+
+def test_incidents_created_after_migration_are_not_backfilled(memory):
+    async def scenario():
+        # Инцидент сохранен (и уже учтен счетчиками), пока шел перенос
+        await create_incident(memory, {'branch': 'Novza', 'department': 'IT', 'priority': 'Низкий'})
+        await memory.async_client.hset('roma_bot:incident:#9', mapping={
+            'id': '#9', 'priority': 'Низкий',
+            'created_at': (datetime.now(ZoneInfo('Asia/Tashkent')) + timedelta(seconds=5)).isoformat()
+        })
+        await memory.ensure_global_stats()
+        return await breakdowns(memory)
+
+    total, by_dimension = asyncio.run(scenario())
+
+    assert total == 1
+    assert by_dimension['priority'] == {'Низкий': 1}
+
+
+def test_interrupted_migration_is_repeated_once(memory, monkeypatch):
+    async def scenario():
+        await seed_legacy(memory.async_client)
+        client = memory.async_client
+        hgetall = client.hgetall
+        calls = []
+
+        async def failing_hgetall(key):
+            calls.append(key)
+            if len(calls) == 2:
+                raise ConnectionError('redis went away')
+            return await hgetall(key)
+
+        monkeypatch.setattr(client, 'hgetall', failing_hgetall)
+        with pytest.raises(ConnectionError):
+            await memory.ensure_global_stats()
+        assert not await client.hexists(RedisKeys.GLOBAL_STATS, 'migrated_at')
+        assert not await client.exists(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK)
+
+        monkeypatch.setattr(client, 'hgetall', hgetall)
+        await memory.ensure_global_stats()
+        return await breakdowns(memory)
+
+    total, by_dimension = asyncio.run(scenario())
+
+    assert total == 5
+    assert by_dimension['branch'] == {'Novza': 3, 'Sergeli': 1, GLOBAL_STATS_UNKNOWN: 1}
+    assert by_dimension['department'] == {'IT': 3, 'HR': 1, GLOBAL_STATS_UNKNOWN: 1}
+
+
+def test_waiting_process_does_not_migrate_again(memory):
+    async def scenario():
+        client = memory.async_client
+        await seed_legacy(client)
+        # Другой процесс уже переносит статистику
+        await client.set(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK, 'other')
+        waiting = asyncio.create_task(memory.ensure_global_stats())
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+
+        await client.hset(RedisKeys.GLOBAL_STATS, mapping={'total_incidents': 0, 'migrated_at': 'now'})
+        await client.delete(RedisKeys.GLOBAL_STATS_MIGRATION_LOCK)
+        await asyncio.wait_for(waiting, timeout=5)
+        await create_incident(memory, {'branch': 'Novza', 'department': 'IT', 'priority': 'Низкий'})
+        return await breakdowns(memory)
+
+    total, by_dimension = asyncio.run(scenario())
+
+    assert total == 1
+    assert by_dimension['branch'] == {'Novza': 1}
+    assert by_dimension['department'] == {'IT': 1}
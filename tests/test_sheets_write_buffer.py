@@ -0,0 +1,88 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import services.google_sheets as google_sheets
+from services.google_sheets import SheetsWriteBuffer
+
+
+class FakeSheets:
+    """values().batchUpdate, отвечающий 400 на диапазоны удаленного листа"""
+
+    def __init__(self, status_for_bad=400):
+        self.status_for_bad = status_for_bad
+        self.written = {}
+        self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.body = body
+        return self
+
+    def execute(self):
+        self.calls += 1
+        data = self.body['data']
+        if any(item['range'].startswith('deleted_tab!') for item in data):
+            raise HttpError(httplib2.Response({'status': self.status_for_bad}),
+                            b'{"error": {"message": "Unable to parse range"}}')
+        for item in data:
+            self.written[item['range']] = item['values']
+        return {}
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    fake = FakeSheets()
+    monkeypatch.setattr(google_sheets, 'get_sheets_service', lambda: fake)
+    return fake
+
+
+def make_buffer():
+    buffer = SheetsWriteBuffer('spreadsheet')
+    # Фоновый поток не нужен: flush вызывается явно
+    buffer._ensure_worker = lambda: None
+    return buffer
+
+
+def test_bad_range_is_rejected_and_valid_range_written(sheets):
+    buffer = make_buffer()
+    buffer.queue('deleted_tab!J5', [['Решено']])
+    buffer.queue('incidents!J7', [['Решено']])
+
+    assert buffer.flush() is True
+    assert sheets.written == {'incidents!J7': [['Решено']]}
+    assert buffer.pending_count() == 0
+    assert [cell_range for cell_range, _, _ in buffer.rejected] == ['deleted_tab!J5']
+
+    # Следующие записи больше не блокируются
+    buffer.queue('incidents!J8', [['Просрочено']])
+    assert buffer.flush() is True
+    assert sheets.written['incidents!J8'] == [['Просрочено']]
+
+
+def test_bisection_keeps_all_valid_ranges(sheets):
+    buffer = make_buffer()
+    for row in range(1, 8):
+        buffer.queue(f'incidents!J{row}', [[str(row)]])
+    buffer.queue('deleted_tab!J1', [['x']])
+
+    assert buffer.flush() is True
+    assert len(sheets.written) == 7
+    assert len(buffer.rejected) == 1
+
+
+def test_transient_error_requeues_batch(monkeypatch):
+    fake = FakeSheets(status_for_bad=503)
+    monkeypatch.setattr(google_sheets, 'get_sheets_service', lambda: fake)
+    buffer = make_buffer()
+    buffer.queue('deleted_tab!J5', [['Решено']])
+    buffer.queue('incidents!J7', [['Решено']])
+
+    assert buffer.flush() is False
+    assert buffer.pending_count() == 2
+    assert not buffer.rejected
@@ -0,0 +1,80 @@
+"""
+Glossary-based text normalization for Roma Pizza Bot
+Rewrites branch names, Uzbek words and common ASR misrecognitions in a single pass
+"""
+import re
+from typing import Dict, Optional
+from config.settings import settings
+
+
+class TextNormalizer:
+    """Replacement engine compiled once from a glossary"""
+
+    def __init__(self, glossary: Dict[str, str]):
+        self._replacements = {self._normalize_key(k): v for k, v in glossary.items()}
+        self._proper_names = {v for v in self._replacements.values() if v != v.lower()}
+        self._pattern = self._compile(self._replacements)
+
+    @staticmethod
+    def _normalize_key(text: str) -> str:
+        """Lowercases and collapses whitespace so lookups match the pattern"""
+        return " ".join(text.lower().split())
+
+    @classmethod
+    def _compile(cls, replacements: Dict[str, str]) -> Optional[re.Pattern]:
+        """Builds one regex from a character trie of the glossary keys"""
+        if not replacements:
+            return None
+
+        trie: Dict = {}
+        for key in replacements:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        return re.compile(rf"(?<!\w){cls._trie_to_regex(trie)}(?!\w)", re.IGNORECASE)
+
+    @classmethod
+    def _trie_to_regex(cls, node: Dict) -> str:
+        """Shared prefixes are matched once instead of once per rule"""
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + cls._trie_to_regex(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        if "" in node:
+            # Greedy optional group: the longer phrase wins, the shorter one is the fallback
+            return f"(?:{'|'.join(branches)})?"
+        if len(branches) == 1:
+            return branches[0]
+        return f"(?:{'|'.join(branches)})"
+
+    def _replace(self, match: re.Match) -> str:
+        """Returns the replacement adapted to the case of the matched text"""
+        found = match.group(0)
+        key = found.lower()
+        replacement = self._replacements.get(key)
+        if replacement is None:
+            # Multi-word phrase matched with irregular whitespace
+            replacement = self._replacements.get(" ".join(key.split()), found)
+
+        # Proper names from the glossary are kept as written, so is lowercase input
+        if found == key or replacement in self._proper_names:
+            return replacement
+        if len(found) > 1 and found.isupper():
+            return replacement.upper()
+        if found[0].isupper():
+            return replacement[0].upper() + replacement[1:]
+        return replacement
+
+    def normalize(self, text: str) -> str:
+        """Applies all glossary replacements in a single pass over the text"""
+        if not text or self._pattern is None:
+            return text
+        return self._pattern.sub(self._replace, text)
+
+
+# Global normalizer instance
+text_normalizer = TextNormalizer(settings.TEXT_GLOSSARY)
@@ -39,6 +39,25 @@ def validate_photo(file_path: str, file_size: int) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"Ошибка валидации: {str(e)}"
 
+def detect_photo_format(head: bytes) -> str:
+    """
+    Определяет формат фото по сигнатуре
+    
+    Args:
+        head: Первые байты файла (достаточно 12)
+        
+    Returns:
+        str: Расширение файла (jpg, если формат не распознан)
+    """
+    from bot.constants import FileHandling
+    
+    for magic_bytes, extension in FileHandling.MAGIC_BYTES.items():
+        if head.startswith(magic_bytes):
+            if extension == 'webp' and b'WEBP' not in head[:12]:
+                continue
+            return extension
+    return 'jpg'  # По умолчанию JPEG
+
 def get_file_extension_from_mime(mime_type: str) -> str:
     """
     Получает расширение файла из MIME типа